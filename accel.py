@@ -0,0 +1,503 @@
+"""Optional JIT backend: legal move generation (GameState.get_valid_moves), pin/check
+detection and chess_ai.score_board as numba kernels over an int8 board array
+(GameState.board_codes). Each kernel covers a whole position, so a call crosses into
+compiled code once per position instead of once per piece.
+
+BACKEND is selected at startup:
+- "numba": numba can be imported -> kernels are compiled with numba.njit on first use
+- "python": numba is missing or CHESS_BACKEND=python -> the pure Python code is used
+`python bench.py backend` compares both.
+"""
+import importlib.util
+import os
+
+# ======================
+# GLOBAL VARIABLES
+# ======================
+DIRECTIONS = ((-1, 0), (0, -1), (1, 0), (0, 1), (-1, -1), (-1, 1), (1, -1), (1, 1))
+KNIGHT_MOVES = ((-2, -1), (-2, 1), (-1, -2), (-1, 2), (1, -2), (1, 2), (2, -1), (2, 1))
+KING_MOVES = ((-1, -1), (-1, 0), (-1, 1), (0, -1), (0, 1), (1, -1), (1, 0), (1, 1))
+# board codes (chess_engine.SQUARE_CODES): 0 empty, white p N B R Q K 1-6, black 7-12
+WHITE_PAWN, BLACK_PAWN = 1, 7
+PAWN, KNIGHT, BISHOP, ROOK, QUEEN, KING = range(6)  # code - pawn code of the color
+NORMAL, EN_PASSANT, CASTLE = 0, 1, 2  # move flags of generated moves
+MAX_MOVES = 256  # legal moves of a position (at most 218)
+# castle rights bits (GameState._get_castle_rights_index)
+WHITE_KING_SIDE, BLACK_KING_SIDE, WHITE_QUEEN_SIDE, BLACK_QUEEN_SIDE = 1, 2, 4, 8
+# compiled in this order -> kernels calling other kernels get their compiled version
+KERNELS = (
+    "is_attacked_in_array",
+    "is_on_check_line",
+    "add_move",
+    "find_pins_and_checks_in_array",
+    "generate_moves_in_array",
+    "score_board_array",
+)
+# ======================
+
+
+def select_backend():
+    """numba if it is installed (CHESS_BACKEND=python forces the pure Python code)"""
+    if os.environ.get("CHESS_BACKEND") == "python":
+        return "python"
+    return "numba" if importlib.util.find_spec("numba") is not None else "python"
+
+
+BACKEND = select_backend()
+
+# ======================
+# KERNEL STATE -> set by load_kernels() (numpy/numba are only imported if enabled)
+# ======================
+np = None
+kernels_loaded = False
+directions_array, knight_moves_array, king_moves_array = None, None, None
+pins_buffer, checks_buffer, moves_buffer = None, None, None
+# ======================
+
+
+def is_enabled():
+    """numba backend selected and importable -> kernels are loaded on first call"""
+    return BACKEND == "numba" and load_kernels()
+
+
+def load_kernels():
+    """compiles the kernels -> False (python backend from now on) if numba can't be
+    imported
+    """
+    global BACKEND, np, kernels_loaded, directions_array, knight_moves_array
+    global king_moves_array, pins_buffer, checks_buffer, moves_buffer
+    if kernels_loaded:
+        return True
+
+    try:
+        import numba
+        import numpy
+    except ImportError:
+        BACKEND = "python"
+        return False
+
+    np = numpy
+    module = globals()
+    for name in KERNELS:
+        module[name] = numba.njit(cache=True)(module[name])
+    directions_array = np.array(DIRECTIONS, np.int64)
+    knight_moves_array = np.array(KNIGHT_MOVES, np.int64)
+    king_moves_array = np.array(KING_MOVES, np.int64)
+    pins_buffer = np.zeros((8, 4), np.int64)  # (row, col, row_dir, col_dir) per pin
+    checks_buffer = np.zeros((16, 4), np.int64)
+    moves_buffer = np.zeros((MAX_MOVES, 3), np.int64)  # (start, end, flag) per move
+    kernels_loaded = True
+    return True
+
+
+def new_board_codes(codes):
+    """int8 board array (square = row * 8 + col) of 64 board codes"""
+    return np.array(codes, np.int8)
+
+
+def find_pins_and_checks(board_codes, king_location, white_to_move):
+    """(in_check, pins, checks) like GameState.check_for_pins_and_checks()"""
+    king_row, king_col = king_location
+    in_check, pin_count, check_count = find_pins_and_checks_in_array(
+        board_codes,
+        king_row * 8 + king_col,
+        white_to_move,
+        directions_array,
+        knight_moves_array,
+        pins_buffer,
+        checks_buffer,
+    )
+    pins = [tuple(pin) for pin in pins_buffer[:pin_count].tolist()]
+    checks = [tuple(check) for check in checks_buffer[:check_count].tolist()]
+    return bool(in_check), pins, checks
+
+
+def generate_moves(
+    board_codes, king_location, white_to_move, castle_rights, en_passant_square
+):
+    """legal moves in GameState.get_valid_moves() order
+    -> (in_check, pins, checks, [(start square, end square, flag)])
+
+    castle_rights: bits of GameState._get_castle_rights_index(), en_passant_square:
+    (row, col) or ()
+    """
+    king_row, king_col = king_location
+    en_passant = -1
+    if en_passant_square:
+        en_passant = en_passant_square[0] * 8 + en_passant_square[1]
+    in_check, pin_count, check_count, move_count = generate_moves_in_array(
+        board_codes,
+        king_row * 8 + king_col,
+        white_to_move,
+        castle_rights,
+        en_passant,
+        directions_array,
+        knight_moves_array,
+        king_moves_array,
+        pins_buffer,
+        checks_buffer,
+        moves_buffer,
+    )
+    pins = [tuple(pin) for pin in pins_buffer[:pin_count].tolist()]
+    checks = [tuple(check) for check in checks_buffer[:check_count].tolist()]
+    return bool(in_check), pins, checks, moves_buffer[:move_count].tolist()
+
+
+def build_score_tables(piece_scores, piece_position_scores, square_codes):
+    """(piece score per code, position score per code and square) of chess_ai tables"""
+    code_scores = np.zeros(len(square_codes), np.float64)
+    position_scores = np.zeros((len(square_codes), 64), np.float64)
+    for code, square in enumerate(square_codes):
+        if square == "--":
+            continue
+        piece_type = square[1]
+        code_scores[code] = piece_scores[piece_type]
+        if piece_type == "p":  # pawn tables are per color
+            position_scores[code] = np.ravel(piece_position_scores[square])
+        elif piece_type != "K":
+            position_scores[code] = np.ravel(piece_position_scores[piece_type])
+    return code_scores, position_scores
+
+
+def score_board(board_codes, score_tables):
+    return float(score_board_array(board_codes, *score_tables))
+
+
+# ==============================================================
+# kernels -> plain loops over integer arrays, compiled by numba
+# ==============================================================
+
+
+def is_attacked_in_array(codes, square, white, directions, knight_moves):
+    """square attacked by the side not to move -> the king of the side to move would be
+    in check there (own king doesn't block, as in find_pins_and_checks_in_array)
+    """
+    own_pawn = WHITE_PAWN if white else BLACK_PAWN
+    enemy_pawn = BLACK_PAWN if white else WHITE_PAWN
+    pawn_row_dir = -1 if white else 1  # enemy pawns attack from this side
+    start_row, start_col = square // 8, square % 8
+    for direction in range(8):
+        row_dir, col_dir = directions[direction, 0], directions[direction, 1]
+        for i in range(1, 8):
+            row, col = start_row + row_dir * i, start_col + col_dir * i
+            if row < 0 or row > 7 or col < 0 or col > 7:
+                break
+            code = codes[row * 8 + col]
+            if code == 0 or code == own_pawn + KING:
+                continue
+            if own_pawn <= code <= own_pawn + KING:
+                break
+
+            piece = code - enemy_pawn
+            if (
+                (piece == ROOK and direction < 4)
+                or (piece == BISHOP and direction >= 4)
+                or piece == QUEEN
+                or (i == 1 and piece == KING)
+                or (
+                    i == 1
+                    and piece == PAWN
+                    and direction >= 4
+                    and row_dir == pawn_row_dir
+                )
+            ):
+                return True
+            break
+
+    for knight_move in range(8):
+        row = start_row + knight_moves[knight_move, 0]
+        col = start_col + knight_moves[knight_move, 1]
+        if (
+            0 <= row <= 7
+            and 0 <= col <= 7
+            and codes[row * 8 + col] == enemy_pawn + KNIGHT
+        ):
+            return True
+    return False
+
+
+def is_on_check_line(square, king_square, checks):
+    """square between king and the (only) checking piece or the checking piece's square"""
+    check_square = checks[0, 0] * 8 + checks[0, 1]
+    for i in range(1, 8):
+        row = king_square // 8 + checks[0, 2] * i
+        col = king_square % 8 + checks[0, 3] * i
+        if row * 8 + col == square:
+            return True
+        if row * 8 + col == check_square:
+            return False
+    return False
+
+
+def add_move(moves, count, start, end, flag):
+    """writes move row count -> count of moves"""
+    moves[count, 0], moves[count, 1], moves[count, 2] = start, end, flag
+    return count + 1
+
+
+def find_pins_and_checks_in_array(
+    codes, king_square, white, directions, knight_moves, pins, checks
+):
+    """fills pins/checks rows -> (in_check, pin count, check count)
+
+    same scan as check_for_pins_and_checks: own king doesn't block (king moves place it
+    on other squares without moving it on the board)
+    """
+    own_pawn = WHITE_PAWN if white else BLACK_PAWN
+    enemy_pawn = BLACK_PAWN if white else WHITE_PAWN
+    pawn_row_dir = -1 if white else 1  # enemy pawns attack from this side
+    king_row, king_col = king_square // 8, king_square % 8
+    in_check, pin_count, check_count = False, 0, 0
+    for direction in range(8):
+        row_dir, col_dir = directions[direction, 0], directions[direction, 1]
+        pin_row, pin_col = -1, -1
+        for i in range(1, 8):
+            row, col = king_row + row_dir * i, king_col + col_dir * i
+            if row < 0 or row > 7 or col < 0 or col > 7:
+                break
+            code = codes[row * 8 + col]
+            if code == 0 or code == own_pawn + KING:
+                continue
+            if own_pawn <= code <= own_pawn + KING:
+                if pin_row >= 0:
+                    break  # two pieces in direction -> no pin
+                pin_row, pin_col = row, col
+                continue
+
+            piece = code - enemy_pawn
+            if (
+                (piece == ROOK and direction < 4)
+                or (piece == BISHOP and direction >= 4)
+                or piece == QUEEN
+                or (i == 1 and piece == KING)
+                or (
+                    i == 1
+                    and piece == PAWN
+                    and direction >= 4
+                    and row_dir == pawn_row_dir
+                )
+            ):
+                if pin_row < 0:
+                    in_check = True
+                    checks[check_count, 0], checks[check_count, 1] = row, col
+                    checks[check_count, 2], checks[check_count, 3] = row_dir, col_dir
+                    check_count += 1
+                else:
+                    pins[pin_count, 0], pins[pin_count, 1] = pin_row, pin_col
+                    pins[pin_count, 2], pins[pin_count, 3] = row_dir, col_dir
+                    pin_count += 1
+            break
+
+    for knight_move in range(8):
+        row_move, col_move = knight_moves[knight_move, 0], knight_moves[knight_move, 1]
+        row, col = king_row + row_move, king_col + col_move
+        if row < 0 or row > 7 or col < 0 or col > 7:
+            continue
+        if codes[row * 8 + col] == enemy_pawn + KNIGHT:
+            in_check = True
+            checks[check_count, 0], checks[check_count, 1] = row, col
+            checks[check_count, 2], checks[check_count, 3] = row_move, col_move
+            check_count += 1
+
+    return in_check, pin_count, check_count
+
+
+def generate_moves_in_array(
+    codes,
+    king_square,
+    white,
+    castle_rights,
+    en_passant,
+    directions,
+    knight_moves,
+    king_moves,
+    pins,
+    checks,
+    moves,
+):
+    """fills moves rows (start, end, flag) -> (in_check, pin count, check count, count)
+
+    same rules and order as GameState.get_valid_moves(): pieces by square, moves of a
+    piece in the order of its move method, castles last. In check, moves other than
+    king moves have to end on the check line (en passant: capture the checking pawn)
+    """
+    in_check, pin_count, check_count = find_pins_and_checks_in_array(
+        codes, king_square, white, directions, knight_moves, pins, checks
+    )
+    own_pawn = WHITE_PAWN if white else BLACK_PAWN
+    enemy_pawn = BLACK_PAWN if white else WHITE_PAWN
+    forward = -1 if white else 1
+    base_row = 6 if white else 1
+    king_row, king_col = king_square // 8, king_square % 8
+    count = 0
+    for square in range(64):
+        code = codes[square]
+        if code < own_pawn or code > own_pawn + KING:
+            continue
+        piece = code - own_pawn
+        if check_count > 1 and piece != KING:
+            continue  # double check -> king has to move
+        row, col = square // 8, square % 8
+        pinned, pin_row_dir, pin_col_dir = False, 0, 0
+        for pin in range(pin_count - 1, -1, -1):
+            if pins[pin, 0] == row and pins[pin, 1] == col:
+                pinned, pin_row_dir, pin_col_dir = True, pins[pin, 2], pins[pin, 3]
+                break
+        first = count
+
+        if piece == PAWN:
+            end_row = row + forward
+            if codes[end_row * 8 + col] == 0 and (
+                not pinned or (pin_col_dir == 0 and pin_row_dir != 0)
+            ):
+                count = add_move(moves, count, square, end_row * 8 + col, NORMAL)
+                if row == base_row and codes[(end_row + forward) * 8 + col] == 0:
+                    count = add_move(
+                        moves, count, square, (end_row + forward) * 8 + col, NORMAL
+                    )
+            for col_dir in (-1, 1):
+                end_col = col + col_dir
+                if end_col < 0 or end_col > 7:
+                    continue
+                if pinned and not (pin_row_dir == forward and pin_col_dir == col_dir):
+                    continue  # capture would leave the pin line
+                end_code = codes[end_row * 8 + end_col]
+                if enemy_pawn <= end_code <= enemy_pawn + KING:
+                    count = add_move(moves, count, square, end_row * 8 + end_col, NORMAL)
+                elif end_row * 8 + end_col == en_passant:
+                    # king beside both pawns -> rook/queen behind them gives check
+                    blocked, attacked = False, False
+                    if king_row == row:
+                        low, high = min(col, end_col), max(col, end_col)
+                        if king_col < low:
+                            inside_start, inside_end = king_col + 1, low
+                            outside_start, outside_end, outside_step = high + 1, 8, 1
+                        else:
+                            inside_start, inside_end = high + 1, king_col
+                            outside_start, outside_end, outside_step = low - 1, -1, -1
+                        for i in range(inside_start, inside_end):
+                            if codes[row * 8 + i] != 0:
+                                blocked = True
+                        for i in range(outside_start, outside_end, outside_step):
+                            behind = codes[row * 8 + i]
+                            if behind != 0:
+                                attacked = (
+                                    behind == enemy_pawn + ROOK
+                                    or behind == enemy_pawn + QUEEN
+                                )
+                                break
+                    if not attacked or blocked:
+                        count = add_move(
+                            moves, count, square, end_row * 8 + end_col, EN_PASSANT
+                        )
+
+        elif piece == KNIGHT:
+            if pinned:
+                continue
+            for knight_move in range(8):
+                end_row = row + knight_moves[knight_move, 0]
+                end_col = col + knight_moves[knight_move, 1]
+                if end_row < 0 or end_row > 7 or end_col < 0 or end_col > 7:
+                    continue
+                end_code = codes[end_row * 8 + end_col]
+                if not own_pawn <= end_code <= own_pawn + KING:
+                    count = add_move(moves, count, square, end_row * 8 + end_col, NORMAL)
+
+        elif piece == KING:
+            for king_move in range(8):
+                end_row = row + king_moves[king_move, 0]
+                end_col = col + king_moves[king_move, 1]
+                if end_row < 0 or end_row > 7 or end_col < 0 or end_col > 7:
+                    continue
+                end_code = codes[end_row * 8 + end_col]
+                if own_pawn <= end_code <= own_pawn + KING:
+                    continue
+                if not is_attacked_in_array(
+                    codes, end_row * 8 + end_col, white, directions, knight_moves
+                ):
+                    count = add_move(moves, count, square, end_row * 8 + end_col, NORMAL)
+            continue  # king moves are legal without blocking checks
+
+        else:  # sliders -> rook directions 0-3, bishop directions 4-7
+            first_direction = 4 if piece == BISHOP else 0
+            last_direction = 4 if piece == ROOK else 8
+            for direction in range(first_direction, last_direction):
+                row_dir, col_dir = directions[direction, 0], directions[direction, 1]
+                if pinned and not (
+                    (row_dir == pin_row_dir and col_dir == pin_col_dir)
+                    or (row_dir == -pin_row_dir and col_dir == -pin_col_dir)
+                ):
+                    continue  # piece has to stay on the pin line
+                for i in range(1, 8):
+                    end_row, end_col = row + row_dir * i, col + col_dir * i
+                    if end_row < 0 or end_row > 7 or end_col < 0 or end_col > 7:
+                        break
+                    end_code = codes[end_row * 8 + end_col]
+                    if own_pawn <= end_code <= own_pawn + KING:
+                        break
+                    count = add_move(moves, count, square, end_row * 8 + end_col, NORMAL)
+                    if end_code != 0:
+                        break  # capture
+
+        if check_count == 1:  # one check -> block it or capture the checking piece
+            kept = first
+            for i in range(first, count):
+                target = captured = moves[i, 1]
+                if moves[i, 2] == EN_PASSANT:  # captured pawn is beside the end square
+                    captured = moves[i, 0] // 8 * 8 + target % 8
+                if is_on_check_line(target, king_square, checks) or is_on_check_line(
+                    captured, king_square, checks
+                ):
+                    moves[kept, 0], moves[kept, 1] = moves[i, 0], moves[i, 1]
+                    moves[kept, 2] = moves[i, 2]
+                    kept += 1
+            count = kept
+
+    # castles -> rights, empty squares and no attacked square on the king's way
+    if not is_attacked_in_array(codes, king_square, white, directions, knight_moves):
+        king_side = WHITE_KING_SIDE if white else BLACK_KING_SIDE
+        queen_side = WHITE_QUEEN_SIDE if white else BLACK_QUEEN_SIDE
+        if (
+            castle_rights & king_side
+            and king_col + 2 <= 7
+            and codes[king_square + 1] == 0
+            and codes[king_square + 2] == 0
+            and not is_attacked_in_array(
+                codes, king_square + 1, white, directions, knight_moves
+            )
+            and not is_attacked_in_array(
+                codes, king_square + 2, white, directions, knight_moves
+            )
+        ):
+            count = add_move(moves, count, king_square, king_square + 2, CASTLE)
+        if (
+            castle_rights & queen_side
+            and king_col - 3 >= 0
+            and codes[king_square - 1] == 0
+            and codes[king_square - 2] == 0
+            and codes[king_square - 3] == 0
+            and not is_attacked_in_array(
+                codes, king_square - 1, white, directions, knight_moves
+            )
+            and not is_attacked_in_array(
+                codes, king_square - 2, white, directions, knight_moves
+            )
+        ):
+            count = add_move(moves, count, king_square, king_square - 2, CASTLE)
+
+    return in_check, pin_count, check_count, count
+
+
+def score_board_array(codes, code_scores, position_scores):
+    """material and position score of board codes, summed like chess_ai.score_board"""
+    score = 0.0
+    for square in range(64):
+        code = codes[square]
+        if code == 0:
+            continue
+        value = code_scores[code] + position_scores[code, square] * 0.1
+        if code < BLACK_PAWN:
+            score += value
+        else:
+            score -= value
+    return score
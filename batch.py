@@ -0,0 +1,330 @@
+"""Batched move generation in NumPy: attack maps, legal move counts and check/mate flags of
+N positions at once, for mobility features, position filtering and dataset checks.
+
+positions are arrays (see encode_positions()):
+    bitboards      (N, 12) uint64 -> one bitboard per piece in SQUARE_CODES order
+                   (wp wN wB wR wQ wK bp bN bB bR bQ bK), bit row * 8 + col of GameState.board
+    white_to_move  (N,) bool
+    castle_rights  (N, 4) bool -> white king side, white queen side, black king side,
+                   black queen side
+    en_passant     (N,) int64 -> en passant square (row * 8 + col) or -1
+moves are counted like GameState.get_valid_moves(): a promotion is one move (to a queen).
+Pieces are handled set-wise (every piece of a type moves one step per array operation), so
+the work per position doesn't depend on the number of pieces.
+"""
+import numpy as np
+
+import chess_engine
+from chess_engine import SQUARE_CODE_INDEX
+
+# ======================
+# GLOBAL VARIABLES
+# ======================
+BATCH_SIZE = 65536  # positions per chunk of analyze_positions() -> bounds temp arrays
+PAWN, KNIGHT, BISHOP, ROOK, QUEEN, KING = range(6)  # piece index within a color
+WHITE, BLACK = 0, 6  # first piece index of color in bitboards
+ZERO, ALL = np.uint64(0), np.uint64(0xFFFFFFFFFFFFFFFF)
+ROOK_DIRECTIONS = chess_engine.GameState.rook_directions
+BISHOP_DIRECTIONS = chess_engine.GameState.bishop_directions
+KNIGHT_MOVES = chess_engine.GameState.knight_moves
+KING_MOVES = chess_engine.GameState.king_moves
+# pin axis of a direction -> a pinned piece can only move along its pin axis
+AXES = {
+    (-1, 0): 0,
+    (1, 0): 0,
+    (0, -1): 1,
+    (0, 1): 1,
+    (-1, -1): 2,
+    (1, 1): 2,
+    (-1, 1): 3,
+    (1, -1): 3,
+}
+# ======================
+
+
+def _get_file_mask(cols):
+    return np.uint64(sum(1 << (row * 8 + col) for row in range(8) for col in cols))
+
+
+def _get_squares_mask(squares):
+    return np.uint64(sum(1 << square for square in squares))
+
+
+# squares a shift by col_dir can land on -> bits wrapped to the other side are masked off
+COL_MASKS = {
+    -2: ~_get_file_mask((6, 7)),
+    -1: ~_get_file_mask((7,)),
+    0: ALL,
+    1: ~_get_file_mask((0,)),
+    2: ~_get_file_mask((0, 1)),
+}
+ROW_MASKS = [_get_squares_mask(range(row * 8, row * 8 + 8)) for row in range(8)]
+# (squares that must be empty, squares that must not be attacked) of castles
+CASTLE_SQUARES = {
+    (True, "king side"): (_get_squares_mask((61, 62)), _get_squares_mask((60, 61, 62))),
+    (True, "queen side"): (
+        _get_squares_mask((57, 58, 59)),
+        _get_squares_mask((58, 59, 60)),
+    ),
+    (False, "king side"): (_get_squares_mask((5, 6)), _get_squares_mask((4, 5, 6))),
+    (False, "queen side"): (_get_squares_mask((1, 2, 3)), _get_squares_mask((2, 3, 4))),
+}
+POPCOUNTS = np.array([bin(byte).count("1") for byte in range(256)], np.int64)
+SQUARE_BITS = np.uint64(1) << np.arange(64, dtype=np.uint64)
+
+
+def encode_positions(game_states):
+    """position arrays of GameStates -> (bitboards, white_to_move, castle_rights, en_passant)"""
+    return _stack_positions([_encode_position(game_state) for game_state in game_states])
+
+
+def encode_fens(fens):
+    """position arrays of FEN strings (parsed by a single reused GameState)"""
+    game_state = chess_engine.GameState()
+    positions = []
+    for fen in fens:
+        game_state.load_fen(fen)
+        positions.append(_encode_position(game_state))
+    return _stack_positions(positions)
+
+
+def _encode_position(game_state):
+    codes = [SQUARE_CODE_INDEX[square] for row in game_state.board for square in row]
+    rights = game_state.current_castling_rights
+    en_passant = -1
+    if game_state.en_passant_possible_move:
+        en_passant = game_state.en_passant_possible_move[0] * 8
+        en_passant += game_state.en_passant_possible_move[1]
+    return (
+        codes,
+        game_state.white_to_move,
+        (
+            rights.white_king_side,
+            rights.white_queen_side,
+            rights.black_king_side,
+            rights.black_queen_side,
+        ),
+        en_passant,
+    )
+
+
+def _stack_positions(positions):
+    codes = np.array([position[0] for position in positions], np.int64).reshape(-1, 64)
+    bitboards = np.zeros((len(codes), 12), np.uint64)
+    for piece in range(12):
+        piece_squares = np.where(codes == piece + 1, SQUARE_BITS, ZERO)
+        bitboards[:, piece] = np.bitwise_or.reduce(piece_squares, axis=1)
+    white_to_move = np.array([position[1] for position in positions], bool)
+    castle_rights = np.array([position[2] for position in positions], bool).reshape(-1, 4)
+    en_passant = np.array([position[3] for position in positions], np.int64)
+    return bitboards, white_to_move, castle_rights, en_passant
+
+
+def popcount(bitboards):
+    """number of set bits of every uint64 -> int64 array of the same shape"""
+    bitboards = np.ascontiguousarray(bitboards, np.uint64)
+    counts = POPCOUNTS[bitboards.view(np.uint8)]
+    return counts.reshape(*bitboards.shape, 8).sum(axis=-1)
+
+
+def shift(bitboards, row_dir, col_dir):
+    """moves every set bit by (row_dir, col_dir), bits leaving the board are dropped"""
+    amount = row_dir * 8 + col_dir
+    if amount > 0:
+        shifted = bitboards << np.uint64(amount)
+    else:
+        shifted = bitboards >> np.uint64(-amount)
+    return shifted & COL_MASKS[col_dir]
+
+
+def slide(origins, empty, row_dir, col_dir):
+    """squares reached from origins in direction up to and including the first piece"""
+    attacks = np.zeros_like(origins)
+    front = origins
+    for _ in range(7):
+        front = shift(front, row_dir, col_dir)
+        attacks |= front
+        front = front & empty
+    return attacks
+
+
+def get_pawn_attacks(pawns, white_mask):
+    """white_mask -> ALL where pawns are white, ZERO where they are black"""
+    white_pawns, black_pawns = pawns & white_mask, pawns & ~white_mask
+    return (
+        shift(white_pawns, -1, -1)
+        | shift(white_pawns, -1, 1)
+        | shift(black_pawns, 1, -1)
+        | shift(black_pawns, 1, 1)
+    )
+
+
+def get_attacks(pieces, occupancy, white_mask):
+    """squares attacked by pieces ((N, 6) bitboards of one color per position)"""
+    attacks = get_pawn_attacks(pieces[:, PAWN], white_mask)
+    for row_move, col_move in KNIGHT_MOVES:
+        attacks |= shift(pieces[:, KNIGHT], row_move, col_move)
+    for row_move, col_move in KING_MOVES:
+        attacks |= shift(pieces[:, KING], row_move, col_move)
+    empty = ~occupancy
+    rooks = pieces[:, ROOK] | pieces[:, QUEEN]
+    bishops = pieces[:, BISHOP] | pieces[:, QUEEN]
+    for row_dir, col_dir in ROOK_DIRECTIONS:
+        attacks |= slide(rooks, empty, row_dir, col_dir)
+    for row_dir, col_dir in BISHOP_DIRECTIONS:
+        attacks |= slide(bishops, empty, row_dir, col_dir)
+    return attacks
+
+
+def get_attack_maps(bitboards):
+    """(N, 2) uint64 -> squares attacked by white and by black"""
+    bitboards = np.asarray(bitboards, np.uint64)
+    occupancy = np.bitwise_or.reduce(bitboards, axis=1)
+    white_mask = np.full(len(bitboards), ALL)
+    return np.stack(
+        (
+            get_attacks(bitboards[:, WHITE:BLACK], occupancy, white_mask),
+            get_attacks(bitboards[:, BLACK:], occupancy, ~white_mask),
+        ),
+        axis=1,
+    )
+
+
+def analyze_positions(bitboards, white_to_move, castle_rights, en_passant):
+    """(legal move counts, in check, checkmate, stalemate) arrays of N positions"""
+    results = [
+        _analyze_chunk(
+            np.asarray(bitboards[start : start + BATCH_SIZE], np.uint64),
+            np.asarray(white_to_move[start : start + BATCH_SIZE], bool),
+            np.asarray(castle_rights[start : start + BATCH_SIZE], bool),
+            np.asarray(en_passant[start : start + BATCH_SIZE], np.int64),
+        )
+        for start in range(0, len(bitboards), BATCH_SIZE)
+    ]
+    if not results:
+        empty_flags = np.zeros(0, bool)
+        return np.zeros(0, np.int64), empty_flags, empty_flags, empty_flags
+    move_counts, in_check = (np.concatenate(arrays) for arrays in zip(*results))
+    no_moves = move_counts == 0
+    return move_counts, in_check, no_moves & in_check, no_moves & ~in_check
+
+
+def _analyze_chunk(bitboards, white_to_move, castle_rights, en_passant):
+    """(legal move counts, in check) -> side to move is "us", the opponent "them" """
+    white_mask = np.where(white_to_move, ALL, ZERO)
+    us = np.where(white_to_move[:, None], bitboards[:, WHITE:BLACK], bitboards[:, BLACK:])
+    them = np.where(
+        white_to_move[:, None], bitboards[:, BLACK:], bitboards[:, WHITE:BLACK]
+    )
+    us_occupancy = np.bitwise_or.reduce(us, axis=1)
+    them_occupancy = np.bitwise_or.reduce(them, axis=1)
+    occupancy = us_occupancy | them_occupancy
+    empty = ~occupancy
+    king = us[:, KING]
+
+    # checkers, squares blocking or capturing a slider check, pinned pieces per axis
+    checkers = get_pawn_attacks(king, white_mask) & them[:, PAWN]
+    for row_move, col_move in KNIGHT_MOVES:
+        checkers |= shift(king, row_move, col_move) & them[:, KNIGHT]
+    check_rays = np.zeros_like(king)
+    pinned = [np.zeros_like(king) for _ in range(4)]
+    for directions, slider in ((ROOK_DIRECTIONS, ROOK), (BISHOP_DIRECTIONS, BISHOP)):
+        them_sliders = them[:, slider] | them[:, QUEEN]
+        for row_dir, col_dir in directions:
+            ray = slide(king, empty, row_dir, col_dir)
+            blocker = ray & occupancy
+            checker = blocker & them_sliders
+            checkers |= checker
+            check_rays |= np.where(checker != ZERO, ray, ZERO)
+            own_blocker = blocker & us_occupancy
+            pinner = (
+                slide(own_blocker, empty, row_dir, col_dir) & occupancy & them_sliders
+            )
+            pinned[AXES[row_dir, col_dir]] |= np.where(pinner != ZERO, own_blocker, ZERO)
+    any_pinned = pinned[0] | pinned[1] | pinned[2] | pinned[3]
+    checker_count = popcount(checkers)
+    in_check = checker_count > 0
+    # targets of non-king moves -> block or capture a single checker
+    check_mask = np.where(in_check, check_rays | checkers, ALL)
+    targets = ~us_occupancy & check_mask
+
+    move_counts = np.zeros(len(king), np.int64)
+    for row_move, col_move in KNIGHT_MOVES:
+        knights = us[:, KNIGHT] & ~any_pinned
+        move_counts += popcount(shift(knights, row_move, col_move) & targets)
+    for directions, slider in ((ROOK_DIRECTIONS, ROOK), (BISHOP_DIRECTIONS, BISHOP)):
+        sliders = us[:, slider] | us[:, QUEEN]
+        for row_dir, col_dir in directions:
+            front = sliders & (~any_pinned | pinned[AXES[row_dir, col_dir]])
+            for _ in range(7):
+                front = shift(front, row_dir, col_dir) & ~us_occupancy
+                move_counts += popcount(front & check_mask)
+                front = front & empty
+    move_counts += _count_pawn_moves(us, them, occupancy, white_mask, pinned, check_mask)
+    move_counts += _count_en_passant_moves(us, them, occupancy, white_mask, en_passant)
+    move_counts = np.where(checker_count > 1, 0, move_counts)  # only the king can move
+
+    # king moves -> the king must not block attacks on squares behind it
+    them_attacks = get_attacks(them, occupancy & ~king, ~white_mask)
+    king_targets = np.zeros_like(king)
+    for row_move, col_move in KING_MOVES:
+        king_targets |= shift(king, row_move, col_move)
+    move_counts += popcount(king_targets & ~us_occupancy & ~them_attacks)
+    move_counts += _count_castle_moves(
+        white_to_move, castle_rights, occupancy, them_attacks
+    )
+    return move_counts, in_check
+
+
+def _count_pawn_moves(us, them, occupancy, white_mask, pinned, check_mask):
+    move_counts = np.zeros(len(us), np.int64)
+    empty, any_pinned = ~occupancy, pinned[0] | pinned[1] | pinned[2] | pinned[3]
+    them_occupancy = np.bitwise_or.reduce(them, axis=1)
+    for side_mask, row_dir, start_row in ((white_mask, -1, 6), (~white_mask, 1, 1)):
+        pawns = us[:, PAWN] & side_mask
+        pushers = pawns & (~any_pinned | pinned[AXES[row_dir, 0]])
+        single_pushes = shift(pushers, row_dir, 0) & empty
+        double_pushes = shift(single_pushes & ROW_MASKS[start_row + row_dir], row_dir, 0)
+        move_counts += popcount(single_pushes & check_mask)
+        move_counts += popcount(double_pushes & empty & check_mask)
+        for col_dir in (-1, 1):
+            capturers = pawns & (~any_pinned | pinned[AXES[row_dir, col_dir]])
+            captures = shift(capturers, row_dir, col_dir) & them_occupancy & check_mask
+            move_counts += popcount(captures)
+    return move_counts
+
+
+def _count_en_passant_moves(us, them, occupancy, white_mask, en_passant):
+    """legal en passant captures -> checked by making them (pins along the rank, checks)"""
+    move_counts = np.zeros(len(us), np.int64)
+    if not np.any(en_passant >= 0):
+        return move_counts
+
+    target = np.where(en_passant >= 0, SQUARE_BITS[np.maximum(en_passant, 0)], ZERO)
+    for side_mask, row_dir in ((white_mask, -1), (~white_mask, 1)):
+        side_target = target & side_mask
+        captured = shift(side_target, -row_dir, 0) & them[:, PAWN]
+        for col_dir in (-1, 1):
+            capturer = shift(side_target, -row_dir, -col_dir) & us[:, PAWN]
+            capturer = np.where(captured != ZERO, capturer, ZERO)
+            occupancy_after = (occupancy & ~capturer & ~captured) | side_target
+            them_after = them.copy()
+            them_after[:, PAWN] &= ~captured
+            attacks = get_attacks(them_after, occupancy_after, ~white_mask)
+            legal = (capturer != ZERO) & ((attacks & us[:, KING]) == ZERO)
+            move_counts += legal
+    return move_counts
+
+
+def _count_castle_moves(white_to_move, castle_rights, occupancy, them_attacks):
+    move_counts = np.zeros(len(white_to_move), np.int64)
+    for color_index, white in ((0, True), (2, False)):
+        for side_index, side in ((0, "king side"), (1, "queen side")):
+            empty_squares, safe_squares = CASTLE_SQUARES[white, side]
+            move_counts += (
+                (white_to_move == white)
+                & castle_rights[:, color_index + side_index]
+                & ((occupancy & empty_squares) == ZERO)
+                & ((them_attacks & safe_squares) == ZERO)
+            )
+    return move_counts
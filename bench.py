@@ -0,0 +1,298 @@
+"""Benchmarks for engine and AI. Run `python bench.py <benchmark> --help` for options."""
+import argparse
+import os
+import random
+import subprocess
+import sys
+import time
+
+import accel
+import chess_ai as ai
+import chess_engine
+
+# ======================
+# GLOBAL VARIABLES
+# ======================
+BENCH_FENS = [
+    chess_engine.START_FEN,
+    "r1bqkb1r/pppp1ppp/2n2n2/4p3/2B1P3/5N2/PPPP1PPP/RNBQK2R w KQkq - 4 4",
+    "r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1",
+    "r2q1rk1/pp2bppp/2n1bn2/3p4/3P4/2NBPN2/PP3PPP/R1BQ1RK1 w - - 0 10",
+    "8/5pk1/6p1/8/3R4/6P1/5PK1/2r5 w - - 0 40",
+    "8/8/4k3/3p4/3P4/4K3/8/8 w - - 0 60",
+]
+SEARCH_TOGGLES = (
+    "NULL_MOVE_PRUNING",
+    "LATE_MOVE_REDUCTIONS",
+    "FUTILITY_PRUNING",
+    "PRINCIPAL_VARIATION_SEARCH",
+    "ASPIRATION_WINDOWS",
+)
+EVALUATIONS = ("none", "score_board", "nnue", "value_net")  # none -> make/undo only
+STARTUP_MODULES = (None, "chess_engine", "chess_ai", "uci", "main")  # None -> bare python
+HEAVY_MODULES = ("numpy", "pygame", "chess")  # must only load in code paths needing them
+# ======================
+
+
+def bench_search(depth, enabled_toggles):
+    """searches every bench position to fixed depth
+    -> returns (nodes, seconds, best moves, (eval cache, pawn hash) hit rates)
+    """
+    for toggle in SEARCH_TOGGLES:
+        setattr(ai, toggle, toggle in enabled_toggles)
+
+    total_nodes, total_time, best_moves = 0, 0.0, []
+    caches = (ai.get_eval_cache(), ai.get_pawn_cache())
+    hits, lookups = [0] * len(caches), [0] * len(caches)
+    for fen in BENCH_FENS:
+        ai.transposition_table.clear()
+        for cache in caches:
+            cache.clear()
+        game_state = chess_engine.GameState()
+        game_state.load_fen(fen)
+        limits = ai.SearchLimits(depth)
+        best_move, _, _ = ai.search(game_state, game_state.get_valid_moves(), limits)
+        total_nodes += ai.nodes
+        total_time += limits.elapsed()
+        best_moves.append(best_move.get_uci_notation() if best_move else "-")
+        for i, cache in enumerate(caches):
+            hits[i] += cache.hits
+            lookups[i] += cache.hits + cache.misses
+
+    hit_rates = tuple(hit / max(lookup, 1) for hit, lookup in zip(hits, lookups))
+    return total_nodes, total_time, best_moves, hit_rates
+
+
+def run_search_benchmark(args):
+    configurations = [("none", ())]
+    configurations += [(toggle.lower(), (toggle,)) for toggle in SEARCH_TOGGLES]
+    configurations.append(("all", SEARCH_TOGGLES))
+    print(f"depth {args.depth}, {len(BENCH_FENS)} positions")
+    for name, toggles in configurations:
+        nodes, seconds, best_moves, hit_rates = bench_search(args.depth, toggles)
+        print(
+            f"{name:<28} nodes {nodes:>8} time {seconds:7.2f}s "
+            f"nps {int(nodes / seconds):>6} hits eval {hit_rates[0]:4.0%} "
+            f"pawn {hit_rates[1]:4.0%}  "
+            f"{' '.join(best_moves)}"
+        )
+
+
+def bench_evaluation(evaluation, rounds):
+    """evaluates all children of every bench position -> returns (evaluations, seconds)"""
+    evaluations, seconds = 0, 0.0
+    for fen in BENCH_FENS:
+        game_state = chess_engine.GameState()
+        game_state.load_fen(fen)
+        valid_moves = game_state.get_valid_moves()
+        if evaluation == "nnue":
+            from nnue import Accumulator
+
+            Accumulator(ai.nnue_network).attach(game_state)
+
+        start = time.perf_counter()
+        for _ in range(rounds):
+            if evaluation == "value_net":  # batched like at frontier nodes of search
+                ai.evaluate_leaves(game_state, valid_moves)
+                continue
+
+            for move in valid_moves:
+                game_state.make_move(move)
+                if evaluation != "none":
+                    ai.evaluate(game_state)
+                game_state.undo_move()
+        seconds += time.perf_counter() - start
+        evaluations += rounds * (len(valid_moves) + (evaluation == "value_net"))
+
+    return evaluations, seconds
+
+
+def run_evaluation_benchmark(args):
+    ai.EVAL_CACHE = False  # rounds repeat the same positions -> would only measure hits
+    ai.use_nnue(args.nnue)
+    ai.use_value_net(args.value_net)
+    print(
+        f"{args.rounds} rounds, {len(BENCH_FENS)} positions, make/eval/undo of every move"
+    )
+    for evaluation in EVALUATIONS:
+        ai.EVALUATION = evaluation
+        evaluations, seconds = bench_evaluation(evaluation, args.rounds)
+        print(
+            f"{evaluation:<12} evaluations {evaluations:>7} time {seconds:6.2f}s "
+            f"evals/s {int(evaluations / seconds):>7}"
+        )
+    ai.use_score_board()
+
+
+def play_random_games(games, plies):
+    """random games from the bench positions -> returns a GameState of every ply"""
+    rng, game_states = random.Random(0), []
+    for game in range(games):
+        game_state = chess_engine.GameState()
+        game_state.load_fen(BENCH_FENS[game % len(BENCH_FENS)])
+        for _ in range(plies):
+            valid_moves = game_state.get_valid_moves()
+            if not valid_moves:
+                break
+            game_state.make_move(rng.choice(valid_moves))
+            game_states.append(game_state.copy())
+
+    return game_states
+
+
+def bench_batch(games, plies):
+    """legal move counts of random game positions one at a time and batched
+    -> returns (positions, loop seconds, batch seconds, counts agree)
+    """
+    import batch
+
+    game_states = play_random_games(games, plies)
+    start = time.perf_counter()
+    loop_counts = [len(game_state.get_valid_moves()) for game_state in game_states]
+    loop_seconds = time.perf_counter() - start
+    positions = batch.encode_positions(game_states)
+    start = time.perf_counter()
+    batch_counts = batch.analyze_positions(*positions)[0]
+    batch_seconds = time.perf_counter() - start
+    return (
+        len(game_states),
+        loop_seconds,
+        batch_seconds,
+        loop_counts == list(batch_counts),
+    )
+
+
+def run_batch_benchmark(args):
+    positions, loop_seconds, batch_seconds, agree = bench_batch(args.games, args.plies)
+    print(f"{positions} positions of {args.games} random games")
+    for name, seconds in (("get_valid_moves", loop_seconds), ("batch", batch_seconds)):
+        print(
+            f"{name:<16} time {seconds:6.2f}s positions/s {int(positions / seconds):>8}"
+        )
+    print(f"move counts {'agree' if agree else 'DIFFER'}")
+
+
+def bench_backend(backend, snapshots):
+    """get_valid_moves and score_pieces of every position with an accel backend
+    -> returns (move generation seconds, scoring seconds, move lists)
+    """
+    accel.BACKEND = backend  # GameStates restored below get board_codes if enabled
+    game_states = [chess_engine.GameState.restore(snapshot) for snapshot in snapshots]
+    start = time.perf_counter()
+    move_lists = [game_state.get_valid_moves() for game_state in game_states]
+    move_seconds = time.perf_counter() - start
+    start = time.perf_counter()
+    for game_state in game_states:
+        ai.score_pieces(game_state)
+    score_seconds = time.perf_counter() - start
+    move_lists = [[move.get_uci_notation() for move in moves] for moves in move_lists]
+    return move_seconds, score_seconds, move_lists
+
+
+def run_backend_benchmark(args):
+    snapshots = [
+        game_state.snapshot() for game_state in play_random_games(args.games, args.plies)
+    ]
+    print(f"{len(snapshots)} positions of {args.games} random games")
+    backends = ["python"]
+    if accel.BACKEND == "numba":  # selected at startup -> numba can be imported
+        backends.append("numba")
+    results = {}
+    for backend in backends:
+        move_seconds, score_seconds, move_lists = bench_backend(backend, snapshots)
+        results[backend] = move_seconds, score_seconds, move_lists
+        print(
+            f"{backend:<8} get_valid_moves/s {int(len(snapshots) / move_seconds):>7} "
+            f"score_pieces/s {int(len(snapshots) / score_seconds):>7}"
+        )
+
+    if "numba" not in results:
+        print("numba isn't installed (or CHESS_BACKEND=python) -> nothing to compare")
+        return
+
+    python_moves, python_scores, python_lists = results["python"]
+    numba_moves, numba_scores, numba_lists = results["numba"]
+    print(
+        f"numba speedup get_valid_moves {python_moves / numba_moves:.2f}x "
+        f"score_pieces {python_scores / numba_scores:.2f}x"
+    )
+    print(f"move lists {'agree' if python_lists == numba_lists else 'DIFFER'}")
+
+
+def bench_startup(module, runs):
+    """imports module in fresh interpreters -> returns (median seconds, heavy modules loaded)"""
+    code = "import sys"
+    if module is not None:
+        code += f", {module}"
+    code += f"; print(' '.join(m for m in {HEAVY_MODULES!r} if m in sys.modules))"
+    times, loaded = [], ""
+    for _ in range(runs):
+        start = time.perf_counter()
+        loaded = subprocess.run(
+            [sys.executable, "-c", code],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+        times.append(time.perf_counter() - start)
+
+    return sorted(times)[len(times) // 2], loaded
+
+
+def run_startup_benchmark(args):
+    print(f"{args.runs} fresh interpreters per module, median time")
+    for module in STARTUP_MODULES:
+        seconds, loaded = bench_startup(module, args.runs)
+        print(
+            f"{module or 'python':<14} {seconds * 1000:7.1f} ms  "
+            f"heavy modules: {loaded or '-'}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    benchmarks = parser.add_subparsers(dest="benchmark", required=True)
+    search_parser = benchmarks.add_parser(
+        "search", help="fixed depth search with each search toggle"
+    )
+    search_parser.add_argument("--depth", type=int, default=3)
+    search_parser.set_defaults(run=run_search_benchmark)
+    eval_parser = benchmarks.add_parser(
+        "eval", help="evaluations per second of each evaluation function"
+    )
+    eval_parser.add_argument("--rounds", type=int, default=20)
+    eval_parser.add_argument("--nnue", help="nnue weights file (default: untrained)")
+    eval_parser.add_argument(
+        "--value-net", help="value net weights file (default: untrained)"
+    )
+    eval_parser.set_defaults(run=run_evaluation_benchmark)
+    batch_parser = benchmarks.add_parser(
+        "batch", help="legal move counts per position vs batched (batch.py)"
+    )
+    batch_parser.add_argument("--games", type=int, default=100)
+    batch_parser.add_argument("--plies", type=int, default=100)
+    batch_parser.set_defaults(run=run_batch_benchmark)
+    backend_parser = benchmarks.add_parser(
+        "backend",
+        help="move generation and scoring of python vs numba backend (accel.py)",
+    )
+    backend_parser.add_argument("--games", type=int, default=20)
+    backend_parser.add_argument("--plies", type=int, default=100)
+    backend_parser.set_defaults(run=run_backend_benchmark)
+    startup_parser = benchmarks.add_parser("startup", help="import time of each module")
+    startup_parser.add_argument("--runs", type=int, default=10)
+    startup_parser.set_defaults(run=run_startup_benchmark)
+
+    args = parser.parse_args()
+    print(f"backend {accel.BACKEND}")
+    if accel.is_enabled():  # compile kernels before anything is timed
+        game_state = chess_engine.GameState()
+        game_state.get_valid_moves()
+        ai.score_board(game_state)
+    args.run(args)
+
+
+if __name__ == "__main__":
+
+    main()
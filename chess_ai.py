@@ -1,4 +1,9 @@
 import random
+import time
+from array import array
+
+import accel
+from chess_engine import SQUARE_CODES, MoveIndex
 
 # ======================
 # GLOBAL VARIABLES
@@ -79,12 +84,266 @@ PIECE_POSITION_SCORES = {
     "bp": BLACK_PAWN_SCORES,
     "wp": WHITE_PAWN_SCORES,
 }
+# pawn structure -> scored from the pawns only, cached in pawn_cache by pawn key
+DOUBLED_PAWN_PENALTY = 0.2  # per pawn behind another of its color on the file
+ISOLATED_PAWN_PENALTY = 0.15  # no pawn of its color on adjacent files
+BACKWARD_PAWN_PENALTY = 0.1  # adjacent pawns all ahead, stop square attacked by a pawn
+PASSED_PAWN_SCORES = (0, 0.1, 0.2, 0.35, 0.6, 1.0)  # per rows advanced (2nd-7th rank)
 CHECKMATE = 1000
 STALEMATE = 0
+DRAW = 0  # repetition and 50-move rule
 DEPTH = 3
+MAX_DEPTH = 64  # iterative deepening limit for "infinite" searches
+TT_SIZE = 2**20  # max transposition table entries before it is cleared
+TT_EXACT, TT_LOWER_BOUND, TT_UPPER_BOUND = 0, 1, 2
+SCORE_GRAIN = 0.01  # null window width -> only score differences above it are told apart
+
+# selective search toggles -> switch off to benchmark each technique
+NULL_MOVE_PRUNING = True
+LATE_MOVE_REDUCTIONS = True
+FUTILITY_PRUNING = True
+PRINCIPAL_VARIATION_SEARCH = True
+ASPIRATION_WINDOWS = True
+EVAL_CACHE = True  # score_board and value net results are cached in eval_cache
+EVAL_CACHE_SIZE = 2**18  # entries (16 bytes each) -> rounded down to a power of two
+PAWN_HASH = True  # pawn structure scores are cached in pawn_cache
+PAWN_HASH_SIZE = 2**14
+NULL_MOVE_R = 2  # depth reduction of null move search
+NULL_MOVE_VERIFICATION_MATERIAL = 5  # verify null move cutoffs up to a rook of material
+LMR_FULL_DEPTH_MOVES = 3  # moves searched to full depth before reducing
+LMR_MIN_DEPTH = 3
+FUTILITY_MARGINS = (0, 2, 5)  # per remaining depth -> only frontier nodes are pruned
+ASPIRATION_WINDOW = 0.5  # initial half width around previous iteration's score
+PROGRESS_INTERVAL = 0.25  # seconds between progress reports of a running search
+ENGINE_MODE = "alpha_beta"  # "mcts" -> mcts.search()
+EVALUATION = "score_board"  # "value_net" / "nnue" -> set by use_value_net() / use_nnue()
+VALUE_NET_SCALE = 10  # pawns per unit of value net output (-1 lost .. 1 won)
+
+# time management of clock games (seconds)
+MOVE_OVERHEAD = 0.05  # kept on the clock for lag between search and clock
+MIN_MOVETIME = 0.001
+EXPECTED_GAME_MOVES = 60  # remaining time is spread over the moves left until then
+MIN_MOVES_TO_GO = 20  # ... but over at least this many moves
+INCREMENT_SHARE = 0.8  # of the increment spent on each move
+MAX_OPTIMUM_SHARE = 0.2  # of remaining time for the planned move time
+HARD_LIMIT_FACTOR = 4  # hard limit -> multiple of the planned move time
+MAX_HARD_SHARE = 0.5  # of remaining time for the hard limit
+# next iteration time -> last one times growth of iteration times (branching factor)
+MIN_ITERATION_GROWTH, MAX_ITERATION_GROWTH = 2, 8
+BEST_MOVE_CHANGE_EXTENSION = 0.6  # soft limit extension per (decayed) best move change
+INSTABILITY_DECAY = 0.5  # per iteration
+SCORE_DROP = 0.3  # score loss between iterations in pawns that extends the soft limit
+SCORE_DROP_EXTENSION = 0.5
+# ======================
+
+# ======================
+# SEARCH STATE
+# ======================
+nodes = 0  # nodes visited by current search
+search_limits = None  # SearchLimits of current search, checked at every node
+pv_table = [[] for _ in range(MAX_DEPTH + 1)]  # principal variation per ply
+# move ids of the last two quiet moves per ply that caused a beta cutoff
+killer_moves = [[None, None] for _ in range(MAX_DEPTH + 1)]
+# zobrist_key -> (depth, score, flag, best_move); kept between searches of a process
+transposition_table = {}
+value_network = None  # value_net.ValueNet, loaded by use_value_net()
+nnue_network = None  # nnue.NnueNetwork, loaded by use_nnue()
+leaf_evaluations = {}  # zobrist_key -> evaluation, batch evaluated at frontier nodes
+score_tables = None  # score_board tables of the accel kernel, built on first use
+eval_cache = None  # EvalCache of score_board, created on first use
+pawn_cache = None  # pawn hash table (EvalCache of score_pawn_structure)
 # ======================
 
 
+class SearchLimits:
+    """depth/time limits and stop signal of a search"""
+
+    def __init__(
+        self,
+        depth=DEPTH,
+        movetime=None,
+        stop_event=None,
+        ponder_event=None,
+        progress_callback=None,
+        time_manager=None,
+    ):
+        self.depth = depth
+        self.movetime = movetime  # seconds -> hard time limit
+        # TimeManager of a clock game -> decides whether to start another iteration
+        self.time_manager = time_manager
+        self.stop_event = stop_event  # threading/multiprocessing Event
+        # while pondering depth/time limits are ignored until ponder_event is set (ponder hit)
+        self.ponder_event = ponder_event
+        # called every PROGRESS_INTERVAL seconds while searching
+        self.progress_callback = progress_callback
+        self.start_time = time.perf_counter()
+        self.next_progress_time = self.start_time + PROGRESS_INTERVAL
+        self.completed_depth = 0
+        self.stopped = False
+
+    def elapsed(self):
+        return time.perf_counter() - self.start_time
+
+    def is_pondering(self):
+        return self.ponder_event is not None and not self.ponder_event.is_set()
+
+    def should_stop(self):
+        """cheap enough to be called at every node"""
+        if self.stopped or (self.stop_event is not None and self.stop_event.is_set()):
+            self.stopped = True
+        elif self.ponder_event is not None:
+            if self.ponder_event.is_set():  # ponder hit -> limits apply from now on
+                now = time.perf_counter()
+                if self.time_manager is not None:
+                    self.time_manager.on_ponder_hit(now - self.start_time)
+                self.ponder_event, self.start_time = None, now
+                self.stopped = self.completed_depth >= self.depth
+        elif self.movetime is not None and self.elapsed() >= self.movetime:
+            self.stopped = True
+
+        if self.progress_callback is not None:
+            now = time.perf_counter()
+            if now >= self.next_progress_time:
+                self.next_progress_time = now + PROGRESS_INTERVAL
+                self.progress_callback()
+
+        return self.stopped
+
+
+class EvalCache:
+    """fixed size score cache (evaluation, pawn structure), separate from the TT
+
+    a key is stored in slot key % size, a colliding key overwrites it. Slots are two flat
+    arrays, so memory doesn't grow during a search (a zobrist key of 0 reads as stored)
+    """
+
+    def __init__(self, size=EVAL_CACHE_SIZE):
+        self.mask = (1 << (max(size, 1).bit_length() - 1)) - 1
+        self.keys = array("Q", bytes(8 * (self.mask + 1)))
+        self.scores = array("d", bytes(8 * (self.mask + 1)))
+        self.hits = self.misses = 0
+
+    def get(self, key):
+        """cached score of position key or None"""
+        index = key & self.mask
+        if self.keys[index] == key:
+            self.hits += 1
+            return self.scores[index]
+        self.misses += 1
+        return None
+
+    def store(self, key, score):
+        index = key & self.mask
+        self.keys[index], self.scores[index] = key, score
+
+    def clear(self):
+        self.keys = array("Q", bytes(8 * (self.mask + 1)))
+        self.scores = array("d", bytes(8 * (self.mask + 1)))  # key 0 reads slot 0
+        self.hits = self.misses = 0
+
+    def get_hit_rate(self):
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+
+class TimeManager:
+    """time budget of one move of a clock game (time left, increment per move)
+
+    the planned move time spreads the clock over the moves expected until the game (or
+    moves_to_go, the next time control) ends. No iteration is started that isn't
+    expected to finish before the soft limit, which is stretched while the best move
+    changes or the score drops. The hard limit is the movetime checked at every node and
+    always leaves time on the clock
+    """
+
+    def __init__(self, time_left, increment=0, moves_played=0, moves_to_go=None):
+        usable_time = max(time_left - MOVE_OVERHEAD, MIN_MOVETIME)
+        if moves_to_go is None:
+            moves_to_go = max(EXPECTED_GAME_MOVES - moves_played, MIN_MOVES_TO_GO)
+        self.optimum = min(
+            usable_time / max(moves_to_go, 1) + increment * INCREMENT_SHARE,
+            usable_time * MAX_OPTIMUM_SHARE,
+        )
+        self.hard_limit = min(
+            self.optimum * HARD_LIMIT_FACTOR, usable_time * MAX_HARD_SHARE
+        )
+        self.soft_limit = self.optimum
+        self.best_move, self.score, self.instability = None, None, 0.0
+        self.last_elapsed, self.iteration_time, self.growth = (
+            0.0,
+            0.0,
+            MIN_ITERATION_GROWTH,
+        )
+
+    def get_limits(self, **kwargs):
+        """SearchLimits of a search of this move"""
+        return SearchLimits(
+            MAX_DEPTH, movetime=self.hard_limit, time_manager=self, **kwargs
+        )
+
+    def on_iteration(self, best_move, score, elapsed):
+        """result of a finished iteration -> adjusts soft limit to search instability"""
+        iteration_time = elapsed - self.last_elapsed
+        if self.iteration_time > 0:
+            self.growth = min(
+                max(iteration_time / self.iteration_time, MIN_ITERATION_GROWTH),
+                MAX_ITERATION_GROWTH,
+            )
+        self.last_elapsed, self.iteration_time = elapsed, iteration_time
+        self.update_soft_limit(best_move, score)
+
+    def update_soft_limit(self, best_move, score):
+        """stretches the soft limit while the best move changes or the score drops
+        (called per iteration, or per check of anytime searches like mcts)
+        """
+        self.instability *= INSTABILITY_DECAY
+        if self.best_move is not None and best_move != self.best_move:
+            self.instability += 1
+        extension = 1 + BEST_MOVE_CHANGE_EXTENSION * self.instability
+        if self.score is not None and score < self.score - SCORE_DROP:
+            extension += SCORE_DROP_EXTENSION
+        self.soft_limit = min(self.optimum * extension, self.hard_limit)
+        self.best_move, self.score = best_move, score
+
+    def on_ponder_hit(self, elapsed):
+        """elapsed is counted from the ponder hit from now on -> the running iteration
+        keeps its start, so its time stays the time of the whole iteration
+        """
+        self.last_elapsed -= elapsed
+
+    def can_start_iteration(self, elapsed):
+        return elapsed + self.iteration_time * self.growth < self.soft_limit
+
+
+class ProgressReporter:
+    """sends (depth, best move, score, nodes/sec, eval cache hit rate) of a running
+    search over a pipe
+    """
+
+    def __init__(self, connection, limits):
+        self.connection = connection
+        self.limits = limits
+        self.depth, self.best_move, self.score = 0, None, 0
+
+    def on_iteration(self, depth, score, nodes, elapsed, pv):
+        """search() info_callback"""
+        self.depth, self.best_move, self.score = depth, pv[0] if pv else None, score
+        self.send()
+
+    def send(self):
+        """SearchLimits progress_callback"""
+        elapsed = self.limits.elapsed()
+        self.connection.send(
+            (
+                self.depth,
+                str(self.best_move) if self.best_move else None,
+                self.score,
+                int(nodes / elapsed) if elapsed > 0 else 0,
+                get_eval_cache().get_hit_rate(),
+            )
+        )
+
+
 def find_random_move(valid_moves):
     """picks a random valid move"""
     return valid_moves[random.randint(0, len(valid_moves) - 1)]
@@ -144,17 +403,180 @@ def score_material(board):
     return score
 
 
-def find_best_move(game_state, valid_moves, return_queue):
-    """helper to make first recursive call"""
-    global next_move
-    next_move = None
+def find_best_move(
+    game_state,
+    valid_moves,
+    return_queue,
+    ponder_hit_event=None,
+    stop_event=None,
+    progress_connection=None,
+    time_manager=None,
+):
+    """helper to make first recursive call -> puts (best_move, pv) in return_queue
+
+    with ponder_hit_event the search runs on the opponent's time until the event is set,
+    stop_event makes it return its current best move, progress is sent to
+    progress_connection (see ProgressReporter). time_manager (clock games) replaces the
+    fixed DEPTH by its time limits
+    """
     random.shuffle(valid_moves)
     # find_move_min_max(game_state, valid_moves, DEPTH, game_state.white_to_move)
-    turn_multiplier = 1 if game_state.white_to_move else -1
-    find_move_nega_max_alpha_beta(
-        game_state, valid_moves, DEPTH, -CHECKMATE, CHECKMATE, turn_multiplier
+    if time_manager is not None:
+        limits = time_manager.get_limits(
+            stop_event=stop_event, ponder_event=ponder_hit_event
+        )
+    else:
+        limits = SearchLimits(DEPTH, stop_event=stop_event, ponder_event=ponder_hit_event)
+    info_callback = None
+    if progress_connection is not None:
+        reporter = ProgressReporter(progress_connection, limits)
+        limits.progress_callback, info_callback = reporter.send, reporter.on_iteration
+    search_function = get_search_function()
+    best_move, _, pv = search_function(game_state, valid_moves, limits, info_callback)
+    return_queue.put((best_move, pv))
+
+
+def get_search_function():
+    """search() of ENGINE_MODE -> all take (game_state, valid_moves, limits, info_callback)"""
+    if ENGINE_MODE == "mcts":
+        import mcts  # imports this module
+
+        return mcts.search
+    return search
+
+
+def search(game_state, valid_moves, limits, info_callback=None):
+    """iterative deepening alpha-beta -> returns (best_move, score, pv)
+
+    score is from side to move's perspective. Search stops as soon as
+    limits.should_stop() is true, the interrupted iteration is discarded.
+    info_callback(depth, score, nodes, elapsed, pv) is called after every iteration.
+    """
+
+    def on_iteration(depth, lines, nodes, elapsed):
+        info_callback(depth, lines[0][1], nodes, elapsed, lines[0][2])
+
+    lines = search_multi_pv(
+        game_state, valid_moves, limits, 1, on_iteration if info_callback else None
     )
-    return_queue.put(next_move)
+    return lines[0] if lines else (None, 0, [])
+
+
+def search_multi_pv(game_state, valid_moves, limits, multi_pv, info_callback=None):
+    """iterative deepening alpha-beta of the multi_pv best root moves
+    -> returns lines [(move, score, pv), ...] best first
+
+    every iteration searches the root once per line, without the moves of the lines
+    found before. Lines share the transposition table and killer moves, so later lines
+    cost a fraction of a full search. info_callback(depth, lines, nodes, elapsed) is
+    called after every iteration.
+    """
+    global nodes, search_limits
+    nodes, search_limits = 0, limits
+    for cache in (get_eval_cache(), get_pawn_cache()):
+        cache.hits = cache.misses = 0  # counted per search
+    for killers in killer_moves:
+        killers[:] = [None, None]
+    turn_multiplier = 1 if game_state.white_to_move else -1
+    best_lines = []
+    valid_moves = MoveIndex(valid_moves)  # reordered below
+    attach_accumulator = EVALUATION == "nnue" and game_state.accumulator is None
+    if attach_accumulator:  # updated by make_move/undo_move during this search
+        from nnue import Accumulator
+
+        Accumulator(nnue_network).attach(game_state)
+    try:
+        for depth in range(1, MAX_DEPTH + 1):
+            if depth > limits.depth and not limits.is_pondering():
+                break
+
+            lines = search_lines(
+                game_state, valid_moves, depth, best_lines, multi_pv, turn_multiplier
+            )
+            if limits.stopped or not lines:
+                break
+
+            best_lines = lines
+            limits.completed_depth = depth
+            # search moves of best lines first in next iteration
+            line_moves = [move for move, _, _ in best_lines]
+            valid_moves = MoveIndex(
+                [*line_moves, *(move for move in valid_moves if move not in line_moves)]
+            )
+            if info_callback is not None:
+                info_callback(depth, best_lines, nodes, limits.elapsed())
+            time_manager = limits.time_manager
+            if time_manager is not None:
+                time_manager.on_iteration(
+                    best_lines[0][0], best_lines[0][1], limits.elapsed()
+                )
+                if not limits.is_pondering():
+                    if not time_manager.can_start_iteration(limits.elapsed()):
+                        break
+    finally:
+        search_limits = None
+        if attach_accumulator:
+            game_state.accumulator = None
+
+    return best_lines
+
+
+def search_lines(
+    game_state, valid_moves, depth, previous_lines, multi_pv, turn_multiplier
+):
+    """one iteration of search_multi_pv() -> lines best first, [] if stopped"""
+    key, lines, root_moves = game_state.zobrist_key, [], valid_moves
+    root_entry = None
+    for line_index in range(min(multi_pv, len(valid_moves))):
+        previous_score = 0
+        if line_index < len(previous_lines):
+            previous_score = previous_lines[line_index][1]
+        score = search_root(
+            game_state, root_moves, depth, previous_score, turn_multiplier
+        )
+        if search_limits_stopped():
+            return []
+        if next_move is None:  # no root move left to search
+            break
+
+        lines.append((next_move, score, list(pv_table[0])))
+        root_moves = MoveIndex(move for move in root_moves if move is not next_move)
+        # root entry of a search without the best moves is wrong for the position
+        if not line_index:
+            root_entry = transposition_table.get(key)
+        elif root_entry is not None:
+            transposition_table[key] = root_entry
+
+    lines.sort(key=lambda line: line[1], reverse=True)
+    return lines
+
+
+def search_root(game_state, valid_moves, depth, previous_score, turn_multiplier):
+    """one iteration -> aspiration window around previous score, widened on failure"""
+    global next_move
+    delta = ASPIRATION_WINDOW
+    if ASPIRATION_WINDOWS and depth > 1 and abs(previous_score) < CHECKMATE:
+        alpha, beta = previous_score - delta, previous_score + delta
+    else:
+        alpha, beta = -CHECKMATE, CHECKMATE
+
+    while True:
+        next_move = None
+        game_state.get_valid_moves()  # refresh in_check of root position
+        score = find_move_nega_max_alpha_beta(
+            game_state, valid_moves, depth, alpha, beta, turn_multiplier
+        )
+        if search_limits_stopped():
+            return score
+
+        if score <= alpha and alpha > -CHECKMATE:  # fail low
+            delta *= 4
+            alpha = max(previous_score - delta, -CHECKMATE)
+        elif score >= beta and beta < CHECKMATE:  # fail high
+            delta *= 4
+            beta = min(previous_score + delta, CHECKMATE)
+        else:
+            return score
 
 
 def find_move_min_max(game_state, valid_moves, depth, white_to_move):
@@ -211,36 +633,390 @@ def find_move_nega_max(game_state, valid_moves, depth, turn_multiplier):
 
 
 def find_move_nega_max_alpha_beta(
-    game_state, valid_moves, depth, alpha, beta, turn_multiplier
+    game_state, valid_moves, depth, alpha, beta, turn_multiplier, ply=0, allow_null=True
 ):
-    """nega max algo"""
-    global next_move
-    if not depth:
-        return turn_multiplier * score_board(game_state)
+    """nega max algo with selective search (null move, LMR, futility pruning)"""
+    global next_move, nodes
+    nodes += 1
+    pv_table[ply] = []
+    if search_limits is not None and search_limits.should_stop():
+        return 0  # result is discarded by search()
 
-    max_score = -CHECKMATE
-    for move in valid_moves:
+    if ply and (
+        game_state.halfmove_clock >= 100 or game_state.get_repetition_count()
+    ):  # repeating a position can't be better than a draw -> no need to search it
+        return DRAW
+
+    if depth <= 0 or ply >= MAX_DEPTH:
+        if valid_moves is None and game_state.update_pins_and_checks():
+            game_state.get_valid_moves()  # sets check_mate -> stalemate isn't detected
+        return turn_multiplier * evaluate(game_state)
+
+    if EVALUATION == "value_net" and depth == 1:
+        if valid_moves is None:
+            valid_moves = game_state.get_valid_moves(indexed=True)
+        if valid_moves:
+            evaluate_leaves(game_state, valid_moves)  # children are leaves -> one batch
+
+    if valid_moves is not None and not valid_moves:
+        return -CHECKMATE if game_state.check_mate else STALEMATE
+
+    original_alpha, original_beta, hash_move = alpha, beta, None
+    entry = transposition_table.get(game_state.zobrist_key)
+    if entry is not None:
+        entry_depth, entry_score, entry_flag, hash_move = entry
+        if entry_depth >= depth and ply:
+            if entry_flag == TT_EXACT:
+                return entry_score
+            elif entry_flag == TT_LOWER_BOUND:
+                alpha = max(alpha, entry_score)
+            else:
+                beta = min(beta, entry_score)
+            if alpha >= beta:
+                return entry_score
+
+    # in_check refers to this node only until children generate their moves
+    if valid_moves is None:  # moves are generated lazily by generate_staged_moves()
+        in_check = game_state.update_pins_and_checks()
+    else:
+        in_check = game_state.in_check
+    if NULL_MOVE_PRUNING and allow_null and ply and not in_check and depth > NULL_MOVE_R:
+        null_score = search_null_move(game_state, depth, beta, turn_multiplier, ply)
+        if null_score is not None:
+            return null_score
+
+    futility_score = None
+    if FUTILITY_PRUNING and ply and not in_check and depth < len(FUTILITY_MARGINS):
+        futility_score = turn_multiplier * evaluate(game_state) + FUTILITY_MARGINS[depth]
+        if futility_score > alpha:
+            futility_score = None  # quiet moves may still raise alpha
+
+    if not ply:  # root moves keep the order of the previous iteration
+        moves = valid_moves
+        if hash_move is not None:
+            moves = order_hash_move_first(valid_moves, hash_move)
+    else:
+        moves = generate_staged_moves(game_state, ply, hash_move, in_check, valid_moves)
+
+    max_score, best_move, move_index = -CHECKMATE, None, -1
+    for move_index, move in enumerate(moves):
+        is_quiet = not move.is_capture and not move.is_pawn_promotion
         game_state.make_move(move)
-        next_moves = game_state.get_valid_moves()
+        if futility_score is not None and move_index and is_quiet:
+            if not game_state.check_for_pins_and_checks()[0]:  # checks are never futile
+                game_state.undo_move()
+                max_score = max(max_score, futility_score)
+                continue
+
+        reduction = 0
+        if (
+            LATE_MOVE_REDUCTIONS
+            and move_index >= LMR_FULL_DEPTH_MOVES
+            and depth >= LMR_MIN_DEPTH
+            and is_quiet
+            and not in_check
+            and not game_state.check_for_pins_and_checks()[0]
+        ):
+            reduction = 1
+
+        # principal variation search -> moves after the first are scouted with a null window
+        scout = PRINCIPAL_VARIATION_SEARCH and move_index > 0
+        child_beta = alpha + SCORE_GRAIN if scout else beta
         score = -find_move_nega_max_alpha_beta(
-            game_state, next_moves, depth - 1, -beta, -alpha, -turn_multiplier
+            game_state,
+            None,
+            depth - 1 - reduction,
+            -child_beta,
+            -alpha,
+            -turn_multiplier,
+            ply + 1,
         )
+        if reduction and score > alpha and not search_limits_stopped():
+            # reduced search failed high -> verify with full depth
+            score = research_child(
+                game_state, depth - 1, alpha, child_beta, turn_multiplier, ply
+            )
+        if scout and alpha < score < beta and not search_limits_stopped():
+            # scout failed high -> move may be better than pv, search with full window
+            score = research_child(
+                game_state, depth - 1, alpha, beta, turn_multiplier, ply
+            )
+        game_state.undo_move()
+        if search_limits_stopped():
+            return 0
 
-        if score > max_score:
-            max_score = score
-            if depth == DEPTH:
+        # root -> first move is taken even if mated (score == -CHECKMATE == max_score)
+        if score > max_score or (not ply and best_move is None):
+            max_score, best_move = score, move
+            pv_table[ply] = [move, *pv_table[ply + 1]]
+            if not ply:
                 next_move = move
-        game_state.undo_move()
 
         if max_score > alpha:
             alpha = max_score
 
         if alpha >= beta:
+            if is_quiet:
+                store_killer_move(ply, move)
             break
 
+    if move_index < 0:  # no legal move
+        return -CHECKMATE if in_check else STALEMATE
+
+    store_transposition(
+        game_state.zobrist_key, depth, max_score, original_alpha, original_beta, best_move
+    )
     return max_score
 
 
+def research_child(game_state, depth, alpha, beta, turn_multiplier, ply):
+    """searches position after last made move again with a new depth/window"""
+    return -find_move_nega_max_alpha_beta(
+        game_state, None, depth, -beta, -alpha, -turn_multiplier, ply + 1
+    )
+
+
+def search_null_move(game_state, depth, beta, turn_multiplier, ply):
+    """null-move pruning -> returns cutoff score or None if node has to be searched
+
+    passing the turn is assumed to be worse than the best move, which is wrong in
+    zugzwang: pawn endings are never pruned and low material cutoffs are verified
+    """
+    non_pawn_material = count_non_pawn_material(game_state)
+    if not non_pawn_material:
+        return None
+
+    game_state.make_null_move()
+    score = -find_move_nega_max_alpha_beta(
+        game_state,
+        None,
+        depth - 1 - NULL_MOVE_R,
+        -beta,
+        -beta + SCORE_GRAIN,
+        -turn_multiplier,
+        ply + 1,
+        allow_null=False,
+    )
+    game_state.undo_null_move()
+    if search_limits_stopped() or score < beta:
+        return None
+
+    if non_pawn_material <= NULL_MOVE_VERIFICATION_MATERIAL:
+        score = find_move_nega_max_alpha_beta(
+            game_state,
+            None,
+            depth - NULL_MOVE_R,
+            beta - SCORE_GRAIN,
+            beta,
+            turn_multiplier,
+            ply,
+            allow_null=False,
+        )
+        if search_limits_stopped() or score < beta:
+            return None
+
+    return score
+
+
+def count_non_pawn_material(game_state):
+    """material of side to move without pawns and king"""
+    color, material = "w" if game_state.white_to_move else "b", 0
+    for row in game_state.board:
+        for square in row:
+            if square[0] == color and square[1] not in "pK":
+                material += PIECE_SCORES[square[1]]
+    return material
+
+
+def search_limits_stopped():
+    return search_limits is not None and search_limits.stopped
+
+
+def store_transposition(key, depth, score, alpha, beta, best_move):
+    """saves search result with its bound type (alpha/beta are the node's original window)"""
+    if len(transposition_table) >= TT_SIZE:
+        transposition_table.clear()
+
+    if score <= alpha:
+        flag = TT_UPPER_BOUND
+    elif score >= beta:
+        flag = TT_LOWER_BOUND
+    else:
+        flag = TT_EXACT
+    transposition_table[key] = (depth, score, flag, best_move)
+
+
+def store_killer_move(ply, move):
+    """quiet move caused a beta cutoff -> tried early in sibling positions"""
+    killers = killer_moves[ply]
+    if killers[0] != move.move_id:
+        killers[1], killers[0] = killers[0], move.move_id
+
+
+def generate_staged_moves(game_state, ply, hash_move, in_check, valid_moves=None):
+    """yields moves of a node in search order -> hash move, captures, killers, quiets
+
+    each stage is generated only when the previous one didn't cut off: the hash move is
+    validated with the moves of its piece, so a hash move cutoff skips generating all
+    other moves. Captures and quiets come from one get_valid_moves() call, the piece
+    move methods can't generate captures only. valid_moves (MoveIndex) skips generation
+    """
+    hash_id = None
+    if hash_move is not None:
+        if valid_moves is not None:
+            move = valid_moves.get_by_id(hash_move.move_id)
+        elif not in_check and not hash_move.is_castle:
+            move = find_piece_move(game_state, hash_move)
+        else:  # piece moves ignore checks -> validated by full generation
+            valid_moves = game_state.get_valid_moves(indexed=True)
+            move = valid_moves.get_by_id(hash_move.move_id)
+        if move is not None:
+            hash_id = move.move_id
+            yield move
+
+    if valid_moves is None:  # also refreshes pins overwritten by the children
+        valid_moves = game_state.get_valid_moves(indexed=True)
+
+    captures = [
+        move
+        for move in valid_moves
+        if (move.is_capture or move.is_pawn_promotion) and move.move_id != hash_id
+    ]
+    captures.sort(key=get_capture_order, reverse=True)
+    yield from captures
+
+    killer_ids = {hash_id}
+    for killer_id in killer_moves[ply]:
+        move = valid_moves.get_by_id(killer_id) if killer_id not in killer_ids else None
+        if move is not None and not move.is_capture and not move.is_pawn_promotion:
+            killer_ids.add(killer_id)
+            yield move
+
+    for move in valid_moves:
+        if not move.is_capture and not move.is_pawn_promotion:
+            if move.move_id not in killer_ids:
+                yield move
+
+
+def find_piece_move(game_state, hash_move):
+    """legal move equal to hash_move or None -> generates moves of its piece only"""
+    row, col = hash_move.start_row, hash_move.start_col
+    if game_state.board[row][col] != hash_move.piece_moved:
+        return None  # zobrist key collision
+    if hash_move.piece_moved[0] != ("w" if game_state.white_to_move else "b"):
+        return None
+
+    game_state.update_pins_and_checks()  # pins were overwritten by null move search
+    for move in game_state.get_piece_moves(row, col):
+        if move.move_id == hash_move.move_id:
+            return move
+    return None
+
+
+def get_capture_order(move):
+    """MVV-LVA -> most valuable victim first, least valuable attacker among equal victims"""
+    victim = PIECE_SCORES[move.piece_captured[1]] if move.is_capture else 0
+    if move.is_pawn_promotion:
+        victim += PIECE_SCORES["Q"]
+    return victim * 100 - PIECE_SCORES[move.piece_moved[1]]
+
+
+def order_hash_move_first(valid_moves, hash_move):
+    """valid_moves is a MoveIndex -> hash move of a colliding zobrist key is not valid"""
+    move = valid_moves.get_by_id(hash_move.move_id)
+    if move is None:
+        return valid_moves
+    return [move, *(other for other in valid_moves if other is not move)]
+
+
+def use_value_net(weights_path=None):
+    """evaluates positions with value network (untrained one without weights file)"""
+    global EVALUATION, value_network
+    from value_net import ValueNet  # numpy is only needed for the value net
+
+    value_network = ValueNet.load(weights_path) if weights_path else ValueNet()
+    EVALUATION = "value_net"
+    leaf_evaluations.clear()
+    transposition_table.clear()  # scores of other evaluation are not comparable
+    get_eval_cache().clear()
+
+
+def use_nnue(weights_path=None):
+    """evaluates positions with incrementally updated network (untrained one without weights file)"""
+    global EVALUATION, nnue_network
+    from nnue import NnueNetwork  # numpy is only needed for the network
+
+    nnue_network = (
+        NnueNetwork.load(weights_path) if weights_path else NnueNetwork.random()
+    )
+    EVALUATION = "nnue"
+    transposition_table.clear()  # scores of other evaluation are not comparable
+    get_eval_cache().clear()
+
+
+def use_score_board():
+    global EVALUATION
+    EVALUATION = "score_board"
+    transposition_table.clear()
+    get_eval_cache().clear()
+
+
+def evaluate(game_state):
+    """positive score -> good for white; negative score -> good for black"""
+    if EVALUATION == "score_board":
+        return score_board(game_state)
+
+    if game_state.check_mate:
+        return -CHECKMATE if game_state.white_to_move else CHECKMATE
+    elif game_state.stale_mate:
+        return STALEMATE
+
+    if EVALUATION == "nnue":
+        accumulator = game_state.accumulator  # attached by search() / mcts.search()
+        if accumulator is None:  # evaluated outside a search -> full evaluation
+            from nnue import Accumulator
+
+            accumulator = Accumulator(nnue_network)
+            accumulator.refresh(game_state)
+        return accumulator.evaluate(game_state.white_to_move)
+
+    score = leaf_evaluations.get(game_state.zobrist_key)
+    if score is None:  # not part of a batch (e.g. max ply reached)
+        evaluate_leaves(game_state, [])
+        score = leaf_evaluations[game_state.zobrist_key]
+    return score
+
+
+def evaluate_leaves(game_state, valid_moves):
+    """value net inference of position and all its children in a single batch
+
+    positions found in the eval cache are left out of the batch, the others are stored
+    """
+    from value_net import serialize
+
+    leaf_evaluations.clear()  # only the current frontier node's leaves are needed
+    keys, planes = [], []
+    for move in [None, *valid_moves]:
+        if move is not None:
+            game_state.make_move(move)
+        score = get_eval_cache().get(game_state.zobrist_key) if EVAL_CACHE else None
+        if score is None:
+            keys.append(game_state.zobrist_key)
+            planes.append(serialize(game_state))
+        else:
+            leaf_evaluations[game_state.zobrist_key] = score
+        if move is not None:
+            game_state.undo_move()
+
+    if not planes:
+        return
+    values = (value_network.predict(planes) * VALUE_NET_SCALE).tolist()
+    leaf_evaluations.update(zip(keys, values))
+    if EVAL_CACHE:
+        for key, value in zip(keys, values):
+            get_eval_cache().store(key, value)
+
+
 def score_board(game_state):
     """positive score -> good for white; negative score -> good for black"""
     if game_state.check_mate:
@@ -248,6 +1024,22 @@ def score_board(game_state):
     elif game_state.stale_mate:
         return STALEMATE
 
+    if not EVAL_CACHE:
+        return score_pieces(game_state) + score_pawn_structure(game_state)
+
+    cache = get_eval_cache()
+    score = cache.get(game_state.zobrist_key)
+    if score is None:
+        score = score_pieces(game_state) + score_pawn_structure(game_state)
+        cache.store(game_state.zobrist_key, score)
+    return score
+
+
+def score_pieces(game_state):
+    """material and piece-square score of score_board (not cached)"""
+    if game_state.board_codes is not None:
+        return accel.score_board(game_state.board_codes, get_score_tables())
+
     score = 0
     for row in range(len(game_state.board)):
         for col in range(len(game_state.board[row])):
@@ -269,3 +1061,81 @@ def score_board(game_state):
                 score -= piece_score + piece_position_score * 0.1
 
     return score
+
+
+def score_pawn_structure(game_state):
+    """doubled, isolated, backward and passed pawn score, looked up by pawn key"""
+    if not PAWN_HASH:
+        return score_pawns(game_state.board)
+
+    cache = get_pawn_cache()
+    score = cache.get(game_state.pawn_key)
+    if score is None:
+        score = score_pawns(game_state.board)
+        cache.store(game_state.pawn_key, score)
+    return score  # no pawns -> key 0, slots start as key 0 with score 0
+
+
+def score_pawns(board):
+    """pawn structure score of board (positive -> good for white)"""
+    pawn_rows = {"w": [[] for _ in range(8)], "b": [[] for _ in range(8)]}  # per col
+    for row in range(1, 7):
+        for col in range(8):
+            if board[row][col][1] == "p":
+                pawn_rows[board[row][col][0]][col].append(row)
+
+    score = 0
+    for color, enemy, forward, sign in (("w", "b", -1, 1), ("b", "w", 1, -1)):
+        own_rows, enemy_rows = pawn_rows[color], pawn_rows[enemy]
+        for col in range(8):
+            adjacent_cols = [c for c in (col - 1, col + 1) if 0 <= c < 8]
+            adjacent_rows = [row for c in adjacent_cols for row in own_rows[c]]
+            for row in own_rows[col]:
+                if any((other - row) * forward > 0 for other in own_rows[col]):
+                    score -= sign * DOUBLED_PAWN_PENALTY  # other terms -> front pawn
+                    continue
+
+                if not adjacent_rows:
+                    score -= sign * ISOLATED_PAWN_PENALTY
+                elif all((other - row) * forward > 0 for other in adjacent_rows) and any(
+                    row + 2 * forward in enemy_rows[c] for c in adjacent_cols
+                ):
+                    score -= sign * BACKWARD_PAWN_PENALTY
+
+                if not any(
+                    (other - row) * forward > 0
+                    for c in adjacent_cols + [col]
+                    for other in enemy_rows[c]
+                ):
+                    rows_advanced = 6 - row if color == "w" else row - 1
+                    score += sign * PASSED_PAWN_SCORES[rows_advanced]
+
+    return score
+
+
+def get_pawn_cache():
+    global pawn_cache
+    if pawn_cache is None:
+        pawn_cache = EvalCache(PAWN_HASH_SIZE)
+    return pawn_cache
+
+
+def get_cache_hit_rates():
+    """(eval cache, pawn hash) hit rates of the last search"""
+    return get_eval_cache().get_hit_rate(), get_pawn_cache().get_hit_rate()
+
+
+def get_eval_cache():
+    global eval_cache
+    if eval_cache is None:
+        eval_cache = EvalCache()
+    return eval_cache
+
+
+def get_score_tables():
+    global score_tables
+    if score_tables is None:
+        score_tables = accel.build_score_tables(
+            PIECE_SCORES, PIECE_POSITION_SCORES, SQUARE_CODES
+        )
+    return score_tables
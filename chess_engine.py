@@ -2,7 +2,43 @@
 
 # TODO: IMPROVE CODE STYLE - REMOVE DUPLICATIONS, CREATE ABSTRATCTIONS, ETC
 
-import numpy as np
+import random
+from array import array
+
+import accel
+
+
+START_FEN = "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1"
+
+# zobrist keys -> fixed seed so hashes are reproducible across processes
+_zobrist_random = random.Random(2022)
+ZOBRIST_PIECE_KEYS = {
+    color + piece: [[_zobrist_random.getrandbits(64) for _ in range(8)] for _ in range(8)]
+    for color in "wb"
+    for piece in "pRNBQK"
+}
+ZOBRIST_CASTLE_KEYS = [_zobrist_random.getrandbits(64) for _ in range(16)]
+ZOBRIST_EN_PASSANT_KEYS = [_zobrist_random.getrandbits(64) for _ in range(8)]
+ZOBRIST_BLACK_TO_MOVE = _zobrist_random.getrandbits(64)
+
+# one byte per square in GameState.snapshot()
+SQUARE_CODES = (
+    "--",
+    "wp",
+    "wN",
+    "wB",
+    "wR",
+    "wQ",
+    "wK",
+    "bp",
+    "bN",
+    "bB",
+    "bR",
+    "bQ",
+    "bK",
+)
+SQUARE_CODE_INDEX = {square: code for code, square in enumerate(SQUARE_CODES)}
+NO_EN_PASSANT = 64  # en passant square of snapshot without en passant
 
 
 class GameState:
@@ -38,20 +74,24 @@ class GameState:
             ["wp", "wp", "wp", "wp", "wp", "wp", "wp", "wp"],
             ["wR", "wN", "wB", "wQ", "wK", "wB", "wN", "wR"],
         ]
-        self.move_functions = {
-            "p": self._get_pawn_moves,
-            "R": self._get_rook_moves,
-            "N": self._get_knight_moves,
-            "B": self._get_bishop_moves,
-            "Q": self._get_queen_moves,
-            "K": self._get_king_moves,
-        }
+        # int8 copy of board for the accel kernels -> None on the pure Python backend
+        self.board_codes = None
+        self._update_board_codes()
+        self.move_functions = self._get_move_functions()
         self.white_to_move = True
         self.move_log = []
         self.en_passant_possible_move = ()
         self.en_passant_possible_log = [self.en_passant_possible_move]
         self.current_castling_rights = CastleRights()
         self.castle_rights_log = self._update_castle_rights_log()
+        self.zobrist_key = self._compute_zobrist_key()
+        self.zobrist_log = [self.zobrist_key]  # position history for repetition checks
+        self.pawn_key = self._compute_pawn_key()  # hash of pawns only (pawn hash table)
+        self.pawn_key_log = [self.pawn_key]
+        self.halfmove_clock = 0  # plies since last capture or pawn move (50-move rule)
+        self.halfmove_clock_log = [self.halfmove_clock]
+        # incrementally updated evaluation (nnue.Accumulator) -> None if not used
+        self.accumulator = None
 
         # valid moves attributes
         self.white_king_location = (7, 4)
@@ -63,6 +103,175 @@ class GameState:
         self.check_mate = False
         self.stale_mate = False
 
+    def load_fen(self, fen):
+        """sets up position from a FEN string (fullmove field is ignored)"""
+        fields = fen.split()
+        placement, turn = fields[0], fields[1] if len(fields) > 1 else "w"
+        castling = fields[2] if len(fields) > 2 else "-"
+        en_passant = fields[3] if len(fields) > 3 else "-"
+        halfmove_clock = int(fields[4]) if len(fields) > 4 else 0
+
+        self.board = []
+        for row, rank in enumerate(placement.split("/")):
+            board_row = []
+            for char in rank:
+                if char.isdigit():
+                    board_row.extend(["--"] * int(char))
+                    continue
+
+                color = "w" if char.isupper() else "b"
+                piece = "p" if char.lower() == "p" else char.upper()
+                if piece == "K":
+                    self._update_king_location(color, row, len(board_row))
+                board_row.append(color + piece)
+            self.board.append(board_row)
+        self._update_board_codes()
+
+        self.white_to_move = turn == "w"
+        self.move_log = []
+        self.en_passant_possible_move = ()
+        if en_passant != "-":
+            self.en_passant_possible_move = (
+                Move.ranks_to_rows[en_passant[1]],
+                Move.files_to_cols[en_passant[0]],
+            )
+        self.en_passant_possible_log = [self.en_passant_possible_move]
+        self.current_castling_rights = CastleRights(
+            "K" in castling, "k" in castling, "Q" in castling, "q" in castling
+        )
+        self.castle_rights_log = self._update_castle_rights_log()
+        self.zobrist_key = self._compute_zobrist_key()
+        self.zobrist_log = [self.zobrist_key]
+        self.pawn_key = self._compute_pawn_key()
+        self.pawn_key_log = [self.pawn_key]
+        self.halfmove_clock = halfmove_clock
+        self.halfmove_clock_log = [self.halfmove_clock]
+        self.in_check, self.pins, self.checks = False, [], []
+        self.check_mate = self.stale_mate = False
+        if self.accumulator is not None:
+            self.accumulator.refresh(self)
+
+    def get_fen(self):
+        """FEN string of current position (fullmove number counts moves since setup)"""
+        ranks = []
+        for row in self.board:
+            rank, empty_squares = "", 0
+            for square in row:
+                if square == "--":
+                    empty_squares += 1
+                    continue
+                if empty_squares:
+                    rank, empty_squares = rank + str(empty_squares), 0
+                rank += square[1].upper() if square[0] == "w" else square[1].lower()
+            ranks.append(rank + (str(empty_squares) if empty_squares else ""))
+
+        rights = self.current_castling_rights
+        castling = "".join(
+            char
+            for char, allowed in zip(
+                "KQkq",
+                (
+                    rights.white_king_side,
+                    rights.white_queen_side,
+                    rights.black_king_side,
+                    rights.black_queen_side,
+                ),
+            )
+            if allowed
+        )
+        en_passant = "-"
+        if self.en_passant_possible_move:
+            row, col = self.en_passant_possible_move
+            en_passant = Move.cols_to_files[col] + Move.rows_to_ranks[row]
+        return (
+            f"{'/'.join(ranks)} {'w' if self.white_to_move else 'b'} {castling or '-'} "
+            f"{en_passant} {self.halfmove_clock} {len(self.move_log) // 2 + 1}"
+        )
+
+    def snapshot(self):
+        """compact picklable position -> GameState.restore(snapshot)
+
+        (board bytes, side to move and castle rights bits, en passant square,
+        halfmove clock, zobrist keys). Moves and undo logs are left out, so the size
+        doesn't grow with game length: only keys since the last capture or pawn move are
+        kept, earlier positions can't repeat
+        """
+        board = bytes(SQUARE_CODE_INDEX[square] for row in self.board for square in row)
+        flags = (
+            self.white_to_move
+            | self._get_castle_rights_index(self.current_castling_rights) << 1
+        )
+        en_passant_square = NO_EN_PASSANT
+        if self.en_passant_possible_move:
+            en_passant_square = (
+                self.en_passant_possible_move[0] * 8 + self.en_passant_possible_move[1]
+            )
+        zobrist_keys = array("Q", self.zobrist_log[-(self.halfmove_clock + 1) :])
+        return board, flags, en_passant_square, self.halfmove_clock, zobrist_keys
+
+    @classmethod
+    def restore(cls, snapshot):
+        """new GameState of snapshot() -> moves made before can't be undone"""
+        game_state = cls.__new__(cls)
+        game_state.__setstate__(snapshot)
+        return game_state
+
+    def __getstate__(self):
+        """pickled as snapshot -> worker processes get the position, not the move log"""
+        return self.snapshot()
+
+    def __setstate__(self, snapshot):
+        board, flags, en_passant_square, halfmove_clock, zobrist_keys = snapshot
+        self.__init__()
+        self.board = [
+            [SQUARE_CODES[code] for code in board[row * 8 : row * 8 + 8]]
+            for row in range(8)
+        ]
+        for row in range(8):
+            for col in range(8):
+                if self.board[row][col][1] == "K":
+                    self._update_king_location(self.board[row][col][0], row, col)
+        self._update_board_codes()
+
+        self.white_to_move = bool(flags & 1)
+        self.current_castling_rights = CastleRights(
+            *(bool(flags >> bit & 1) for bit in range(1, 5))
+        )
+        self.castle_rights_log = self._update_castle_rights_log()
+        self.en_passant_possible_move = ()
+        if en_passant_square != NO_EN_PASSANT:
+            self.en_passant_possible_move = divmod(en_passant_square, 8)
+        self.en_passant_possible_log = [self.en_passant_possible_move]
+        self.zobrist_log = list(zobrist_keys)
+        self.zobrist_key = self.zobrist_log[-1]
+        self.pawn_key = self._compute_pawn_key()
+        self.pawn_key_log = [self.pawn_key]
+        self.halfmove_clock = halfmove_clock
+        self.halfmove_clock_log = [self.halfmove_clock]
+
+    def copy(self):
+        """independent copy for speculative analysis -> moves of the game can be undone
+
+        logs are copied shallowly (moves and logged castle rights are never mutated),
+        the accumulator isn't copied
+        """
+        game_state = GameState.__new__(GameState)
+        game_state.__dict__.update(self.__dict__)
+        game_state.board = [list(row) for row in self.board]
+        if self.board_codes is not None:
+            game_state.board_codes = self.board_codes.copy()
+        game_state.move_functions = game_state._get_move_functions()
+        game_state.move_log = list(self.move_log)
+        game_state.en_passant_possible_log = list(self.en_passant_possible_log)
+        game_state.current_castling_rights = self.current_castling_rights.copy()
+        game_state.castle_rights_log = list(self.castle_rights_log)
+        game_state.zobrist_log = list(self.zobrist_log)
+        game_state.pawn_key_log = list(self.pawn_key_log)
+        game_state.halfmove_clock_log = list(self.halfmove_clock_log)
+        game_state.pins, game_state.checks = list(self.pins), list(self.checks)
+        game_state.accumulator = None
+        return game_state
+
     def make_move(self, move):
         """executes move"""
         self.board[move.start_row][move.start_col] = "--"
@@ -88,6 +297,42 @@ class GameState:
         if move.is_castle:
             self._make_castle_move(move)
         self._update_castle_rights(move)
+        self._update_zobrist_key(move)
+        self._update_pawn_key(move)
+        if self.board_codes is not None:
+            self._sync_board_codes(move)
+        if move.is_capture or move.piece_moved[1] == "p":
+            self.halfmove_clock = 0  # irreversible -> earlier positions can't repeat
+        else:
+            self.halfmove_clock += 1
+        self.halfmove_clock_log.append(self.halfmove_clock)
+        if self.accumulator is not None:
+            self.accumulator.make_move(self, move)
+
+    def make_null_move(self):
+        """passes the turn (used by null-move pruning) -> undo with undo_null_move"""
+        self.white_to_move = not self.white_to_move
+        key = self.zobrist_key ^ ZOBRIST_BLACK_TO_MOVE
+        if self.en_passant_possible_move:
+            key ^= ZOBRIST_EN_PASSANT_KEYS[self.en_passant_possible_move[1]]
+        self.en_passant_possible_move = ()
+        self.en_passant_possible_log.append(self.en_passant_possible_move)
+        self.zobrist_key = key
+        self.zobrist_log.append(key)
+        # repetitions across a null move are not real repetitions
+        self.halfmove_clock = 0
+        self.halfmove_clock_log.append(self.halfmove_clock)
+
+    def undo_null_move(self):
+        self.white_to_move = not self.white_to_move
+        self.en_passant_possible_log.pop()
+        self.en_passant_possible_move = self.en_passant_possible_log[-1]
+        self.zobrist_log.pop()
+        self.zobrist_key = self.zobrist_log[-1]
+        self.halfmove_clock_log.pop()
+        self.halfmove_clock = self.halfmove_clock_log[-1]
+        self.check_mate = False
+        self.stale_mate = False
 
     def undo_move(self):
         """undo last move"""
@@ -109,36 +354,89 @@ class GameState:
         self.en_passant_possible_move = self.en_passant_possible_log[-1]
 
         self.castle_rights_log.pop()
-        self.current_castling_rights = self.castle_rights_log[-1]
+        # copy -> log entry must not be mutated by the next move
+        self.current_castling_rights = self.castle_rights_log[-1].copy()
         if move.is_castle:
             self._undo_castle_move(move)
+        if self.board_codes is not None:
+            self._sync_board_codes(move)
+        self.zobrist_log.pop()
+        self.zobrist_key = self.zobrist_log[-1]
+        self.pawn_key_log.pop()
+        self.pawn_key = self.pawn_key_log[-1]
+        self.halfmove_clock_log.pop()
+        self.halfmove_clock = self.halfmove_clock_log[-1]
+        if self.accumulator is not None:
+            self.accumulator.undo_move()
 
         self.check_mate = False
         self.stale_mate = False
 
-    def get_valid_moves(self):
-        moves = []
-        self.in_check, self.pins, self.checks = self.check_for_pins_and_checks()
-        king_row, king_col = self._get_king_location()
+    def get_valid_moves(self, indexed=False):
+        """legal moves -> MoveIndex with indexed=True (O(1) lookups by square)"""
+        if self.board_codes is not None:
+            moves = self._get_kernel_moves()
+        else:
+            moves = []
+            self.in_check, self.pins, self.checks = self.check_for_pins_and_checks()
+            king_row, king_col = self._get_king_location()
+
+            if self.in_check:
+                if len(self.checks) == 1:  # one check -> block it or move king
+                    moves = self.get_valid_moves_for_one_check(king_row, king_col, moves)
+                else:  # double check -> king has to move
+                    self._get_king_moves(king_row, king_col, moves)
+            else:  # not check -> all moves should be valid
+                moves = self.get_all_possible_moves()
+
+            if self.white_to_move:
+                self._get_castle_moves(king_row, king_col, moves, "w")
+            else:
+                self._get_castle_moves(king_row, king_col, moves, "b")
 
-        if self.in_check:
-            if len(self.checks) == 1:  # one check -> block it or move king
-                moves = self.get_valid_moves_for_one_check(king_row, king_col, moves)
-            else:  # double check -> king has to move
-                moves = self._get_king_moves(king_row, king_col, moves)
-        else:  # not check -> all moves should be valid
-            moves = self.get_all_possible_moves()
+        if not len(moves):
+            if self.in_check:
+                self.check_mate = True
+            else:
+                self.stale_mate = True
 
-        if not len(moves) and self.in_check:
-            self.check_mate = True
+        return MoveIndex(moves) if indexed else moves
 
-        if self.white_to_move:
-            self._get_castle_moves(king_row, king_col, moves, "w")
-        else:
-            self._get_castle_moves(king_row, king_col, moves, "b")
+    def update_pins_and_checks(self):
+        """in_check/pins/checks of side to move without generating moves -> in_check"""
+        self.in_check, self.pins, self.checks = self.check_for_pins_and_checks()
+        return self.in_check
+
+    def get_piece_moves(self, row, col):
+        """legal moves of piece on (row, col) without castles
 
+        needs pins of update_pins_and_checks() and side to move not being in check
+        """
+        moves, pins = [], list(self.pins)
+        self.move_functions[self.board[row][col][1]](row, col, moves)
+        self.pins = pins  # piece move methods remove the pins they used
         return moves
 
+    def get_repetition_count(self):
+        """number of earlier occurrences of current position
+
+        only positions since the last irreversible move (capture, pawn move) can be equal,
+        so the history is scanned back halfmove_clock plies at most
+        """
+        count, key = 0, self.zobrist_key
+        oldest = max(len(self.zobrist_log) - 1 - self.halfmove_clock, 0)
+        for i in range(len(self.zobrist_log) - 3, oldest - 1, -2):  # same side to move
+            if self.zobrist_log[i] == key:
+                count += 1
+        return count
+
+    def is_draw_by_repetition(self):
+        """threefold repetition"""
+        return self.get_repetition_count() >= 2
+
+    def is_draw_by_fifty_move_rule(self):
+        return self.halfmove_clock >= 100
+
     def get_valid_moves_for_one_check(self, king_row, king_col, moves):
         moves = self.get_all_possible_moves()
         check_row, check_col, check_row_dir, check_col_dir = self.checks[0]
@@ -156,22 +454,12 @@ class GameState:
                 if self._is_check_over(check_row, check_col, valid_square):
                     break  # reached piece -> check is over
 
-        for move in reversed(moves):
-            if move.piece_moved[1] == "K":
-                continue
-
-            # if it's not king must block or capture
-            if not (move.end_row, move.end_col) in valid_squares:
-                moves.remove(move)
-
         return self.validate_possible_moves(valid_squares, moves)
 
     def validate_possible_moves(self, valid_squares, moves):
-        king_moves = [m for m in moves if m.piece_moved[1] == "K"]
         for move in reversed(moves):
-            if move.piece_moved != "K":  # not king -> must block or capture
+            if move.piece_moved[1] != "K":  # not king -> must block or capture
                 moves = self.check_if_valid_move(move, valid_squares, moves)
-        moves = [*moves, *king_moves]
         return moves
 
     def get_valid_moves_naive(self):
@@ -194,6 +482,11 @@ class GameState:
         return moves
 
     def check_for_pins_and_checks(self):
+        if self.board_codes is not None:
+            return accel.find_pins_and_checks(
+                self.board_codes, self._get_king_location(), self.white_to_move
+            )
+
         pins, checks, in_check = [], [], False
         enemy_color = self._get_enemy_color()
         player_color = self._get_player_color()
@@ -240,7 +533,7 @@ class GameState:
             end_row = start_row + row_move
             end_col = start_col + col_move
             if not self._is_on_board(end_row, end_col):  # off board
-                break
+                continue
 
             end_piece = self.board[end_row][end_col]
             if end_piece[0] == enemy_color and end_piece[1] == "N":
@@ -278,7 +571,8 @@ class GameState:
         row_direction, first_move_row_direction = row + row_adder, row + row_adder * 2
         base_row = 6 if self.white_to_move else 1
         if self.board[row_direction][col] == "--":  # 1 sq advance
-            if not piece_pinned or pin_direction == (row_direction, 0):
+            # pinned along its file -> pawn stays on the pin line
+            if not piece_pinned or pin_direction in ((row_adder, 0), (-row_adder, 0)):
                 moves.append(Move((row, col), (row_direction, col), self.board))
                 if (
                     row == base_row and self.board[first_move_row_direction][col] == "--"
@@ -294,10 +588,11 @@ class GameState:
         row_direction = row + self._get_color_direction()
         king_row, king_col = self._get_king_location()
         if (col - 1) >= 0:  # safety check
+            if piece_pinned and pin_direction != (row_direction - row, -1):
+                return moves  # capture would leave the pin line
             if self.board[row_direction][col - 1][0] == enemy_color:
-                if not piece_pinned or (pin_direction == (row_direction, -1)):
-                    self._append_move((row, col), (row_direction, col - 1), moves)
-            elif (row - 1, col - 1) == self.en_passant_possible_move:
+                self._append_move((row, col), (row_direction, col - 1), moves)
+            elif (row_direction, col - 1) == self.en_passant_possible_move:
                 attacking_piece = blocking_piece = False
                 if king_row == row:
                     if king_col < col:
@@ -311,14 +606,13 @@ class GameState:
                         if self.board[row][i] != "--":  # some other piece is blocking
                             blocking_piece = True
 
-                    for i in outside_range:
+                    for i in outside_range:  # first piece behind the two pawns
                         square = self.board[row][i]
-                        if square[0] == enemy_color and (
-                            square[1] == "R" or square[1] == "Q"
-                        ):
-                            attacking_piece = True
-                        elif square != "--":
-                            blocking_piece = True
+                        if square != "--":
+                            attacking_piece = (
+                                square[0] == enemy_color and square[1] in "RQ"
+                            )
+                            break
 
                 if not attacking_piece or blocking_piece:
                     self._append_move((row, col), (row_direction, col - 1), moves, True)
@@ -332,10 +626,11 @@ class GameState:
         row_direction = row + self._get_color_direction()
         king_row, king_col = self._get_king_location()
         if (col + 1) <= 7:  # safety check
+            if piece_pinned and pin_direction != (row_direction - row, 1):
+                return moves  # capture would leave the pin line
             if self.board[row_direction][col + 1][0] == enemy_color:
-                if not piece_pinned or (pin_direction == (row_direction, 1)):
-                    self._append_move((row, col), (row_direction, col + 1), moves)
-            elif (row - 1, col + 1) == self.en_passant_possible_move:
+                self._append_move((row, col), (row_direction, col + 1), moves)
+            elif (row_direction, col + 1) == self.en_passant_possible_move:
                 attacking_piece = blocking_piece = False
                 if king_row == row:
                     if king_col < col:
@@ -349,14 +644,13 @@ class GameState:
                         if self.board[row][i] != "--":  # some other piece is blocking
                             blocking_piece = True
 
-                    for i in outside_range:
+                    for i in outside_range:  # first piece behind the two pawns
                         square = self.board[row][i]
-                        if square[0] == enemy_color and (
-                            square[1] == "R" or square[1] == "Q"
-                        ):
-                            attacking_piece = True
-                        elif square != "--":
-                            blocking_piece = True
+                        if square != "--":
+                            attacking_piece = (
+                                square[0] == enemy_color and square[1] in "RQ"
+                            )
+                            break
 
                 if not attacking_piece or blocking_piece:
                     self._append_move((row, col), (row_direction, col + 1), moves, True)
@@ -463,8 +757,8 @@ class GameState:
             self.current_castling_rights.white_king_side = False
             self.current_castling_rights.white_queen_side = False
         elif move.piece_moved == "bK":
-            self.current_castling_rights.white_king_side = False
-            self.current_castling_rights.white_queen_side = False
+            self.current_castling_rights.black_king_side = False
+            self.current_castling_rights.black_queen_side = False
         elif move.piece_moved == "wR":
             if move.start_row == 7:
                 if not move.start_col:  # left rook
@@ -494,15 +788,85 @@ class GameState:
 
         self.castle_rights_log.append(*self._update_castle_rights_log())
 
+    def _get_move_functions(self):
+        return {
+            "p": self._get_pawn_moves,
+            "R": self._get_rook_moves,
+            "N": self._get_knight_moves,
+            "B": self._get_bishop_moves,
+            "Q": self._get_queen_moves,
+            "K": self._get_king_moves,
+        }
+
     def _update_castle_rights_log(self):
-        return [
-            CastleRights(
-                self.current_castling_rights.white_king_side,
-                self.current_castling_rights.black_king_side,
-                self.current_castling_rights.white_queen_side,
-                self.current_castling_rights.black_queen_side,
-            )
-        ]
+        return [self.current_castling_rights.copy()]
+
+    def _compute_zobrist_key(self):
+        """hash of whole position -> used when setting up a position"""
+        key = 0
+        for row in range(8):
+            for col in range(8):
+                if self.board[row][col] != "--":
+                    key ^= ZOBRIST_PIECE_KEYS[self.board[row][col]][row][col]
+
+        key ^= self._get_castle_rights_key(self.current_castling_rights)
+        if self.en_passant_possible_move:
+            key ^= ZOBRIST_EN_PASSANT_KEYS[self.en_passant_possible_move[1]]
+        if not self.white_to_move:
+            key ^= ZOBRIST_BLACK_TO_MOVE
+        return key
+
+    def _update_zobrist_key(self, move):
+        """incremental hash update -> called at the end of make_move"""
+        key = self.zobrist_key ^ ZOBRIST_BLACK_TO_MOVE
+        key ^= ZOBRIST_PIECE_KEYS[move.piece_moved][move.start_row][move.start_col]
+        # board square holds promoted piece if any
+        end_piece = self.board[move.end_row][move.end_col]
+        key ^= ZOBRIST_PIECE_KEYS[end_piece][move.end_row][move.end_col]
+        if move.is_capture:
+            captured_row = move.start_row if move.is_en_passant else move.end_row
+            key ^= ZOBRIST_PIECE_KEYS[move.piece_captured][captured_row][move.end_col]
+
+        if move.is_castle:
+            rook = move.piece_moved[0] + "R"
+            if move.end_col - move.start_col == 2:  # king side
+                rook_cols = (move.end_col + 1, move.end_col - 1)
+            else:
+                rook_cols = (move.end_col - 2, move.end_col + 1)
+            for rook_col in rook_cols:
+                key ^= ZOBRIST_PIECE_KEYS[rook][move.end_row][rook_col]
+
+        key ^= self._get_castle_rights_key(self.castle_rights_log[-2])
+        key ^= self._get_castle_rights_key(self.castle_rights_log[-1])
+        for en_passant_square in self.en_passant_possible_log[-2:]:
+            if en_passant_square:
+                key ^= ZOBRIST_EN_PASSANT_KEYS[en_passant_square[1]]
+
+        self.zobrist_key = key
+        self.zobrist_log.append(key)
+
+    def _compute_pawn_key(self):
+        """hash of pawn placement only -> same piece keys as the zobrist key"""
+        key = 0
+        for row in range(8):
+            for col in range(8):
+                if self.board[row][col][1] == "p":
+                    key ^= ZOBRIST_PIECE_KEYS[self.board[row][col]][row][col]
+        return key
+
+    def _update_pawn_key(self, move):
+        """incremental pawn hash update -> only pawn moves and pawn captures change it"""
+        key = self.pawn_key
+        if move.piece_moved[1] == "p":
+            key ^= ZOBRIST_PIECE_KEYS[move.piece_moved][move.start_row][move.start_col]
+            if not move.is_pawn_promotion:
+                key ^= ZOBRIST_PIECE_KEYS[move.piece_moved][move.end_row][move.end_col]
+        if move.piece_captured[1] == "p":
+            captured_row = move.start_row if move.is_en_passant else move.end_row
+            key ^= ZOBRIST_PIECE_KEYS[move.piece_captured][captured_row][move.end_col]
+
+        self.pawn_key = key
+        self.pawn_key_log.append(key)
 
     def _get_king_location(self):
         if self.white_to_move:
@@ -510,6 +874,42 @@ class GameState:
         else:
             return self.black_king_location
 
+    def _update_board_codes(self):
+        if accel.is_enabled():
+            self.board_codes = accel.new_board_codes(
+                [SQUARE_CODE_INDEX[square] for row in self.board for square in row]
+            )
+
+    def _get_kernel_moves(self):
+        """legal moves of the whole position generated by one accel kernel call"""
+        self.in_check, self.pins, self.checks, move_rows = accel.generate_moves(
+            self.board_codes,
+            self._get_king_location(),
+            self.white_to_move,
+            self._get_castle_rights_index(self.current_castling_rights),
+            self.en_passant_possible_move,
+        )
+        return [
+            Move(
+                divmod(start, 8),
+                divmod(end, 8),
+                self.board,
+                flag == accel.EN_PASSANT,
+                flag == accel.CASTLE,
+            )
+            for start, end, flag in move_rows
+        ]
+
+    def _sync_board_codes(self, move):
+        """copies squares changed by move (made or undone) to board_codes"""
+        squares = [(move.start_row, move.start_col), (move.end_row, move.end_col)]
+        if move.is_en_passant:
+            squares.append((move.start_row, move.end_col))
+        if move.is_castle:  # rook squares
+            squares.extend((move.start_row, col) for col in (0, 3, 5, 7))
+        for row, col in squares:
+            self.board_codes[row * 8 + col] = SQUARE_CODE_INDEX[self.board[row][col]]
+
     def _make_castle_move(self, move):
         if move.end_col - move.start_col == 2:  # king side castle
             self.board[move.end_row][move.end_col - 1] = self.board[move.end_row][
@@ -552,7 +952,7 @@ class GameState:
 
     def _get_king_side_castle_moves(self, row, col, moves, player_color):
         try:
-            if np.array([self.board[row][col + i] == "--" for i in range(1, 3)]).all():
+            if all(self.board[row][col + i] == "--" for i in range(1, 3)):
                 if not self._is_square_under_attack(
                     (row, col + 1)
                 ) and not self._is_square_under_attack((row, col + 2)):
@@ -564,7 +964,7 @@ class GameState:
 
     def _get_queen_side_castle_moves(self, row, col, moves, player_color):
         try:
-            if np.array([self.board[row][col - i] == "--" for i in range(1, 4)]).all():
+            if all(self.board[row][col - i] == "--" for i in range(1, 4)):
                 if not self._is_square_under_attack(
                     (row, col - 1)
                 ) and not self._is_square_under_attack((row, col - 2)):
@@ -602,14 +1002,16 @@ class GameState:
             return self._is_square_under_attack(self.black_king_location)
 
     def _is_square_under_attack(self, square):
-        row, col = square
-        self.white_to_move = not self.white_to_move
-        opponent_moves = self.get_all_possible_moves()
-        self.white_to_move = not self.white_to_move
-        for move in opponent_moves:
-            if move.end_row == row and move.end_col == col:  # square is under attack
-                return True
-        return False
+        """square attacked by opponent -> king of side to move would be in check there
+
+        (opponent moves can't tell: pawns only capture towards occupied squares)
+        """
+        player_color = self._get_player_color()
+        king_row, king_col = self._get_king_location()
+        self._update_king_location(player_color, *square)
+        in_check, _, _ = self.check_for_pins_and_checks()
+        self._update_king_location(player_color, king_row, king_col)
+        return in_check
 
     def _is_check_mate(self, moves):
         self.check_mate, self.stale_mate = False, False
@@ -649,9 +1051,8 @@ class GameState:
             if self._is_piece_pin(row, col, pin):
                 piece_pinned = True
                 pin_direction = (pin[2], pin[3])
-                self.pins.remove(pin)
-                if rook and self.board[row][col][1] != "Q":
-                    # can't remove queen pin from, only bishop moves
+                if not rook or self.board[row][col][1] != "Q":
+                    # can't remove queen pin from rook moves, only bishop moves
                     self.pins.remove(pin)
                 break
 
@@ -661,6 +1062,20 @@ class GameState:
     # static methods
     # ==============================================================
 
+    @staticmethod
+    def _get_castle_rights_key(castle_rights):
+        return ZOBRIST_CASTLE_KEYS[GameState._get_castle_rights_index(castle_rights)]
+
+    @staticmethod
+    def _get_castle_rights_index(castle_rights):
+        """castle rights as 4 bits (same order as CastleRights arguments)"""
+        return (
+            castle_rights.white_king_side
+            | castle_rights.black_king_side << 1
+            | castle_rights.white_queen_side << 2
+            | castle_rights.black_queen_side << 3
+        )
+
     @staticmethod
     def _is_two_square_pawn_advance(move):
         return move.piece_moved[1] == "p" and abs(move.start_row - move.end_row) == 2
@@ -684,8 +1099,11 @@ class GameState:
 
     @staticmethod
     def check_if_valid_move(move, valid_squares, moves):
-        if not (move.end_row, move.end_col) in valid_squares:
-            moves.remove(move)
+        # en passant captures the checking pawn beside its end square
+        captured_square = (move.start_row, move.end_col) if move.is_en_passant else None
+        if (move.end_row, move.end_col) not in valid_squares:
+            if captured_square not in valid_squares:
+                moves.remove(move)
         return moves
 
     @staticmethod
@@ -701,10 +1119,18 @@ class CastleRights:
         white_queen_side=None,
         black_queen_side=None,
     ):
-        self.white_king_side = white_king_side or True
-        self.black_king_side = black_king_side or True
-        self.white_queen_side = white_queen_side or True
-        self.black_queen_side = black_queen_side or True
+        self.white_king_side = white_king_side is not False
+        self.black_king_side = black_king_side is not False
+        self.white_queen_side = white_queen_side is not False
+        self.black_queen_side = black_queen_side is not False
+
+    def copy(self):
+        return CastleRights(
+            self.white_king_side,
+            self.black_king_side,
+            self.white_queen_side,
+            self.black_queen_side,
+        )
 
 
 class Move:
@@ -721,12 +1147,7 @@ class Move:
         self.end_row, self.end_col = end_square
         self.piece_moved = board[self.start_row][self.start_col]
         self.piece_captured = board[self.end_row][self.end_col]
-        self.move_id = (
-            self.start_row * 1000
-            + self.start_col * 100
-            + self.end_row * 10
-            + self.end_col
-        )
+        self.move_id = self.get_move_id(start_square, end_square)
         self.is_pawn_promotion = self.set_pawn_promotion()
         self.is_castle = is_castle or False
         self.is_en_passant = is_en_passant or False
@@ -745,17 +1166,19 @@ class Move:
         return False
 
     def __str__(self):
+        """SAN without disambiguation and check markers -> pgn.get_san() needs position"""
         if self.is_castle:
-            # "0-0"  -> king side castle
-            # "0-0-0"  -> queen side castle
-            return "0-0" if self.end_col == 6 else "0-0-0"
+            # "O-O"  -> king side castle
+            # "O-O-O"  -> queen side castle
+            return "O-O" if self.end_col == 6 else "O-O-O"
 
         end_square = self._get_rank_file(self.end_row, self.end_col)
         piece_moved = self.piece_moved[1]
         if piece_moved == "p":
+            promotion = "=Q" if self.is_pawn_promotion else ""
             if self.is_capture:
-                return f"{self.cols_to_files[self.start_col]}x{end_square}"
-            return end_square
+                return f"{self.cols_to_files[self.start_col]}x{end_square}{promotion}"
+            return end_square + promotion
 
         move_string = piece_moved
         if self.is_capture:
@@ -764,6 +1187,15 @@ class Move:
 
     # ==============================================================
 
+    @staticmethod
+    def get_move_id(start_square, end_square):
+        return (
+            start_square[0] * 1000
+            + start_square[1] * 100
+            + end_square[0] * 10
+            + end_square[1]
+        )
+
     def set_pawn_promotion(self):
         return (self.piece_moved in ("wp", "bp")) and (self.end_row in (0, 7))
 
@@ -772,5 +1204,44 @@ class Move:
             self.end_row, self.end_col
         )
 
+    def get_uci_notation(self):
+        # engine always promotes to queen
+        return self.get_chess_notation() + ("q" if self.is_pawn_promotion else "")
+
     def _get_rank_file(self, row, col):
         return self.cols_to_files[col] + self.rows_to_ranks[row]
+
+
+class MoveIndex(list):
+    """valid moves with O(1) lookups by start square and by (start, end) squares
+
+    index is built on first lookup -> reordering is fine, adding/removing moves is not
+    """
+
+    def __init__(self, moves=()):
+        super().__init__(moves)
+        self._moves_by_square = None
+        self._moves_by_id = None
+
+    def get_moves_from(self, square):
+        """valid moves of piece on square (row, col)"""
+        if self._moves_by_id is None:
+            self._build_index()
+        return self._moves_by_square.get(square, [])
+
+    def find(self, start_square, end_square):
+        """valid move from start to end square (e.g. a click) or None"""
+        return self.get_by_id(Move.get_move_id(start_square, end_square))
+
+    def get_by_id(self, move_id):
+        """valid move with move_id or None -> validates hash, killer and ponder moves"""
+        if self._moves_by_id is None:
+            self._build_index()
+        return self._moves_by_id.get(move_id)
+
+    def _build_index(self):
+        self._moves_by_square, self._moves_by_id = {}, {}
+        for move in self:
+            start_square = (move.start_row, move.start_col)
+            self._moves_by_square.setdefault(start_square, []).append(move)
+            self._moves_by_id[move.move_id] = move
@@ -0,0 +1,288 @@
+"""Differential fuzzer: plays games with chess_engine.GameState and python-chess chess.Board
+in lockstep and compares them after every ply. Run `python fuzz.py --help` for options.
+
+compared: board, side to move, legal moves (without underpromotions, the engine always
+promotes to a queen), check, checkmate, stalemate, castle rights, en passant square and
+the incrementally updated zobrist and pawn keys. The first mismatch of a field is shrunk
+to the latest position of the game that still reproduces it, then pieces are removed as
+long as it still does. Relative move generation throughput is reported at the end.
+"""
+import argparse
+import random
+import time
+
+import chess
+
+import accel
+import chess_engine
+
+# ======================
+# GLOBAL VARIABLES
+# ======================
+FUZZ_FENS = (  # start positions of games -> perft positions full of special moves
+    chess_engine.START_FEN,
+    "r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1",
+    "8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1",
+    "r3k2r/Pppp1ppp/1b3nbN/nP6/BBP1P3/q4N2/Pp1P2PP/R2Q1RK1 w kq - 0 1",
+    "rnbq1k1r/pp1Pbppp/2p5/8/2B5/8/PPP1NnPP/RNBQK2R w KQ - 1 8",
+    "r4rk1/1pp1qppp/p1np1n2/2b1p1B1/2B1P1b1/P1NP1N2/1PP1QPPP/R4RK1 w - - 0 10",
+    "8/8/8/K2pP2q/8/8/8/7k w - d6 0 1",  # en passant would expose the king
+    "4k3/1P6/8/8/8/8/6p1/4K2R w K - 0 1",  # promotions and castling next to them
+)
+FIELDS = (
+    "board",
+    "white_to_move",
+    "moves",
+    "check",
+    "checkmate",
+    "stalemate",
+    "castling",
+    "en_passant",
+    "zobrist",
+)
+# ======================
+
+
+def get_engine_state(game_state):
+    """compared fields of GameState -> generates its moves"""
+    valid_moves = game_state.get_valid_moves()
+    rights = game_state.current_castling_rights
+    en_passant = None
+    if game_state.en_passant_possible_move:
+        row, col = game_state.en_passant_possible_move
+        en_passant = chess.square_name(chess.square(col, 7 - row))
+    fresh_state = chess_engine.GameState()  # key computed from scratch
+    fresh_state.load_fen(game_state.get_fen())
+    return {
+        "board": game_state.get_fen().split()[0],
+        "white_to_move": game_state.white_to_move,
+        "moves": frozenset(move.get_uci_notation() for move in valid_moves),
+        "check": game_state.in_check,
+        "checkmate": game_state.check_mate,
+        "stalemate": game_state.stale_mate,
+        "castling": (
+            rights.white_king_side,
+            rights.white_queen_side,
+            rights.black_king_side,
+            rights.black_queen_side,
+        ),
+        "en_passant": en_passant,
+        "zobrist": (
+            game_state.zobrist_key == fresh_state.zobrist_key
+            and game_state.pawn_key == fresh_state.pawn_key
+        ),
+    }
+
+
+def get_board_state(board):
+    """compared fields of python-chess board"""
+    return {
+        "board": board.board_fen(),
+        "white_to_move": board.turn == chess.WHITE,
+        "moves": frozenset(
+            move.uci()
+            for move in board.legal_moves
+            if move.promotion in (None, chess.QUEEN)
+        ),
+        "check": board.is_check(),
+        "checkmate": board.is_checkmate(),
+        "stalemate": board.is_stalemate(),
+        "castling": (
+            board.has_kingside_castling_rights(chess.WHITE),
+            board.has_queenside_castling_rights(chess.WHITE),
+            board.has_kingside_castling_rights(chess.BLACK),
+            board.has_queenside_castling_rights(chess.BLACK),
+        ),
+        "en_passant": chess.square_name(board.ep_square)
+        if board.ep_square is not None
+        else None,
+        "zobrist": True,
+    }
+
+
+def compare(game_state, board):
+    """(field, engine value, python-chess value) of first differing field or None"""
+    engine_state, board_state = get_engine_state(game_state), get_board_state(board)
+    for field in FIELDS:
+        if engine_state[field] != board_state[field]:
+            return field, engine_state[field], board_state[field]
+    return None
+
+
+def setup(fen):
+    game_state = chess_engine.GameState()
+    game_state.load_fen(fen)
+    return game_state, chess.Board(fen)
+
+
+def replay(fen, uci_moves):
+    """replays moves from fen in lockstep -> (ply, field, engine value, python-chess value)
+    of first mismatch, None if there is none or a move is illegal in python-chess
+    """
+    game_state, board = setup(fen)
+    for ply in range(len(uci_moves) + 1):
+        mismatch = compare(game_state, board)
+        if mismatch is not None:
+            return (ply, *mismatch)
+        if ply == len(uci_moves):
+            return None
+
+        move = chess.Move.from_uci(uci_moves[ply])
+        engine_move = find_engine_move(game_state, uci_moves[ply])
+        if move not in board.legal_moves or engine_move is None:
+            return None
+        board.push(move)
+        game_state.make_move(engine_move)
+
+
+def find_engine_move(game_state, uci_move):
+    for move in game_state.get_valid_moves():
+        if move.get_uci_notation() == uci_move:
+            return move
+    return None
+
+
+def play_game(fen, rng, max_plies, adversarial, timings):
+    """random game in lockstep -> (uci moves, mismatch of replay() or None)
+
+    with probability adversarial a move is picked among captures, checks, castles,
+    promotions and king moves, which are the moves move generators get wrong
+    """
+    game_state, board = setup(fen)
+    uci_moves = []
+    for ply in range(max_plies + 1):
+        mismatch = compare(game_state, board)
+        if mismatch is not None:
+            return uci_moves, (ply, *mismatch)
+
+        start = time.perf_counter()
+        valid_moves = game_state.get_valid_moves()
+        timings["engine"] += time.perf_counter() - start
+        start = time.perf_counter()
+        list(board.legal_moves)
+        timings["python-chess"] += time.perf_counter() - start
+        timings["positions"] += 1
+        if not valid_moves:
+            break
+
+        move = choose_move(valid_moves, board, rng, adversarial)
+        uci_moves.append(move.get_uci_notation())
+        board.push(chess.Move.from_uci(uci_moves[-1]))
+        game_state.make_move(move)
+    return uci_moves, None
+
+
+def choose_move(valid_moves, board, rng, adversarial):
+    if rng.random() < adversarial:
+        special_moves = [
+            move
+            for move in valid_moves
+            if move.is_capture
+            or move.is_castle
+            or move.is_pawn_promotion
+            or move.piece_moved[1] == "K"
+            or board.gives_check(chess.Move.from_uci(move.get_uci_notation()))
+        ]
+        if special_moves:
+            return rng.choice(special_moves)
+    return rng.choice(valid_moves)
+
+
+def shrink(fen, uci_moves, field):
+    """smallest reproduction of a mismatch of field -> (fen, uci moves, mismatch)"""
+    board, positions = chess.Board(fen), [fen]
+    for uci_move in uci_moves:
+        board.push_uci(uci_move)
+        positions.append(board.fen(en_passant="fen"))  # engine keeps pseudo ep squares
+
+    for start in range(len(uci_moves), -1, -1):  # latest start -> shortest replay
+        mismatch = replay(positions[start], uci_moves[start:])
+        if mismatch is not None and mismatch[1] == field:
+            break
+    fen, uci_moves = positions[start], uci_moves[start:]
+
+    removed = True
+    while removed:  # remove pieces one at a time while mismatch persists
+        removed, board = False, chess.Board(fen)
+        for square, piece in board.piece_map().items():
+            if piece.piece_type == chess.KING:
+                continue
+            candidate = board.copy()
+            candidate.remove_piece_at(square)
+            candidate.castling_rights = candidate.clean_castling_rights()
+            if not candidate.is_valid():
+                continue
+            candidate_fen = candidate.fen(en_passant="fen")
+            candidate_mismatch = replay(candidate_fen, uci_moves)
+            if candidate_mismatch is not None and candidate_mismatch[1] == field:
+                fen, mismatch, removed = candidate_fen, candidate_mismatch, True
+                break
+    return fen, uci_moves, mismatch
+
+
+def format_mismatch(fen, uci_moves, mismatch):
+    ply, field, engine_value, board_value = mismatch
+    lines = [f"  {field} after {ply} plies", f"  fen   {fen}"]
+    if uci_moves:
+        lines.append(f"  moves {' '.join(uci_moves[:ply])}")
+    if field == "moves":
+        lines.append(f"  engine only       {sorted(engine_value - board_value)}")
+        lines.append(f"  python-chess only {sorted(board_value - engine_value)}")
+    else:
+        lines.append(f"  engine {engine_value} python-chess {board_value}")
+    return "\n".join(lines)
+
+
+def run_fuzzer(args):
+    rng = random.Random(args.seed)
+    timings = {"engine": 0.0, "python-chess": 0.0, "positions": 0}
+    mismatches = {}  # field -> shrunk reproduction
+    failed_games = 0
+    for game in range(args.games):
+        fen = FUZZ_FENS[game % len(FUZZ_FENS)]
+        uci_moves, mismatch = play_game(
+            fen, rng, args.max_plies, args.adversarial, timings
+        )
+        if mismatch is None:
+            continue
+
+        failed_games += 1
+        field = mismatch[1]
+        if field not in mismatches:
+            mismatches[field] = shrink(fen, uci_moves[: mismatch[0]], field)
+            print(f"game {game}: mismatch\n{format_mismatch(*mismatches[field])}")
+
+    print(
+        f"{args.games} games, {timings['positions']} positions, "
+        f"{failed_games} games with mismatches ({', '.join(mismatches) or 'none'})"
+    )
+    for name in ("engine", "python-chess"):
+        positions_per_second = timings["positions"] / max(timings[name], 1e-9)
+        print(f"{name:<13} {positions_per_second:>9.0f} move generations/s")
+    print(
+        f"engine is {timings['python-chess'] / timings['engine']:.2f}x python-chess "
+        f"({accel.BACKEND} backend)"
+    )
+    return not mismatches
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--games", type=int, default=100)
+    parser.add_argument("--max-plies", type=int, default=200)
+    parser.add_argument(
+        "--adversarial",
+        type=float,
+        default=0.5,
+        help="probability of picking a capture/check/castle/promotion/king move",
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    raise SystemExit(0 if run_fuzzer(args) else 1)
+
+
+if __name__ == "__main__":
+
+    main()
@@ -1,22 +1,43 @@
 """Main driver file. Handles user input and displays current GameState object"""
 import os
-from multiprocessing import Process, Queue
-
-import pygame as pg
+import time
+from multiprocessing import Event, Pipe, Process, Queue
 
 import chess_engine
 import chess_ai as ai
-from settings import *
+import pgn
+from settings import (
+    BOARD_HEIGHT,
+    BOARD_WIDTH,
+    DIMENSION,
+    MAX_FPS,
+    MOVE_LOG_PANEL_HEIGHT,
+    MOVE_LOG_PANEL_WIDTH,
+    SQ_SIZE,
+)
+
+pg = None  # pygame -> imported by main(), search processes re-importing this module skip it
 
 # ======================
 # GLOBAL VARIABLES
 IMAGES = {}
-COLORS = [pg.Color("white"), pg.Color("gray")]
+COLORS = ["white", "gray"]
+PLIES_PER_LOG_LINE = 6  # 3 moves per move log line
+ANIMATION_MS_PER_SQUARE = 60
+ANIMATION_MAX_MS = 400
+ANIMATION_FPS = 60
+MOVE_LOG_PADDING = 5
+MOVE_LOG_LINE_SPACING = 2
+STATUS_LINES = 4  # clock and search progress lines below move log
+TIME_CONTROL = (5 * 60, 3)  # (base, increment) seconds per side -> None for untimed games
 # ======================
 
 
 def main():
     """main driver --> Handles user input and update graphics"""
+    global pg
+    import pygame as pg
+
     pg.init()
     screen = pg.display.set_mode((BOARD_WIDTH + MOVE_LOG_PANEL_WIDTH, BOARD_HEIGHT))
     clock = pg.time.Clock()
@@ -24,17 +45,21 @@ def main():
     move_log_font = pg.font.SysFont("Arial", 14, False, False)
 
     game_state = chess_engine.GameState()
-    valid_moves = game_state.get_valid_moves()
-    move_made, animate = False, False
+    valid_moves = game_state.get_valid_moves(indexed=True)
+    move_made, animate, animation = False, False, None
     load_images()
+    renderer = Renderer(screen, move_log_font)
 
     running = True
     square_selected = ()  # keeps track of last click
     player_clicks = []  # keeps track of players clicks
     game_over = False
     player_one, player_two = True, True
-    ai_thinking, move_finder_process = False, None
+    ai_thinking, move_finder, search_progress = False, None, None
+    ponder = True  # search expected reply on opponent's time
+    ponder_worker, ponder_move, expected_reply = None, None, None
     move_undone = False
+    game_clock = GameClock(*TIME_CONTROL) if TIME_CONTROL else None
     while running:
         human_turn = is_human_turn(game_state, player_one, player_two)
         for event in pg.event.get():
@@ -53,63 +78,94 @@ def main():
                     player_clicks.append(square_selected)
 
                 if len(player_clicks) == 2 and human_turn:
-                    move = chess_engine.Move(
-                        player_clicks[0], player_clicks[1], game_state.board
-                    )
-                    for valid_move in valid_moves:
-                        if move == valid_move:
-                            # for move in valid_moves:
-                            game_state.make_move(valid_move)
-                            move_made, animate = True, True
-                            square_selected = ()
-                            player_clicks = []
-
-                        if not move_made:
-                            player_clicks = [square_selected]
+                    valid_move = valid_moves.find(*player_clicks)
+                    if valid_move is not None:
+                        game_state.make_move(valid_move)
+                        move_made, animate = True, True
+                        square_selected, player_clicks = (), []
+                    else:  # second click selects another piece
+                        player_clicks = [square_selected]
 
             elif event.type == pg.KEYDOWN:
                 if event.key == pg.K_z:  # press z -> undo move
                     game_state.undo_move()
                     move_made, animate, game_over = True, False, False
                     if ai_thinking:
-                        move_finder_process.terminate()
-                        ai_thinking = False
+                        move_finder.terminate()
+                        ai_thinking, search_progress = False, None
+                    ponder_worker, expected_reply = stop_pondering(ponder_worker)
                     move_undone = True
 
+                if event.key == pg.K_m and ai_thinking:  # press m -> AI moves now
+                    move_finder.move_now()
+
                 if event.key == pg.K_r:  # press r -> reset board
+                    ponder_worker, expected_reply = stop_pondering(ponder_worker)
                     game_state = chess_engine.GameState()
-                    valid_moves = game_state.get_valid_moves()
+                    valid_moves = game_state.get_valid_moves(indexed=True)
                     square_selected, player_clicks = (), []
                     move_made, animate, game_over = False, False, False
+                    animation = None
                     move_undone = True
+                    game_clock = GameClock(*TIME_CONTROL) if TIME_CONTROL else None
 
         if not game_over and not human_turn and not move_undone:
+            if not ai_thinking and ponder_worker is not None:
+                if game_state.move_log[-1] == expected_reply:  # ponder hit
+                    print("Ponder hit...")
+                    move_finder, ponder_worker, ai_thinking = ponder_worker, None, True
+                    move_finder.ponder_hit()
+                else:  # ponder miss -> search from scratch
+                    ponder_worker, expected_reply = stop_pondering(ponder_worker)
+
             if not ai_thinking:
                 ai_thinking = True
                 print("Thinking...")
-                return_queue = Queue()  # used to pass data between threads
-                move_finder_process = Process(
-                    target=ai.find_best_move, args=(game_state, valid_moves, return_queue)
+                move_finder = SearchWorker(
+                    game_state,
+                    valid_moves,
+                    time_manager=get_time_manager(
+                        game_clock, game_state, ai_to_move=True
+                    ),
                 )
-                move_finder_process.start()
                 # ai_move = ai.find_best_move(game_state, valid_moves)
 
-            if not move_finder_process.is_alive():
+            search_progress = move_finder.poll_progress() or search_progress
+            if move_finder.is_done():
                 print("Done thinking...")
-                ai_move = return_queue.get()
+                ai_move, pv = move_finder.get_result()
                 if not ai_move:
                     ai_move = ai.find_random_move(valid_moves)
                 game_state.make_move(ai_move)
                 move_made, animate, ai_thinking = True, True, False
+                search_progress = None
+                if (
+                    ponder
+                    and len(pv) > 1
+                    and is_human_turn(game_state, player_one, player_two)
+                ):
+                    ponder_move = pv[1]
 
         if move_made:
-            if animate:
-                animate_move(game_state.move_log[-1], screen, game_state.board, clock)
-            valid_moves = game_state.get_valid_moves()
+            # a new move replaces (skips) an animation still running
+            animation = MoveAnimation(game_state.move_log[-1]) if animate else None
+            valid_moves = game_state.get_valid_moves(indexed=True)
+            if game_clock is not None:
+                game_clock.switch(add_increment=not move_undone)
             move_made, move_undone = False, False
+            if ponder_move is not None:
+                ponder_worker, expected_reply = start_pondering(
+                    game_state,
+                    valid_moves,
+                    ponder_move,
+                    get_time_manager(game_clock, game_state, ai_to_move=False),
+                )
+                ponder_move = None
 
-        draw_game_state(screen, game_state, valid_moves, square_selected, move_log_font)
+        if ponder_worker is not None:
+            ponder_worker.poll_progress()  # drain pipe -> worker must not block on send
 
+        message = None
         if game_state.check_mate or game_state.stale_mate:
             game_over = True
             message = "stale_mate"
@@ -118,10 +174,181 @@ def main():
             else:
                 winner_color = "Black" if game_state.white_to_move else "White"
                 message = f"{winner_color} wins by checkmate!"
-            draw_end_game_text(screen, message)
+        elif game_state.is_draw_by_repetition():
+            game_over = True
+            message = "Draw by repetition"
+        elif game_state.is_draw_by_fifty_move_rule():
+            game_over = True
+            message = "Draw by fifty-move rule"
+        elif game_clock is not None and game_clock.is_flagged(game_state.white_to_move):
+            game_over = True
+            message = f"{'Black' if game_state.white_to_move else 'White'} wins on time"
+        if game_over and game_clock is not None:
+            game_clock.stop()
+
+        if animation is not None and animation.is_done():
+            animation = None
+        renderer.draw(
+            game_state,
+            valid_moves,
+            square_selected,
+            message,
+            animation,
+            format_clock(game_clock) + format_search_progress(search_progress),
+        )
+        clock.tick(ANIMATION_FPS if animation else MAX_FPS)
+        renderer.update_display()
+
+    # searches don't end on their own while pondering (or on infinite limits) and would
+    # keep the interpreter from exiting -> not daemonic, mcts workers start processes
+    if ai_thinking:
+        move_finder.terminate()
+    stop_pondering(ponder_worker)
+
+
+class SearchWorker:
+    """runs AI search in a separate process
+
+    progress (depth, best move, score, nodes/sec) is streamed back over a pipe and the
+    search can be told to return its current best move at once
+    """
+
+    def __init__(self, game_state, valid_moves, pondering=False, time_manager=None):
+        self.return_queue = Queue()  # used to pass data between processes
+        self.stop_event = Event()
+        self.ponder_hit_event = Event() if pondering else None
+        self.progress_receiver, progress_sender = Pipe(duplex=False)
+        self.process = Process(
+            target=ai.find_best_move,
+            args=(
+                game_state,
+                valid_moves,
+                self.return_queue,
+                self.ponder_hit_event,
+                self.stop_event,
+                progress_sender,
+                time_manager,
+            ),
+        )
+        self.process.start()
+
+    def ponder_hit(self):
+        self.ponder_hit_event.set()
+
+    def move_now(self):
+        self.stop_event.set()
+
+    def poll_progress(self):
+        """latest progress sent by the worker since last poll (None if nothing new)"""
+        progress = None
+        while self.progress_receiver.poll():
+            progress = self.progress_receiver.recv()
+        return progress
+
+    def is_done(self):
+        return not self.process.is_alive()
+
+    def get_result(self):
+        """(best_move, pv)"""
+        return self.return_queue.get()
+
+    def terminate(self):
+        self.process.terminate()
+
+
+def start_pondering(game_state, valid_moves, ponder_move, time_manager=None):
+    """searches position after expected reply until human moves (time_manager limits
+    the search after a ponder hit)
+
+    returns (SearchWorker, expected_reply)
+    """
+    expected_reply = valid_moves.get_by_id(ponder_move.move_id)
+    if expected_reply is None:
+        return None, None
+
+    game_state.make_move(expected_reply)
+    ponder_worker = SearchWorker(
+        game_state, game_state.get_valid_moves(), True, time_manager
+    )
+    game_state.undo_move()
+    return ponder_worker, expected_reply
+
+
+def stop_pondering(ponder_worker):
+    if ponder_worker is not None:
+        ponder_worker.terminate()
+    return None, None
+
+
+class GameClock:
+    """remaining time of both sides -> the clock of the side to move runs"""
+
+    def __init__(self, base, increment):
+        self.remaining = {True: base, False: base}  # white -> seconds
+        self.increment = increment
+        self.white_running = True
+        self.turn_start = time.perf_counter()  # None -> clock is stopped
+
+    def get_remaining(self, white):
+        remaining = self.remaining[white]
+        if white == self.white_running and self.turn_start is not None:
+            remaining -= time.perf_counter() - self.turn_start
+        return remaining
+
+    def is_flagged(self, white):
+        return self.get_remaining(white) <= 0
+
+    def switch(self, add_increment=True):
+        """running side made its move (or a move was undone) -> other side's clock runs"""
+        self.remaining[self.white_running] = self.get_remaining(self.white_running)
+        if add_increment:
+            self.remaining[self.white_running] += self.increment
+        self.white_running = not self.white_running
+        self.turn_start = time.perf_counter()
+
+    def stop(self):
+        self.remaining[self.white_running] = self.get_remaining(self.white_running)
+        self.turn_start = None
+
+
+def get_time_manager(game_clock, game_state, ai_to_move):
+    """ai.TimeManager of AI's next move (None in untimed games)
+
+    ai_to_move=False -> AI moves after the opponent's move (pondering)
+    """
+    if game_clock is None:
+        return None
+    white = game_state.white_to_move == ai_to_move
+    return ai.TimeManager(
+        game_clock.get_remaining(white),
+        game_clock.increment,
+        (len(game_state.move_log) + (not ai_to_move)) // 2,
+    )
 
-        clock.tick(MAX_FPS)
-        pg.display.flip()
+
+def format_clock(game_clock):
+    """status line of clocks (empty list in untimed games)"""
+    if game_clock is None:
+        return []
+
+    times = []
+    for white in (True, False):
+        minutes, seconds = divmod(max(game_clock.get_remaining(white), 0), 60)
+        times.append(f"{int(minutes)}:{seconds:04.1f}")
+    return [f"White {times[0]}   Black {times[1]}"]
+
+
+def format_search_progress(search_progress):
+    """status lines for move log panel"""
+    if search_progress is None:
+        return []
+
+    depth, best_move, score, nodes_per_second, eval_hit_rate = search_progress
+    return [
+        f"depth {depth}  best {best_move or '-'}  score {score:+.2f}",
+        f"{nodes_per_second} nodes/s   press m to move now",
+        f"eval cache hits {eval_hit_rate:.0%}",
+    ]
 
 
 def load_images():
@@ -139,29 +366,186 @@ def is_human_turn(game_state, player_one, player_two):
     )
 
 
-def draw_game_state(screen, game_state, valid_moves, square_selected, move_log_font):
-    """implements all graphics within current game state"""
-    draw_board(screen)
-    highlight_squares(screen, game_state, valid_moves, square_selected)
-    draw_pieces(screen, game_state.board)
-    draw_move_log(screen, game_state, move_log_font)
+class Renderer:
+    """draws game state, repainting only squares and move log lines that changed
+
+    board background and move log lines are rendered once and cached, the display is
+    updated with the dirty rects of the frame only
+    """
 
+    def __init__(self, screen, move_log_font):
+        self.screen = screen
+        self.move_log_font = move_log_font
+        self.board_background = pg.Surface((BOARD_WIDTH, BOARD_HEIGHT))
+        draw_board(self.board_background)
+        self.highlight_surfaces = {}
+        for color in ("blue", "yellow"):
+            surface = pg.Surface((SQ_SIZE, SQ_SIZE))
+            surface.set_alpha(100)  # add a little transparency
+            surface.fill(pg.Color(color))
+            self.highlight_surfaces[color] = surface
 
-def highlight_squares(screen, game_state, valid_moves, square_selected):
-    """Highlights square selected and moves for piece selected"""
-    if not square_selected:
-        return
+        self.move_log_rect = pg.Rect(
+            BOARD_WIDTH, 0, MOVE_LOG_PANEL_WIDTH, MOVE_LOG_PANEL_HEIGHT
+        )
+        # search progress is shown at the bottom of the move log panel
+        status_height = STATUS_LINES * (
+            move_log_font.get_height() + MOVE_LOG_LINE_SPACING
+        )
+        self.status_rect = pg.Rect(
+            BOARD_WIDTH,
+            MOVE_LOG_PANEL_HEIGHT - status_height - MOVE_LOG_PADDING,
+            MOVE_LOG_PANEL_WIDTH,
+            status_height + MOVE_LOG_PADDING,
+        )
+        self.drawn_squares = {}  # (row, col) -> (piece, highlight) currently on screen
+        self.drawn_moves = []  # moves of move log currently on screen
+        self.drawn_san_moves = []  # their SAN
+        self.move_log_lines = []  # rendered move log lines
+        self.end_game_message = None
+        self.animation_rect = None  # where animated piece was drawn last frame
+        self.dirty_rects = []
+        self.invalidate()
+
+    def invalidate(self):
+        """forces full redraw on next frame (e.g. after something else drew on screen)"""
+        self.drawn_squares, self.drawn_moves, self.move_log_lines = {}, [], []
+        self.drawn_san_moves = []
+        self.drawn_status = None
+        self.screen.blit(self.board_background, (0, 0))
+        pg.draw.rect(self.screen, pg.Color("black"), self.move_log_rect)
+        self.dirty_rects = [self.screen.get_rect()]
+
+    def draw(
+        self,
+        game_state,
+        valid_moves,
+        square_selected,
+        end_game_message=None,
+        animation=None,
+        status_lines=None,
+    ):
+        """implements all graphics within current game state"""
+        if end_game_message != self.end_game_message:
+            self.end_game_message = end_game_message
+            self.invalidate()  # text is drawn over squares -> repaint them
+
+        if self.animation_rect is not None:  # repaint squares below last piece position
+            for square in self._get_squares_touched(self.animation_rect):
+                self.drawn_squares.pop(square, None)
+            self.animation_rect = None
+
+        highlights = self._get_highlights(game_state, valid_moves, square_selected)
+        overrides = animation.get_square_overrides() if animation else {}
+        for row in range(DIMENSION):
+            for col in range(DIMENSION):
+                piece = overrides.get((row, col), game_state.board[row][col])
+                square = (piece, highlights.get((row, col)))
+                if self.drawn_squares.get((row, col)) != square:
+                    self._draw_square(row, col, *square)
+                    self.drawn_squares[(row, col)] = square
+
+        if animation is not None:
+            self.animation_rect = animation.get_piece_rect()
+            self.screen.blit(IMAGES[animation.move.piece_moved], self.animation_rect)
+            self.dirty_rects.append(self.animation_rect)
+
+        self._draw_move_log(game_state)
+        self._draw_status(status_lines)
+        if end_game_message and self.dirty_rects:
+            draw_end_game_text(self.screen, end_game_message)
+            self.dirty_rects.append(pg.Rect(0, 0, BOARD_WIDTH, BOARD_HEIGHT))
+
+    def update_display(self):
+        if self.dirty_rects:
+            pg.display.update(self.dirty_rects)
+            self.dirty_rects = []
+
+    def _get_highlights(self, game_state, valid_moves, square_selected):
+        """square selected and moves for piece selected -> {(row, col): color}"""
+        highlights = {}
+        if not square_selected:
+            return highlights
+
+        row, col = square_selected
+        if is_piece_color_same_as_player_color(game_state, row, col):
+            highlights[(row, col)] = "blue"
+            for move in valid_moves.get_moves_from((row, col)):
+                highlights[(move.end_row, move.end_col)] = "yellow"
+        return highlights
+
+    @staticmethod
+    def _get_squares_touched(rect):
+        rows = range(rect.top // SQ_SIZE, min((rect.bottom - 1) // SQ_SIZE, 7) + 1)
+        cols = range(rect.left // SQ_SIZE, min((rect.right - 1) // SQ_SIZE, 7) + 1)
+        return [(row, col) for row in rows for col in cols]
+
+    def _draw_square(self, row, col, piece, highlight):
+        square_rect = pg.Rect(col * SQ_SIZE, row * SQ_SIZE, SQ_SIZE, SQ_SIZE)
+        self.screen.blit(self.board_background, square_rect, square_rect)
+        if highlight:
+            self.screen.blit(self.highlight_surfaces[highlight], square_rect)
+        if piece != "--":
+            self.screen.blit(IMAGES[piece], square_rect)
+        self.dirty_rects.append(square_rect)
+
+    def _draw_move_log(self, game_state):
+        """re-renders only lines from first move that differs from what is on screen"""
+        move_log = game_state.move_log
+        first_changed = min(len(move_log), len(self.drawn_moves))
+        while (
+            first_changed
+            and move_log[first_changed - 1] is not self.drawn_moves[first_changed - 1]
+        ):
+            first_changed -= 1
+        if first_changed == len(move_log) == len(self.drawn_moves):
+            return
+
+        # SAN depends on the position -> only moves after first_changed are converted
+        self.drawn_san_moves[first_changed:] = pgn.get_san_moves(
+            game_state, first_changed
+        )
+        first_line = first_changed // PLIES_PER_LOG_LINE
+        del self.move_log_lines[first_line:]
+        for i in range(
+            first_line * PLIES_PER_LOG_LINE, len(move_log), PLIES_PER_LOG_LINE
+        ):
+            move_text = ""
+            for j in range(i, min(i + PLIES_PER_LOG_LINE, len(move_log))):
+                if j % 2 == 0:
+                    move_text += f"{j // 2 + 1}. "
+                move_text += f"{self.drawn_san_moves[j]} "
+            self.move_log_lines.append(
+                self.move_log_font.render(move_text, True, pg.Color("white"))
+            )
+        self.drawn_moves = list(move_log)
 
-    row, col = square_selected
-    if is_piece_color_same_as_player_color(game_state, row, col):
-        surface = pg.Surface((SQ_SIZE, SQ_SIZE))
-        surface.set_alpha(100)  # add a little transparency
-        surface.fill(pg.Color("blue"))
-        screen.blit(surface, (col * SQ_SIZE, row * SQ_SIZE))
-        surface.fill(pg.Color("yellow"))
-        for move in valid_moves:
-            if move.start_row == row and move.start_col == col:
-                screen.blit(surface, (move.end_col * SQ_SIZE, move.end_row * SQ_SIZE))
+        # clear changed lines (including lines removed by undo) and draw new ones
+        line_height = self.move_log_font.get_height() + MOVE_LOG_LINE_SPACING
+        text_y = MOVE_LOG_PADDING + first_line * line_height
+        clear_rect = pg.Rect(
+            BOARD_WIDTH, text_y, MOVE_LOG_PANEL_WIDTH, self.status_rect.top - text_y
+        )
+        pg.draw.rect(self.screen, pg.Color("black"), clear_rect)
+        self.dirty_rects.append(clear_rect)
+        for text_object in self.move_log_lines[first_line:]:
+            if text_y + line_height > self.status_rect.top:
+                break  # keep status area free
+            self.screen.blit(text_object, (BOARD_WIDTH + MOVE_LOG_PADDING, text_y))
+            text_y += line_height
+
+    def _draw_status(self, status_lines):
+        if status_lines == self.drawn_status:
+            return
+
+        self.drawn_status = status_lines
+        pg.draw.rect(self.screen, pg.Color("black"), self.status_rect)
+        self.dirty_rects.append(self.status_rect)
+        text_y = self.status_rect.top
+        for line in status_lines or []:
+            text_object = self.move_log_font.render(line, True, pg.Color("yellow"))
+            self.screen.blit(text_object, (BOARD_WIDTH + MOVE_LOG_PADDING, text_y))
+            text_y += text_object.get_height() + MOVE_LOG_LINE_SPACING
 
 
 def is_piece_color_same_as_player_color(game_state, row, col):
@@ -173,79 +557,45 @@ def draw_board(screen):
     """Draws squares on board"""
     for row in range(DIMENSION):
         for col in range(DIMENSION):
-            color = COLORS[((row + col) % 2)]
+            color = pg.Color(COLORS[((row + col) % 2)])
             pg.draw.rect(
                 screen, color, pg.Rect(col * SQ_SIZE, row * SQ_SIZE, SQ_SIZE, SQ_SIZE)
             )
 
 
-def draw_pieces(screen, board):
-    """Draws pieces on board"""
-    # NOTE: separate from draw_board to do syntax highlighting (less efficient)
-    # NOTE: above square and below piece
-    for row in range(DIMENSION):
-        for col in range(DIMENSION):
-            piece = board[row][col]
-            if piece != "--":
-                screen.blit(
-                    IMAGES[piece], pg.Rect(col * SQ_SIZE, row * SQ_SIZE, SQ_SIZE, SQ_SIZE)
-                )
+class MoveAnimation:
+    """slides piece of a move across the board, driven by the main loop's frame timing
 
+    game state already holds the move -> skipping an animation only means dropping it
+    """
 
-def draw_move_log(screen, game_state, font):
-    """draws move log to the screen"""
-    move_log_rect = pg.Rect(BOARD_WIDTH, 0, MOVE_LOG_PANEL_WIDTH, MOVE_LOG_PANEL_HEIGHT)
-    pg.draw.rect(screen, pg.Color("black"), move_log_rect)
-    move_log = game_state.move_log
-    move_texts = []
-    for i in range(0, len(move_log), 2):
-        move_string = f"{str(i // 2 + 1)}. {str(move_log[i])} "
-        if i + 1 < len(move_log):  # make sure black made a move
-            move_string += f"{str(move_log[i + 1])} "
-        move_texts.append(move_string)
-
-    text_y = padding = 5
-    line_spacing, moves_per_row = 2, 3
-    for i in range(0, len(move_texts), moves_per_row):
-        move_text = ""
-        for j in range(moves_per_row):
-            if i + j < len(move_texts):
-                move_text += move_texts[i + j]
-        text_object = font.render(move_text, True, pg.Color("white"))
-        text_location = move_log_rect.move(padding, text_y)
-        screen.blit(text_object, text_location)
-        text_y += text_object.get_height() + line_spacing
-
-
-def animate_move(move, screen, board, clock):
-    delta_row = move.end_row - move.start_row
-    delta_col = move.end_col - move.start_col
-    frames_per_square = 10  # frames to move one square
-    frame_count = (abs(delta_row) + abs(delta_col)) * frames_per_square
-    for frame in range(frame_count + 1):
-        row = move.start_row + delta_row * (frame / frame_count)
-        col = move.start_col + delta_col * (frame / frame_count)
-        draw_board(screen)
-        draw_pieces(screen, board)
-        color = COLORS[(move.end_row + move.end_col) % 2]
-        end_square = pg.Rect(
-            move.end_col * SQ_SIZE, move.end_row * SQ_SIZE, SQ_SIZE, SQ_SIZE
-        )
-        pg.draw.rect(screen, color, end_square)
-        if move.piece_captured != "--":
-            if move.is_en_passant:
-                row_adder = +1 if move.piece_captured[0] == "b" else -1
-                en_passant_row = move.end_row + row_adder
-                end_square = pg.Rect(
-                    move.end_col * SQ_SIZE, en_passant_row * SQ_SIZE, SQ_SIZE, SQ_SIZE
-                )
-            screen.blit(IMAGES[move.piece_captured], end_square)
-        screen.blit(
-            IMAGES[move.piece_moved],
-            pg.Rect(col * SQ_SIZE, row * SQ_SIZE, SQ_SIZE, SQ_SIZE),
-        )
-        pg.display.flip()
-        clock.tick(60)
+    def __init__(self, move):
+        self.move = move
+        self.start_time = pg.time.get_ticks()
+        squares = abs(move.end_row - move.start_row) + abs(move.end_col - move.start_col)
+        self.duration = min(squares * ANIMATION_MS_PER_SQUARE, ANIMATION_MAX_MS)
+
+    def progress(self):
+        """0 -> piece on start square, 1 -> animation finished"""
+        return min((pg.time.get_ticks() - self.start_time) / self.duration, 1)
+
+    def is_done(self):
+        return self.progress() >= 1
+
+    def get_piece_rect(self):
+        progress, move = self.progress(), self.move
+        row = move.start_row + (move.end_row - move.start_row) * progress
+        col = move.start_col + (move.end_col - move.start_col) * progress
+        return pg.Rect(round(col * SQ_SIZE), round(row * SQ_SIZE), SQ_SIZE, SQ_SIZE)
+
+    def get_square_overrides(self):
+        """squares to show as before the move while piece is sliding"""
+        move = self.move
+        overrides = {(move.end_row, move.end_col): move.piece_captured}
+        if move.is_en_passant:
+            overrides[(move.end_row, move.end_col)] = "--"
+            overrides[(move.start_row, move.end_col)] = move.piece_captured
+        return overrides
 
 
 def draw_end_game_text(screen, message):
@@ -0,0 +1,489 @@
+"""Monte Carlo tree search engine mode (chess_ai.ENGINE_MODE = "mcts").
+
+The tree is stored in flat arrays (node i -> index i of every array). Leaves are estimated
+with chess_ai.evaluate() (optionally after a short random playout) and mapped to a win
+probability. Each worker selects BATCH_SIZE leaves before estimating them, virtual loss
+makes the selections of one batch differ (value net leaves are estimated in one batch).
+With WORKERS > 1 independent trees are searched in worker processes (root parallelism),
+their root statistics are merged for the best move at any time.
+"""
+import math
+import random
+import sys
+import time
+from array import array
+from multiprocessing import get_context
+from queue import Empty
+
+import chess_ai as ai
+
+# ======================
+# GLOBAL VARIABLES
+# ======================
+SELECTION = "puct"  # "uct" -> UCB1 without priors
+UCT_EXPLORATION = 1.4
+PUCT_EXPLORATION = 1.5
+CAPTURE_PRIOR = 3  # prior weight of captures and promotions, quiet moves -> 1
+LEAF_ESTIMATE = "evaluation"  # "playout" -> random moves before evaluating
+PLAYOUT_PLIES = 4
+EVAL_SCALE = 4  # pawns -> win probability 1 / (1 + 10 ** (-score / EVAL_SCALE))
+VIRTUAL_LOSS = 1  # visits (without value) added to a path while its leaf is pending
+BATCH_SIZE = 8  # leaves selected before they are estimated
+ROOT_NOISE = 0.25  # share of random root priors -> trees of parallel workers differ
+WORKERS = 1  # processes searching independent trees (root parallelism)
+ITERATIONS_PER_DEPTH = 500  # budget without movetime -> SearchLimits.depth * this
+REPORT_INTERVAL = 0.1  # seconds between root statistics sent by worker processes
+TIME_CHECKS_PER_OPTIMUM = 10  # soft limit checks of clock games per planned move time
+# workers are spawned (forking a thread of the UCI engine can deadlock) -> they get these
+WORKER_SETTINGS = {
+    "chess_ai": ("EVALUATION", "value_network", "nnue_network"),
+    "mcts": (
+        "SELECTION",
+        "UCT_EXPLORATION",
+        "PUCT_EXPLORATION",
+        "CAPTURE_PRIOR",
+        "LEAF_ESTIMATE",
+        "PLAYOUT_PLIES",
+        "EVAL_SCALE",
+        "VIRTUAL_LOSS",
+        "BATCH_SIZE",
+        "ROOT_NOISE",
+        "REPORT_INTERVAL",
+    ),
+}
+# ======================
+
+
+class MctsTree:
+    """search tree of one worker in flat arrays"""
+
+    def __init__(self, game_state, valid_moves, seed=None):
+        self.game_state = game_state
+        self.rng = random.Random(seed)
+        self.parent = array("i", [-1])
+        self.first_child = array("i", [0])
+        self.child_count = array("i", [-1])  # -1 -> not expanded, 0 -> terminal
+        self.visits = array("i", [0])
+        self.value_sum = array("d", [0.0])  # results for the player who moved into node
+        self.prior = array("d", [1.0])
+        self.moves = [None]
+        self.terminal_values = {}  # node -> value for side to move (mate 0, draw 0.5)
+        self.iterations = 0
+        self._expand(0, valid_moves)
+        if seed is not None:  # worker of a parallel search
+            noise = [self.rng.random() for _ in valid_moves]
+            for child, child_noise in zip(range(1, len(self.moves)), noise):
+                self.prior[child] = (1 - ROOT_NOISE) * self.prior[
+                    child
+                ] + ROOT_NOISE * child_noise / sum(noise)
+
+    # ==============================================================
+    # any time queries
+    # ==============================================================
+
+    def root_statistics(self):
+        """[(move_id, visits, value_sum)] of root children -> merged across workers"""
+        first = self.first_child[0]
+        return [
+            (self.moves[child].move_id, self.visits[child], self.value_sum[child])
+            for child in range(first, first + self.child_count[0])
+        ]
+
+    def get_pv(self):
+        """most visited moves from root"""
+        pv, node = [], 0
+        while self.child_count[node] > 0:
+            first = self.first_child[node]
+            children = range(first, first + self.child_count[node])
+            node = max(children, key=lambda child: self.visits[child])
+            if not self.visits[node]:
+                break
+            pv.append(self.moves[node])
+        return pv
+
+    # ==============================================================
+    # search
+    # ==============================================================
+
+    def run_batch(self, batch_size=BATCH_SIZE):
+        """selects, expands and estimates batch_size leaves, then backs up their values"""
+        leaves, pending_planes = [], []
+        for _ in range(batch_size):
+            node = self._select()
+            value, planes = self._estimate_leaf(node)
+            if planes is not None:
+                pending_planes.append(planes)
+            leaves.append((node, value, self.game_state.white_to_move))
+            for _ in range(self._moves_made):
+                self.game_state.undo_move()
+
+        if pending_planes:  # value net -> one inference for the whole batch
+            values = iter(ai.value_network.predict(pending_planes).tolist())
+        for node, value, white_to_move in leaves:
+            if value is None:  # value net output is for white
+                value = (next(values) + 1) / 2
+                value = value if white_to_move else 1 - value
+            self._backup(node, value)
+        self.iterations += batch_size
+
+    def _select(self):
+        """descends to a leaf (making its moves) and adds virtual loss on the way"""
+        node, self._moves_made = 0, 0
+        while self.child_count[node] > 0:
+            node = self._select_child(node)
+            self.visits[node] += VIRTUAL_LOSS
+            self.game_state.make_move(self.moves[node])
+            self._moves_made += 1
+        return node
+
+    def _select_child(self, node):
+        first, parent_visits = self.first_child[node], max(self.visits[node], 1)
+        # unvisited children -> assume parent's value (first play urgency)
+        default_q = (
+            1 - self.value_sum[node] / self.visits[node] if self.visits[node] else 0.5
+        )
+        best_child, best_score = first, -math.inf
+        if SELECTION == "uct":
+            log_visits = math.log(parent_visits)
+        else:
+            sqrt_visits = math.sqrt(parent_visits)
+        for child in range(first, first + self.child_count[node]):
+            visits = self.visits[child]
+            if SELECTION == "uct":
+                if not visits:
+                    return child
+                score = self.value_sum[child] / visits + UCT_EXPLORATION * math.sqrt(
+                    log_visits / visits
+                )
+            else:
+                q = self.value_sum[child] / visits if visits else default_q
+                score = q + PUCT_EXPLORATION * self.prior[child] * sqrt_visits / (
+                    1 + visits
+                )
+            if score > best_score:
+                best_child, best_score = child, score
+        return best_child
+
+    def _estimate_leaf(self, node):
+        """value for side to move at leaf -> (value, None) or (None, planes) for value net"""
+        if self.child_count[node] == 0:
+            return self.terminal_values[node], None
+
+        game_state = self.game_state
+        if node and (
+            game_state.is_draw_by_fifty_move_rule() or game_state.is_draw_by_repetition()
+        ):
+            return self._set_terminal(node, 0.5), None
+
+        valid_moves = game_state.get_valid_moves()
+        if not valid_moves:
+            return self._set_terminal(node, 0 if game_state.check_mate else 0.5), None
+
+        self._expand(node, valid_moves)
+        if LEAF_ESTIMATE == "playout":
+            return self._playout(valid_moves), None
+
+        if ai.EVALUATION == "value_net":
+            from value_net import serialize
+
+            return None, serialize(game_state)
+        return self._evaluate(), None
+
+    def _playout(self, valid_moves):
+        """random moves (counted in _moves_made, undone by run_batch) then evaluation"""
+        game_state, flip = self.game_state, False
+        for _ in range(PLAYOUT_PLIES):
+            game_state.make_move(self.rng.choice(valid_moves))
+            self._moves_made += 1
+            flip = not flip
+            valid_moves = game_state.get_valid_moves()
+            if not valid_moves:
+                value = 0 if game_state.check_mate else 0.5
+                return 1 - value if flip else value
+
+        if ai.EVALUATION == "value_net":  # single position -> no batching
+            from value_net import serialize
+
+            value = (ai.value_network.predict([serialize(game_state)])[0] + 1) / 2
+            if not game_state.white_to_move:
+                value = 1 - value
+        else:
+            value = self._evaluate()
+        return 1 - value if flip else value
+
+    def _evaluate(self):
+        """chess_ai evaluation as win probability for side to move"""
+        score = ai.evaluate(self.game_state)
+        if not self.game_state.white_to_move:
+            score = -score
+        return 1 / (1 + 10 ** (-max(min(score, 40), -40) / EVAL_SCALE))
+
+    def _set_terminal(self, node, value):
+        self.child_count[node] = 0
+        self.terminal_values[node] = value
+        return value
+
+    def _expand(self, node, valid_moves):
+        """appends all children of node -> they are contiguous in the arrays"""
+        weights = [
+            CAPTURE_PRIOR if move.is_capture or move.is_pawn_promotion else 1
+            for move in valid_moves
+        ]
+        total_weight = sum(weights)
+        self.first_child[node] = len(self.moves)
+        self.child_count[node] = len(valid_moves)
+        for move, weight in zip(valid_moves, weights):
+            self.parent.append(node)
+            self.first_child.append(0)
+            self.child_count.append(-1)
+            self.visits.append(0)
+            self.value_sum.append(0.0)
+            self.prior.append(weight / total_weight)
+            self.moves.append(move)
+
+    def _backup(self, node, value):
+        """value is for side to move at node -> alternates on the way to the root"""
+        while node:
+            value = 1 - value  # result for player who moved into node
+            self.visits[node] += 1 - VIRTUAL_LOSS
+            self.value_sum[node] += value
+            node = self.parent[node]
+        self.visits[0] += 1
+        self.value_sum[0] += 1 - value
+
+
+def merge_root_statistics(statistics):
+    """sums [(move_id, visits, value_sum)] of all workers -> {move_id: [visits, value_sum]}"""
+    merged = {}
+    for worker_statistics in statistics:
+        for move_id, visits, value_sum in worker_statistics:
+            entry = merged.setdefault(move_id, [0, 0.0])
+            entry[0] += visits
+            entry[1] += value_sum
+    return merged
+
+
+def get_best_move(valid_moves, merged):
+    """most visited root move and its score (pawns, side to move's perspective)"""
+    if not merged:
+        return None, 0
+    move_id, (visits, value_sum) = max(merged.items(), key=lambda item: item[1][0])
+    if not visits:
+        return None, 0
+    win_probability = min(max(value_sum / visits, 1e-6), 1 - 1e-6)
+    score = EVAL_SCALE * math.log10(win_probability / (1 - win_probability))
+    return valid_moves.get_by_id(move_id), score
+
+
+def get_iteration_budget(limits):
+    if (
+        limits.movetime is None
+        and limits.depth < ai.MAX_DEPTH
+        and limits.ponder_event is None
+    ):
+        return ITERATIONS_PER_DEPTH * limits.depth
+    return sys.maxsize  # time or stop signal ends the search
+
+
+def get_next_time_check(limits):
+    """time of the next soft limit check (never without a TimeManager)"""
+    if limits.time_manager is None:
+        return math.inf
+    return time.perf_counter() + limits.time_manager.optimum / TIME_CHECKS_PER_OPTIMUM
+
+
+def is_soft_limit_reached(limits, best_move, score):
+    """clock games -> stop at the TimeManager's soft limit, which is stretched while the
+    most visited root move changes (movetime, the hard limit, stays the cap)
+    """
+    if limits.is_pondering() or best_move is None:
+        return False
+    limits.time_manager.update_soft_limit(best_move, score)
+    return limits.elapsed() >= limits.time_manager.soft_limit
+
+
+def search(game_state, valid_moves, limits, info_callback=None):
+    """MCTS counterpart of chess_ai.search() -> returns (best_move, score, pv)
+
+    info_callback(depth, score, nodes, elapsed, pv) is called every REPORT_INTERVAL
+    seconds, depth is the length of the pv and nodes the number of iterations
+    """
+    from chess_engine import MoveIndex
+
+    valid_moves = MoveIndex(valid_moves)
+    if not valid_moves:
+        return None, 0, []
+    if WORKERS > 1:
+        return _search_parallel(game_state, valid_moves, limits, info_callback)
+
+    attach_accumulator = ai.EVALUATION == "nnue" and game_state.accumulator is None
+    if attach_accumulator:
+        from nnue import Accumulator
+
+        Accumulator(ai.nnue_network).attach(game_state)
+    tree = MctsTree(game_state, valid_moves)
+    next_report = time.perf_counter() + REPORT_INTERVAL
+    next_time_check = get_next_time_check(limits)
+    try:
+        # budget is checked every batch -> applies from a ponder hit on
+        while tree.iterations < get_iteration_budget(limits) and not limits.should_stop():
+            tree.run_batch()
+            ai.nodes = tree.iterations  # progress of chess_ai.ProgressReporter
+            if info_callback is not None and time.perf_counter() >= next_report:
+                next_report = time.perf_counter() + REPORT_INTERVAL
+                _report(info_callback, valid_moves, tree, limits)
+            if time.perf_counter() >= next_time_check:
+                next_time_check = get_next_time_check(limits)
+                best_move, score = get_best_move(
+                    valid_moves, merge_root_statistics([tree.root_statistics()])
+                )
+                if is_soft_limit_reached(limits, best_move, score):
+                    break
+    finally:
+        if attach_accumulator:
+            game_state.accumulator = None
+
+    if info_callback is not None:
+        _report(info_callback, valid_moves, tree, limits)
+    best_move, score = get_best_move(
+        valid_moves, merge_root_statistics([tree.root_statistics()])
+    )
+    return best_move, score, tree.get_pv()
+
+
+def _report(info_callback, valid_moves, tree, limits):
+    _, score = get_best_move(valid_moves, merge_root_statistics([tree.root_statistics()]))
+    pv = tree.get_pv()
+    info_callback(len(pv), score, tree.iterations, limits.elapsed(), pv)
+
+
+def _search_parallel(game_state, valid_moves, limits, info_callback):
+    workers = ParallelMcts(game_state, valid_moves, WORKERS, get_iteration_budget(limits))
+    next_report = time.perf_counter() + REPORT_INTERVAL
+    next_time_check = get_next_time_check(limits)
+    try:
+        while not workers.is_done() and not limits.should_stop():
+            workers.poll(timeout=0.01)
+            ai.nodes = workers.iterations()
+            if ai.nodes >= get_iteration_budget(limits):
+                break
+            if time.perf_counter() >= next_time_check:
+                next_time_check = get_next_time_check(limits)
+                if is_soft_limit_reached(limits, *workers.best_move()):
+                    break
+            if info_callback is not None and time.perf_counter() >= next_report:
+                next_report = time.perf_counter() + REPORT_INTERVAL
+                best_move, score = workers.best_move()
+                if best_move is not None:  # workers have reported
+                    info_callback(1, score, ai.nodes, limits.elapsed(), [best_move])
+    finally:
+        workers.stop()
+
+    best_move, score = workers.best_move()
+    pv = [best_move] if best_move else []
+    if info_callback is not None:
+        info_callback(len(pv), score, workers.iterations(), limits.elapsed(), pv)
+    return best_move, score, pv
+
+
+class ParallelMcts:
+    """worker processes searching independent trees of the same position"""
+
+    def __init__(self, game_state, valid_moves, workers, iterations):
+        context = get_context("spawn")
+        self.valid_moves = valid_moves
+        self.stop_event = context.Event()
+        self.result_queue = context.Queue()
+        self.statistics = {}  # worker -> latest root statistics
+        self.worker_iterations = {}
+        self.finished = set()
+        self.processes = [
+            context.Process(
+                target=run_worker,
+                args=(
+                    get_worker_settings(),
+                    game_state,
+                    valid_moves,
+                    worker,
+                    iterations,
+                    self.stop_event,
+                    self.result_queue,
+                ),
+                daemon=True,
+            )
+            for worker in range(workers)
+        ]
+        for process in self.processes:
+            process.start()
+
+    def poll(self, timeout=0.0):
+        """reads root statistics sent by workers"""
+        try:
+            while True:
+                worker, iterations, statistics, done = self.result_queue.get(
+                    timeout=timeout
+                )
+                self.statistics[worker], self.worker_iterations[worker] = (
+                    statistics,
+                    iterations,
+                )
+                if done:
+                    self.finished.add(worker)
+                timeout = 0.0
+        except Empty:
+            pass
+
+    def best_move(self):
+        """any time best move -> (move, score) of merged root statistics"""
+        return get_best_move(
+            self.valid_moves, merge_root_statistics(self.statistics.values())
+        )
+
+    def iterations(self):
+        return sum(self.worker_iterations.values())
+
+    def is_done(self):
+        return len(self.finished) == len(self.processes)
+
+    def stop(self):
+        """stops workers and waits for their final statistics"""
+        self.stop_event.set()
+        while not self.is_done() and any(
+            process.is_alive() for process in self.processes
+        ):
+            self.poll(timeout=0.01)
+        self.poll()
+        for process in self.processes:
+            process.join()
+
+
+def get_worker_settings():
+    modules = {"chess_ai": ai, "mcts": sys.modules[__name__]}
+    return {
+        module: {name: getattr(modules[module], name) for name in names}
+        for module, names in WORKER_SETTINGS.items()
+    }
+
+
+def run_worker(
+    settings, game_state, valid_moves, worker, iterations, stop_event, result_queue
+):
+    """worker process -> sends (worker, iterations, root statistics, done) to result_queue"""
+    modules = {"chess_ai": ai, "mcts": sys.modules[__name__]}
+    for module, values in settings.items():
+        for name, value in values.items():
+            setattr(modules[module], name, value)
+
+    attach_accumulator = ai.EVALUATION == "nnue" and game_state.accumulator is None
+    if attach_accumulator:
+        from nnue import Accumulator
+
+        Accumulator(ai.nnue_network).attach(game_state)
+    tree = MctsTree(game_state, valid_moves, seed=worker)
+    next_report = time.perf_counter() + REPORT_INTERVAL
+    while tree.iterations < iterations and not stop_event.is_set():
+        tree.run_batch()
+        if time.perf_counter() >= next_report:
+            next_report = time.perf_counter() + REPORT_INTERVAL
+            result_queue.put((worker, tree.iterations, tree.root_statistics(), False))
+    result_queue.put((worker, tree.iterations, tree.root_statistics(), True))
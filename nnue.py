@@ -0,0 +1,322 @@
+"""Efficiently updatable network (NNUE style) evaluation.
+
+The first layer is a sum of weight rows, one per (piece, square) feature, kept as an
+accumulator for each side's perspective. GameState updates the accumulators in make_move
+(add/subtract rows of changed squares) and restores them from a stack in undo_move, so
+evaluating a position is just the small int16 output layer.
+Run `python nnue.py distill --help` to fit a network to chess_ai.score_board.
+"""
+import argparse
+import random
+
+import numpy as np
+
+# ======================
+# GLOBAL VARIABLES
+# ======================
+PIECE_TYPES = ("p", "N", "B", "R", "Q", "K")
+PIECES = tuple(color + piece_type for color in "wb" for piece_type in PIECE_TYPES)
+PIECE_INDEX = {piece: i for i, piece in enumerate(PIECES)}
+FEATURE_COUNT = len(PIECES) * 64
+HIDDEN_SIZE = 64  # accumulator size per perspective
+ACTIVATION_SCALE = 255  # QA -> clipped ReLU range of quantized accumulators
+WEIGHT_SCALE = 64  # QB -> output layer quantization
+WEIGHTS_FORMAT_VERSION = 1
+# ======================
+
+
+def get_features(piece, row, col):
+    """(white perspective, black perspective) feature index -> own pieces come first"""
+    piece_type = PIECE_TYPES.index(piece[1])
+    own_white, own_black = piece[0] == "w", piece[0] == "b"
+    white_feature = (piece_type + 6 * (not own_white)) * 64 + row * 8 + col
+    black_feature = (piece_type + 6 * (not own_black)) * 64 + (7 - row) * 8 + col
+    return white_feature, black_feature
+
+
+def get_position_features(game_state):
+    """feature indices of all pieces -> (white perspective, black perspective)"""
+    white_features, black_features = [], []
+    for row in range(8):
+        for col in range(8):
+            piece = game_state.board[row][col]
+            if piece != "--":
+                white_feature, black_feature = get_features(piece, row, col)
+                white_features.append(white_feature)
+                black_features.append(black_feature)
+    return white_features, black_features
+
+
+class NnueNetwork:
+    """quantized weights -> feature layer (768 -> 2 x 64, int16) and output layer (128 -> 1)"""
+
+    def __init__(self, feature_weights, feature_bias, output_weights, output_bias):
+        self.feature_weights = np.asarray(feature_weights, np.int16)
+        self.feature_bias = np.asarray(feature_bias, np.int16)
+        self.output_weights = np.asarray(output_weights, np.int16)
+        self.output_bias = int(output_bias)
+        self.output_weights_32 = self.output_weights.astype(np.int32)  # dot product type
+
+        # weight rows of both perspectives per (piece, square) -> one add per change
+        self.feature_rows = np.zeros((len(PIECES), 64, 2, HIDDEN_SIZE), np.int16)
+        for piece, piece_index in PIECE_INDEX.items():
+            for square in range(64):
+                white_feature, black_feature = get_features(piece, *divmod(square, 8))
+                self.feature_rows[piece_index, square, 0] = self.feature_weights[
+                    white_feature
+                ]
+                self.feature_rows[piece_index, square, 1] = self.feature_weights[
+                    black_feature
+                ]
+
+    @staticmethod
+    def from_float(feature_weights, feature_bias, output_weights, output_bias):
+        def quantize(weights, scale):
+            return np.clip(np.round(weights * scale), -(2**15), 2**15 - 1)
+
+        return NnueNetwork(
+            quantize(feature_weights, ACTIVATION_SCALE),
+            quantize(feature_bias, ACTIVATION_SCALE),
+            quantize(output_weights, WEIGHT_SCALE),
+            round(float(output_bias) * ACTIVATION_SCALE * WEIGHT_SCALE),
+        )
+
+    @staticmethod
+    def random(seed=0):
+        """untrained network -> same speed as a trained one (benchmarks)"""
+        return NnueNetwork.from_float(*init_float_parameters(np.random.default_rng(seed)))
+
+    def save(self, path):
+        np.savez_compressed(
+            path,
+            version=np.array(WEIGHTS_FORMAT_VERSION),
+            feature_weights=self.feature_weights,
+            feature_bias=self.feature_bias,
+            output_weights=self.output_weights,
+            output_bias=np.array(self.output_bias, np.int32),
+        )
+
+    @staticmethod
+    def load(path):
+        with np.load(path) as arrays:
+            if int(arrays["version"]) != WEIGHTS_FORMAT_VERSION:
+                raise ValueError(
+                    f"unsupported weights file version: {int(arrays['version'])}"
+                )
+
+            return NnueNetwork(
+                arrays["feature_weights"],
+                arrays["feature_bias"],
+                arrays["output_weights"],
+                arrays["output_bias"],
+            )
+
+
+class Accumulator:
+    """first layer output of a GameState -> set as game_state.accumulator via attach()"""
+
+    def __init__(self, network):
+        self.network = network
+        self.stack = []  # one (2, HIDDEN_SIZE) accumulator per move of the game state
+
+    def attach(self, game_state):
+        game_state.accumulator = self
+        self.refresh(game_state)
+
+    def refresh(self, game_state):
+        """computes accumulators of whole position -> start of search / load_fen"""
+        white_features, black_features = get_position_features(game_state)
+        weights = self.network.feature_weights
+        accumulator = np.empty((2, HIDDEN_SIZE), np.int16)
+        accumulator[0] = self.network.feature_bias + weights[white_features].sum(axis=0)
+        accumulator[1] = self.network.feature_bias + weights[black_features].sum(axis=0)
+        self.stack = [accumulator]
+
+    def make_move(self, game_state, move):
+        """called by make_move after the board is updated"""
+        rows = self.network.feature_rows
+        accumulator = (
+            self.stack[-1]
+            - rows[PIECE_INDEX[move.piece_moved], move.start_row * 8 + move.start_col]
+        )
+        end_piece = game_state.board[move.end_row][move.end_col]  # promoted piece if any
+        accumulator += rows[PIECE_INDEX[end_piece], move.end_row * 8 + move.end_col]
+        if move.is_capture:
+            captured_row = move.start_row if move.is_en_passant else move.end_row
+            accumulator -= rows[
+                PIECE_INDEX[move.piece_captured], captured_row * 8 + move.end_col
+            ]
+
+        if move.is_castle:
+            rook_index = PIECE_INDEX[move.piece_moved[0] + "R"]
+            if move.end_col - move.start_col == 2:  # king side
+                rook_from, rook_to = move.end_col + 1, move.end_col - 1
+            else:
+                rook_from, rook_to = move.end_col - 2, move.end_col + 1
+            accumulator -= rows[rook_index, move.end_row * 8 + rook_from]
+            accumulator += rows[rook_index, move.end_row * 8 + rook_to]
+
+        self.stack.append(accumulator)
+
+    def undo_move(self):
+        self.stack.pop()
+
+    def evaluate(self, white_to_move):
+        """positive score -> good for white (in pawns)"""
+        accumulator = self.stack[-1]
+        # side to move's perspective first
+        hidden = accumulator.ravel() if white_to_move else accumulator[::-1].ravel()
+        hidden = np.clip(hidden, 0, ACTIVATION_SCALE).astype(np.int32)
+        score = (
+            int(hidden @ self.network.output_weights_32) + self.network.output_bias
+        ) / (ACTIVATION_SCALE * WEIGHT_SCALE)
+        return score if white_to_move else -score
+
+
+# ==============================================================
+# training -> float network fitted to an evaluation, quantized afterwards
+# ==============================================================
+
+
+def init_float_parameters(rng):
+    feature_weights = rng.standard_normal((FEATURE_COUNT, HIDDEN_SIZE)) * 0.05
+    feature_bias = np.full(HIDDEN_SIZE, 0.1)
+    output_weights = rng.standard_normal(2 * HIDDEN_SIZE) * 0.1
+    return feature_weights, feature_bias, output_weights, 0.0
+
+
+def generate_positions(count, max_plies=80, seed=0):
+    """random playouts -> yields game states (from the start position)"""
+    import chess_engine
+
+    rng = random.Random(seed)
+    game_state, plies = chess_engine.GameState(), 0
+    for _ in range(count):
+        valid_moves = game_state.get_valid_moves()
+        if not valid_moves or plies >= max_plies:
+            game_state, plies = chess_engine.GameState(), 0
+            valid_moves = game_state.get_valid_moves()
+        game_state.make_move(rng.choice(valid_moves))
+        plies += 1
+        yield game_state
+
+
+def encode_features(feature_lists):
+    """dense one-hot rows of the feature index lists"""
+    features = np.zeros((len(feature_lists), FEATURE_COUNT), np.float32)
+    for i, feature_list in enumerate(feature_lists):
+        features[i, feature_list] = 1
+    return features
+
+
+def fit(samples, epochs=20, batch_size=256, learning_rate=1e-2, seed=0):
+    """samples: (white features, black features, white to move, target score for side to move)
+    -> Adam on mean squared error, yields (epoch, loss, float parameters) after each epoch
+    """
+    rng = np.random.default_rng(seed)
+    parameters = [np.asarray(p, np.float64) for p in init_float_parameters(rng)]
+    first_moments = [np.zeros_like(p) for p in parameters]
+    second_moments = [np.zeros_like(p) for p in parameters]
+    beta1, beta2, epsilon, step = 0.9, 0.999, 1e-8, 0
+    for epoch in range(epochs):
+        order, losses = rng.permutation(len(samples)), []
+        for start in range(0, len(order), batch_size):
+            batch = [samples[i] for i in order[start : start + batch_size]]
+            loss, gradients = _backward(parameters, batch)
+            losses.append(loss)
+            step += 1
+            for i, (parameter, gradient) in enumerate(zip(parameters, gradients)):
+                first_moments[i] = beta1 * first_moments[i] + (1 - beta1) * gradient
+                second_moments[i] = (
+                    beta2 * second_moments[i] + (1 - beta2) * gradient**2
+                )
+                m_hat = first_moments[i] / (1 - beta1**step)
+                v_hat = second_moments[i] / (1 - beta2**step)
+                parameters[i] = parameter - learning_rate * m_hat / (
+                    np.sqrt(v_hat) + epsilon
+                )
+        yield epoch, float(np.mean(losses)), parameters
+
+
+def _backward(parameters, batch):
+    feature_weights, feature_bias, output_weights, output_bias = parameters
+    white_x = encode_features([sample[0] for sample in batch])
+    black_x = encode_features([sample[1] for sample in batch])
+    white_to_move = np.array([sample[2] for sample in batch])[:, None]
+    targets = np.array([sample[3] for sample in batch])
+
+    white_a = white_x @ feature_weights + feature_bias
+    black_a = black_x @ feature_weights + feature_bias
+    white_h, black_h = np.clip(white_a, 0, 1), np.clip(black_a, 0, 1)
+    own_h = np.where(white_to_move, white_h, black_h)
+    enemy_h = np.where(white_to_move, black_h, white_h)
+    own_weights, enemy_weights = (
+        output_weights[:HIDDEN_SIZE],
+        output_weights[HIDDEN_SIZE:],
+    )
+    output = own_h @ own_weights + enemy_h @ enemy_weights + output_bias
+
+    error = output - targets
+    delta = 2 * error / len(batch)
+    own_delta, enemy_delta = np.outer(delta, own_weights), np.outer(delta, enemy_weights)
+    white_delta = (
+        np.where(white_to_move, own_delta, enemy_delta) * (white_a > 0) * (white_a < 1)
+    )
+    black_delta = (
+        np.where(white_to_move, enemy_delta, own_delta) * (black_a > 0) * (black_a < 1)
+    )
+    gradients = [
+        white_x.T @ white_delta + black_x.T @ black_delta,
+        white_delta.sum(axis=0) + black_delta.sum(axis=0),
+        np.concatenate([own_h.T @ delta, enemy_h.T @ delta]),
+        delta.sum(),
+    ]
+    return float(np.mean(error**2)), gradients
+
+
+def distill(args):
+    import chess_ai as ai
+
+    samples = []
+    for game_state in generate_positions(args.positions, seed=args.seed):
+        # moves of the position aren't generated, so mates aren't detected and are
+        # scored like other positions
+        score = ai.score_board(game_state)
+        turn_multiplier = 1 if game_state.white_to_move else -1
+        samples.append(
+            (
+                *get_position_features(game_state),
+                game_state.white_to_move,
+                turn_multiplier * score,
+            )
+        )
+
+    parameters = None
+    for epoch, loss, parameters in fit(samples, args.epochs, seed=args.seed):
+        print(f"epoch {epoch + 1:>3} loss {loss:.4f}")
+
+    NnueNetwork.from_float(*parameters).save(args.weights)
+    print(f"weights -> {args.weights}")
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    commands = parser.add_subparsers(dest="command", required=True)
+    distill_parser = commands.add_parser(
+        "distill", help="fit network to score_board on random playout positions"
+    )
+    distill_parser.add_argument("weights", help="output .npz weights file")
+    distill_parser.add_argument("--positions", type=int, default=20000)
+    distill_parser.add_argument("--epochs", type=int, default=20)
+    distill_parser.add_argument("--seed", type=int, default=0)
+    distill_parser.set_defaults(run=distill)
+
+    args = parser.parse_args()
+    args.run(args)
+
+
+if __name__ == "__main__":
+
+    main()
@@ -19,21 +19,22 @@ class State:
                 board_state[i] = {"p": 1, "n": 2, "b": 3, "r": 4, "q": 5, "k": 6, \
                                   "P": 9, "N": 10, "B": 11, "R": 12, "Q": 13, "K": 14}[piece.symbol()]
 
-        if self.board.has_queenside_castling_rights(False):
-            assert board_state[0] == 4
-            board_state[0] = 7
-
-        if self.board.has_kingside_castling_rights(False):
-            assert board_state[7] == 4
-            board_state[7] = 7
-
+        # squares are a1..h8 -> white rooks on 0/7, black rooks on 56/63
         if self.board.has_queenside_castling_rights(True):
-            assert board_state[56] == 8+4
-            board_state[56] = 8+7
+            assert board_state[0] == 8+4
+            board_state[0] = 8+7
 
         if self.board.has_kingside_castling_rights(True):
-            assert board_state[63] == 8+4
-            board_state[63] = 8+7
+            assert board_state[7] == 8+4
+            board_state[7] = 8+7
+
+        if self.board.has_queenside_castling_rights(False):
+            assert board_state[56] == 4
+            board_state[56] = 7
+
+        if self.board.has_kingside_castling_rights(False):
+            assert board_state[63] == 4
+            board_state[63] = 7
 
         if self.board.ep_square is not None:
             assert board_state[self.board.ep_square] == 0
@@ -42,15 +43,14 @@ class State:
 
         state = np.zeros((5, 8, 8), np.uint8)
 
-        # columns to binary
-        breakpoint()
+        # piece codes to binary planes
         state[0] = (board_state>>3)&1
-        state[:, :, 1] = (board_state>>2)&1
-        state[:, :, 2] = (board_state>>1)&1
-        state[:, :, 3] = (board_state>>0)&1
+        state[1] = (board_state>>2)&1
+        state[2] = (board_state>>1)&1
+        state[3] = (board_state>>0)&1
 
-        # 4th column -> who's turn it is
-        state[:, :, 4] = self.board.turn * 1.0
+        # 5th plane -> who's turn it is
+        state[4] = self.board.turn * 1.0
 
         return state
 
@@ -0,0 +1,279 @@
+"""SAN notation of moves and PGN import/export of GameState games.
+
+read_games() streams a PGN file: lines are read one at a time and moves are replayed as
+they are read, so only the current game is kept in memory.
+"""
+import re
+
+import chess_engine
+from chess_engine import Move
+
+# ======================
+# GLOBAL VARIABLES
+# ======================
+RESULTS = ("1-0", "0-1", "1/2-1/2", "*")
+SEVEN_TAG_ROSTER = {
+    "Event": "?",
+    "Site": "?",
+    "Date": "????.??.??",
+    "Round": "?",
+    "White": "?",
+    "Black": "?",
+    "Result": "*",
+}
+MAX_LINE_LENGTH = 80  # of exported movetext
+HEADER_PATTERN = re.compile(r'\s*\[\s*(\w+)\s+"((?:[^"\\]|\\.)*)"\s*\]')
+TOKEN_PATTERN = re.compile(r"[{}();]|\$\d+|[^\s{}();]+")
+MOVE_NUMBER_PATTERN = re.compile(r"^\d+\.*")  # "12." / "12..." (may be glued: "1.e4")
+# ======================
+
+
+def get_san(game_state, move, valid_moves=None):
+    """standard algebraic notation of a valid move of the current position
+
+    e.g. "Nbd7", "exd6", "O-O", "e8=Q#" (valid_moves of the position saves regenerating)
+    """
+    if valid_moves is None:
+        valid_moves = game_state.get_valid_moves()
+
+    san = str(move)  # castles, pawn moves and promotions are complete
+    if not move.is_castle and move.piece_moved[1] != "p":
+        san = san[0] + get_disambiguation(move, valid_moves) + san[1:]
+
+    game_state.make_move(move)
+    if game_state.check_for_pins_and_checks()[0]:
+        san += "+" if game_state.get_valid_moves() else "#"
+    game_state.undo_move()
+    return san
+
+
+def get_disambiguation(move, valid_moves):
+    """start file, rank or square needed to tell move apart from moves of equal pieces"""
+    others = [
+        other
+        for other in valid_moves
+        if other.piece_moved == move.piece_moved
+        and (other.end_row, other.end_col) == (move.end_row, move.end_col)
+        and other.move_id != move.move_id
+    ]
+    if not others:
+        return ""
+    start_square = Move.cols_to_files[move.start_col] + Move.rows_to_ranks[move.start_row]
+    if all(other.start_col != move.start_col for other in others):
+        return start_square[0]
+    if all(other.start_row != move.start_row for other in others):
+        return start_square[1]
+    return start_square
+
+
+def parse_san(game_state, san, valid_moves=None):
+    """valid Move of current position matching SAN -> raises ValueError if there is none
+
+    accepts "0-0" castles, annotations ("!", "?") and promotions without "=".
+    Underpromotions raise ValueError, the engine always promotes to a queen
+    """
+    if valid_moves is None:
+        valid_moves = game_state.get_valid_moves()
+
+    text = san.rstrip("+#!?").replace("0", "O")
+    if text in ("O-O", "O-O-O"):
+        king_side = text == "O-O"
+        candidates = [
+            move
+            for move in valid_moves
+            if move.is_castle and (move.end_col == 6) == king_side
+        ]
+        return _get_single_candidate(san, candidates)
+
+    text = text.replace("=", "")
+    if len(text) > 2 and text[-1] in "QRBN" and text[0] in Move.files_to_cols:
+        if text[-1] != "Q":
+            raise ValueError(f"{san}: underpromotion is not supported")
+        text = text[:-1]
+
+    piece = text[0] if text[:1] in ("K", "Q", "R", "B", "N") else "p"
+    squares = (text[1:] if piece != "p" else text).replace("x", "")
+    file, rank, start_hint = squares[-2:-1], squares[-1:], squares[:-2]
+    if file not in Move.files_to_cols or rank not in Move.ranks_to_rows:
+        raise ValueError(f"{san}: not a move")
+
+    end_square = (Move.ranks_to_rows[rank], Move.files_to_cols[file])
+    candidates = []
+    for move in valid_moves:
+        if (
+            move.is_castle
+            or move.piece_moved[1] != piece
+            or (move.end_row, move.end_col) != end_square
+        ):
+            continue
+        if all(_matches_start(move, char) for char in start_hint):
+            candidates.append(move)
+    return _get_single_candidate(san, candidates)
+
+
+def _matches_start(move, char):
+    if char in Move.files_to_cols:
+        return move.start_col == Move.files_to_cols[char]
+    if char in Move.ranks_to_rows:
+        return move.start_row == Move.ranks_to_rows[char]
+    return False
+
+
+def _get_single_candidate(san, candidates):
+    if not candidates:
+        raise ValueError(f"{san}: illegal move")
+    if len(candidates) > 1:
+        raise ValueError(f"{san}: ambiguous move")
+    return candidates[0]
+
+
+def get_san_moves(game_state, first=0):
+    """SAN of move_log[first:] -> replayed on a copy, so only the new moves cost time"""
+    replay = game_state.copy()
+    moves = replay.move_log[first:]
+    for _ in moves:
+        replay.undo_move()
+
+    san_moves = []
+    for move in moves:
+        san_moves.append(get_san(replay, move))
+        replay.make_move(move)
+    return san_moves
+
+
+def get_result(game_state):
+    """PGN result of game ("*" if it isn't over)"""
+    if not game_state.get_valid_moves():
+        if game_state.check_mate:
+            return "0-1" if game_state.white_to_move else "1-0"
+        return "1/2-1/2"
+    if game_state.is_draw_by_repetition() or game_state.is_draw_by_fifty_move_rule():
+        return "1/2-1/2"
+    return "*"
+
+
+def get_pgn(game_state, headers=None):
+    """PGN of game played in game_state (headers override the seven tag roster)"""
+    start = game_state.copy()
+    while start.move_log:
+        start.undo_move()
+
+    tags = dict(SEVEN_TAG_ROSTER, Result=get_result(game_state))
+    tags.update(headers or {})
+    start_fen = start.get_fen()
+    if start_fen.split()[:4] != chess_engine.START_FEN.split()[:4]:
+        tags["SetUp"], tags["FEN"] = "1", start_fen
+
+    tokens, white_to_move, move_number = [], start.white_to_move, 1
+    if not white_to_move:
+        tokens.append("1...")
+    for san in get_san_moves(game_state):
+        if white_to_move:
+            tokens.append(f"{move_number}.")
+        else:
+            move_number += 1
+        tokens.append(san)
+        white_to_move = not white_to_move
+    tokens.append(tags["Result"])
+
+    lines = [f'[{tag} "{_escape(value)}"]' for tag, value in tags.items()]
+    lines.append("")
+    line = ""
+    for token in tokens:
+        if line and len(line) + 1 + len(token) > MAX_LINE_LENGTH:
+            lines.append(line)
+            line = ""
+        line = f"{line} {token}" if line else token
+    lines.append(line)
+    return "\n".join(lines) + "\n"
+
+
+def write_pgn(game_state, output, headers=None):
+    """appends game to a PGN file object"""
+    output.write(get_pgn(game_state, headers) + "\n")
+
+
+def read_games(pgn_file, strict=True):
+    """yields (headers, game_state) of every game of a PGN file object
+
+    comments, variations and NAGs are skipped. A game with an illegal or unsupported
+    move raises ValueError, strict=False skips it instead
+    """
+    headers, game_state, error, has_movetext = {}, None, None, False
+    in_comment, variation_depth = False, 0
+    for line in pgn_file:
+        if line.startswith("%"):  # escaped line
+            continue
+
+        match = None
+        if not in_comment and not variation_depth:
+            match = HEADER_PATTERN.match(line)
+        if match is not None:
+            if has_movetext:  # previous game had no result token
+                game = _finish_game(headers, game_state, error, strict)
+                if game is not None:
+                    yield game
+                headers, game_state, error, has_movetext = {}, None, None, False
+            headers[match.group(1)] = _unescape(match.group(2))
+            continue
+
+        for token in TOKEN_PATTERN.findall(line):
+            if in_comment:
+                in_comment = token != "}"
+                continue
+            if token == ";":
+                break  # rest of line is a comment
+            if token == "{":
+                in_comment = True
+            elif token == "(":
+                variation_depth += 1
+            elif token == ")":
+                variation_depth = max(variation_depth - 1, 0)
+            elif variation_depth or token[0] == "$":
+                continue
+            elif token in RESULTS:
+                game = _finish_game(headers, game_state, error, strict)
+                if game is not None:
+                    yield game
+                headers, game_state, error, has_movetext = {}, None, None, False
+            else:
+                has_movetext = True
+                san = MOVE_NUMBER_PATTERN.sub("", token)
+                if not san.strip("!?") or error is not None:
+                    continue
+                if game_state is None:
+                    game_state = _new_game_state(headers)
+                try:
+                    game_state.make_move(parse_san(game_state, san))
+                except ValueError as exception:
+                    error = exception  # remaining moves of game are skipped
+
+    if has_movetext or headers:
+        game = _finish_game(headers, game_state, error, strict)
+        if game is not None:
+            yield game
+
+
+def _new_game_state(headers):
+    game_state = chess_engine.GameState()
+    if "FEN" in headers:
+        game_state.load_fen(headers["FEN"])
+    return game_state
+
+
+def _finish_game(headers, game_state, error, strict):
+    """(headers, game_state) or None if game is skipped"""
+    if error is not None:
+        if strict:
+            game_name = f"{headers.get('White', '?')} - {headers.get('Black', '?')}"
+            raise ValueError(f"{game_name}: {error}")
+        return None
+    return headers, game_state if game_state is not None else _new_game_state(headers)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"')
+
+
+def _unescape(value):
+    return re.sub(r"\\(.)", r"\1", value)
@@ -0,0 +1,364 @@
+"""Asyncio game server. Hosts one game per TCP connection, AI moves are searched by a shared
+pool of worker processes. Run `python server.py --help` for options.
+
+line protocol (moves in UCI notation, e.g. "e2e4", "e7e8q"):
+    new [white|black] [movetime <ms>] [fen <fen>]  -> "ok", engine moves first if it plays white
+    move <move>  -> "ok", then the engine reply "move <move>" (or "error illegal move")
+    go           -> engine plays the side to move
+    stop         -> engine plays its best move found so far
+    quit
+finished games send "result <1-0|0-1|1/2-1/2> <reason>".
+
+Searches hold one of --workers slots. Requests waiting for a slot are limited to
+--max-queued (beyond that "error busy"). Every request has a time budget of its movetime,
+time spent waiting for a slot included. A disconnecting client stops its running search.
+"""
+import argparse
+import asyncio
+import concurrent.futures
+import os
+from multiprocessing import get_context
+
+import chess_ai as ai
+import chess_engine
+from uci import find_uci_move
+
+# ======================
+# GLOBAL VARIABLES
+# ======================
+DEFAULT_PORT = 8765
+DEFAULT_MOVETIME = 1.0  # seconds per engine move, clients may ask for less
+MIN_MOVETIME = 0.05  # search time left after waiting for a slot is never lower
+MAX_GAMES = 500  # concurrent connections
+MAX_QUEUED_SEARCHES = 256  # requests waiting for a worker slot
+MAX_LINE_LENGTH = 4096
+# ======================
+
+# ======================
+# WORKER STATE
+# ======================
+stop_events = None  # slot -> multiprocessing Event, set by init_worker()
+# ======================
+
+
+def init_worker(events):
+    """pool initializer -> events can only be passed to workers when they are started"""
+    global stop_events
+    stop_events = events
+
+
+def search_position(snapshot, slot, depth, movetime):
+    """runs in a pool worker -> UCI notation of best move of GameState.snapshot()"""
+    game_state = chess_engine.GameState.restore(snapshot)
+    valid_moves = game_state.get_valid_moves()
+    limits = ai.SearchLimits(depth, movetime, stop_event=stop_events[slot])
+    best_move, _, _ = ai.search(game_state, valid_moves, limits)
+    if best_move is None:
+        best_move = valid_moves[0]  # stopped before first iteration finished
+    return best_move.get_uci_notation()
+
+
+class ServerBusy(Exception):
+    pass
+
+
+class EnginePool:
+    """process pool with one stop event per search slot
+
+    at most `workers` searches run at once, each holds a slot until its worker returned.
+    Cancelling a search sets its slot's stop event, so the worker is free again at once
+    """
+
+    def __init__(self, workers, depth=ai.DEPTH, max_queued=MAX_QUEUED_SEARCHES):
+        # forking a process that runs an event loop is unsafe
+        context = get_context("spawn")
+        self.stop_events = [context.Event() for _ in range(workers)]
+        self.executor = concurrent.futures.ProcessPoolExecutor(
+            workers,
+            mp_context=context,
+            initializer=init_worker,
+            initargs=(self.stop_events,),
+        )
+        self.free_slots = asyncio.Queue()
+        for slot in range(workers):
+            self.free_slots.put_nowait(slot)
+        self.depth = depth
+        self.max_queued = max_queued
+        self.queued = 0
+
+    async def search(self, game_state, budget, on_start=None):
+        """best move of game_state in UCI notation within budget seconds
+
+        raises ServerBusy if too many requests are waiting or no slot got free in time.
+        on_start(stop) is called once the search runs, stop() makes it return early
+        """
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + budget
+        if self.queued >= self.max_queued:
+            raise ServerBusy
+
+        self.queued += 1
+        try:
+            slot = await asyncio.wait_for(self.free_slots.get(), budget)
+        except asyncio.TimeoutError:
+            raise ServerBusy
+        finally:
+            self.queued -= 1
+
+        movetime = max(deadline - loop.time(), MIN_MOVETIME)
+        future = self.executor.submit(
+            search_position, game_state.snapshot(), slot, self.depth, movetime
+        )
+        future.add_done_callback(
+            lambda _: loop.call_soon_threadsafe(self._release_slot, slot)
+        )
+        if on_start is not None:
+            on_start(lambda: self._stop(slot, future))
+        try:
+            return await asyncio.wrap_future(future)
+        except asyncio.CancelledError:
+            self._stop(slot, future)  # slot is released when the worker returned
+            raise
+
+    def _stop(self, slot, future):
+        if not future.done():  # slot of a finished search may already be reused
+            self.stop_events[slot].set()
+
+    def _release_slot(self, slot):
+        self.stop_events[slot].clear()
+        self.free_slots.put_nowait(slot)
+
+    def shutdown(self):
+        for event in self.stop_events:
+            event.set()
+        self.executor.shutdown(cancel_futures=True)
+
+
+class GameSession:
+    """game of one connection"""
+
+    def __init__(self, reader, writer, engine_pool, movetime):
+        self.reader = reader
+        self.writer = writer
+        self.engine_pool = engine_pool
+        self.default_movetime = movetime
+        self.movetime = movetime
+        self.game_state = chess_engine.GameState()
+        self.engine_color = "b"
+        self.search_task = None
+        self.stop_search = None  # set while the search runs in a worker
+
+    async def run(self):
+        try:
+            while True:
+                try:
+                    line = await self.reader.readline()
+                except (ValueError, ConnectionError):  # line too long / connection reset
+                    break
+                if not line:
+                    break  # client disconnected
+                if not await self.handle(line.decode(errors="replace")):
+                    break
+        finally:
+            self.cancel_search()
+            self.writer.close()
+
+    async def handle(self, line):
+        """handles one command line -> returns False on quit"""
+        tokens = line.split()
+        if not tokens:
+            return True
+
+        command, args = tokens[0], tokens[1:]
+        if command == "quit":
+            return False
+
+        if command == "stop":
+            if self.stop_search is not None:
+                self.stop_search()
+        elif self.search_task is not None:
+            await self.send("error engine is thinking")
+        elif command == "new":
+            await self._new_game(args)
+        elif command == "move" and args:
+            await self._make_player_move(args[0])
+        elif command == "go":
+            if await self.send_result() is None:
+                self.start_search()
+        else:
+            await self.send(f"error unknown command {command}")
+        return True
+
+    async def send(self, line):
+        self.writer.write(line.encode() + b"\n")
+        await self.writer.drain()  # slow client -> wait instead of buffering output
+
+    async def send_result(self):
+        """sends result if game is over -> result or None"""
+        result = get_result(self.game_state)
+        if result is not None:
+            await self.send(f"result {result}")
+        return result
+
+    def start_search(self):
+        self.search_task = asyncio.create_task(self._engine_move())
+
+    def cancel_search(self):
+        if self.search_task is not None:
+            self.search_task.cancel()
+
+    async def _new_game(self, args):
+        game_state = chess_engine.GameState()
+        if "fen" in args:
+            game_state = load_position(" ".join(args[args.index("fen") + 1 :]))
+            if game_state is None:
+                await self.send("error bad fen")
+                return
+
+        self.game_state = game_state
+        self.engine_color, self.movetime = "b", self.default_movetime
+        if args and args[0] in ("white", "black"):
+            self.engine_color = "b" if args[0] == "white" else "w"
+        if "movetime" in args:
+            value = args[args.index("movetime") + 1 : args.index("movetime") + 2]
+            if value and value[0].isdigit():
+                self.movetime = min(int(value[0]) / 1000, self.default_movetime)
+
+        await self.send("ok")
+        if self._is_engine_turn() and await self.send_result() is None:
+            self.start_search()
+
+    async def _make_player_move(self, uci_move):
+        move = find_uci_move(self.game_state, uci_move)
+        if move is None or self._is_engine_turn() or get_result(self.game_state):
+            await self.send("error illegal move")
+            return
+
+        self.game_state.make_move(move)
+        await self.send("ok")
+        if await self.send_result() is None:
+            self.start_search()
+
+    async def _engine_move(self):
+        try:
+            await self._search_engine_move()
+        except ConnectionError:
+            pass  # client gone while searching -> run() ends the session
+
+    async def _search_engine_move(self):
+        try:
+            uci_move = await self.engine_pool.search(
+                self.game_state, self.movetime, on_start=self._on_search_start
+            )
+        except ServerBusy:
+            await self.send("error busy")
+            return
+        finally:
+            self.search_task, self.stop_search = None, None
+
+        self.game_state.make_move(find_uci_move(self.game_state, uci_move))
+        await self.send(f"move {uci_move}")
+        await self.send_result()
+
+    def _on_search_start(self, stop_search):
+        self.stop_search = stop_search
+
+    def _is_engine_turn(self):
+        return self.game_state.white_to_move == (self.engine_color == "w")
+
+
+class GameServer:
+    def __init__(self, engine_pool, movetime=DEFAULT_MOVETIME, max_games=MAX_GAMES):
+        self.engine_pool = engine_pool
+        self.movetime = movetime
+        self.max_games = max_games
+        self.sessions = set()
+
+    async def handle_connection(self, reader, writer):
+        if len(self.sessions) >= self.max_games:
+            writer.write(b"error server full\n")
+            await writer.drain()
+            writer.close()
+            return
+
+        session = GameSession(reader, writer, self.engine_pool, self.movetime)
+        self.sessions.add(session)
+        try:
+            await session.run()
+        finally:
+            self.sessions.discard(session)
+
+    async def serve(self, host, port):
+        server = await asyncio.start_server(
+            self.handle_connection, host, port, limit=MAX_LINE_LENGTH
+        )
+        print(f"serving on {host}:{port}")
+        async with server:
+            await server.serve_forever()
+
+
+def load_position(fen):
+    """GameState of fen -> None if fen is malformed"""
+    game_state = chess_engine.GameState()
+    try:
+        game_state.load_fen(fen)
+    except (IndexError, KeyError, ValueError):
+        return None
+
+    squares = [square for row in game_state.board for square in row]
+    if (
+        len(game_state.board) != 8
+        or len(squares) != 64
+        or not set(squares) <= set(chess_engine.SQUARE_CODES)
+        or squares.count("wK") != 1
+        or squares.count("bK") != 1
+    ):
+        return None
+    return game_state
+
+
+def get_result(game_state):
+    """ "<result> <reason>" of finished game or None"""
+    if not game_state.get_valid_moves():
+        if game_state.check_mate:
+            return "0-1 checkmate" if game_state.white_to_move else "1-0 checkmate"
+        return "1/2-1/2 stalemate"
+    if game_state.is_draw_by_repetition():
+        return "1/2-1/2 repetition"
+    if game_state.is_draw_by_fifty_move_rule():
+        return "1/2-1/2 fifty-move rule"
+    return None
+
+
+async def run_server(args):
+    engine_pool = EnginePool(args.workers, args.depth, args.max_queued)
+    try:
+        server = GameServer(engine_pool, args.movetime / 1000, args.max_games)
+        await server.serve(args.host, args.port)
+    finally:
+        engine_pool.shutdown()
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--depth", type=int, default=ai.DEPTH, help="max search depth")
+    parser.add_argument("--max-games", type=int, default=MAX_GAMES)
+    parser.add_argument("--max-queued", type=int, default=MAX_QUEUED_SEARCHES)
+    parser.add_argument(
+        "--movetime", type=int, default=int(DEFAULT_MOVETIME * 1000), help="ms per move"
+    )
+    args = parser.parse_args()
+    try:
+        asyncio.run(run_server(args))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+
+    main()
@@ -0,0 +1,117 @@
+"""Trains value_net.ValueNet. Run `python train_value_net.py <command> --help` for options.
+
+1. `dataset` serializes every position of the PGN games in a directory, labelled with
+   the game result (white wins -> 1, draw -> 0, black wins -> -1)
+2. `train` fits the network on that dataset and writes the weights file, which is used
+   through chess_ai.use_value_net()
+"""
+import argparse
+import os
+
+import numpy as np
+
+import chess_engine
+import value_net
+
+# ======================
+# GLOBAL VARIABLES
+# ======================
+RESULT_VALUES = {"1-0": 1, "0-1": -1, "1/2-1/2": 0}
+VALIDATION_SPLIT = 0.1
+# ======================
+
+
+def read_positions(pgn_dir, max_games=None):
+    """yields (serialized position, result value) for every position of every game"""
+    import chess.pgn  # only needed to read the PGN files
+
+    games = 0
+    for file_name in sorted(os.listdir(pgn_dir)):
+        with open(os.path.join(pgn_dir, file_name)) as pgn:
+            while max_games is None or games < max_games:
+                game = chess.pgn.read_game(pgn)
+                if game is None:
+                    break
+
+                value = RESULT_VALUES.get(game.headers.get("Result"))
+                if value is None:
+                    continue  # unfinished game
+
+                games += 1
+                board = game.board()
+                for move in game.mainline_moves():
+                    board.push(move)
+                    game_state = chess_engine.GameState()
+                    game_state.load_fen(board.fen(en_passant="fen"))  # like make_move
+                    yield value_net.serialize(game_state), value
+
+
+def build_dataset(args):
+    planes, values = [], []
+    for position_planes, value in read_positions(args.pgn_dir, args.max_games):
+        planes.append(position_planes)
+        values.append(value)
+
+    np.savez_compressed(
+        args.dataset, planes=np.array(planes, np.uint8), values=np.array(values, np.int8)
+    )
+    print(f"{len(values)} positions -> {args.dataset}")
+
+
+def train(args):
+    with np.load(args.dataset) as dataset:
+        planes, values = dataset["planes"], dataset["values"].astype(np.float32)
+
+    order = np.random.default_rng(args.seed).permutation(len(values))
+    split = int(len(order) * (1 - VALIDATION_SPLIT))
+    train_set, validation_set = order[:split], order[split:]
+
+    net = value_net.ValueNet(seed=args.seed)
+    fit = net.fit(
+        planes[train_set],
+        values[train_set],
+        epochs=args.epochs,
+        batch_size=args.batch_size,
+        learning_rate=args.learning_rate,
+        seed=args.seed,
+    )
+    for epoch, loss in fit:
+        validation_loss = np.mean(
+            (net.predict(planes[validation_set]) - values[validation_set]) ** 2
+        )
+        print(
+            f"epoch {epoch + 1:>3} loss {loss:.4f} validation loss {validation_loss:.4f}"
+        )
+
+    net.save(args.weights)
+    print(f"weights -> {args.weights}")
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    dataset_parser = commands.add_parser("dataset", help="serialize PGN games")
+    dataset_parser.add_argument("pgn_dir")
+    dataset_parser.add_argument("dataset", help="output .npz file")
+    dataset_parser.add_argument("--max-games", type=int)
+    dataset_parser.set_defaults(run=build_dataset)
+
+    train_parser = commands.add_parser("train", help="fit value net on a dataset")
+    train_parser.add_argument("dataset")
+    train_parser.add_argument("weights", help="output .npz weights file")
+    train_parser.add_argument("--epochs", type=int, default=10)
+    train_parser.add_argument("--batch-size", type=int, default=256)
+    train_parser.add_argument("--learning-rate", type=float, default=1e-3)
+    train_parser.add_argument("--seed", type=int, default=0)
+    train_parser.set_defaults(run=train)
+
+    args = parser.parse_args()
+    args.run(args)
+
+
+if __name__ == "__main__":
+
+    main()
@@ -0,0 +1,243 @@
+"""Texel tuning of chess_ai.PIECE_SCORES and piece-square tables.
+Run `python tune.py <command> --help` for options.
+
+1. `extract` writes quiet positions of PGN games as "<fen> <result>" lines
+2. `tune` minimizes the error between game results and sigmoid(score_board) over those
+   positions with full-dataset NumPy gradients and prints the tables in chess_ai format.
+   The pawn structure terms of score_board aren't tuned, they are a fixed offset
+"""
+import argparse
+import os
+
+import numpy as np
+
+import chess_ai as ai
+import chess_engine
+
+# ======================
+# GLOBAL VARIABLES
+# ======================
+RESULTS = {"1-0": 1.0, "0-1": 0.0, "1/2-1/2": 0.5, "1.0": 1.0, "0.0": 0.0, "0.5": 0.5}
+MATERIAL_PIECES = ("Q", "R", "B", "N", "p")  # king is on the board for both sides
+# tables of pieces are shared by both colors -> tuned symmetric (row r == row 7 - r)
+TABLE_NAMES = {
+    "N": "KNIGHT_SCORES",
+    "B": "BISHOP_SCORES",
+    "Q": "QUEEN_SCORES",
+    "R": "ROOK_SCORES",
+    "p": "WHITE_PAWN_SCORES",  # BLACK_PAWN_SCORES is its mirror image
+}
+PIECE_POSITION_WEIGHT = 0.1  # score_board adds table value * 0.1
+MIRROR = np.array([(7 - square // 8) * 8 + square % 8 for square in range(64)])
+OPENING_PLIES = 8  # positions of the first moves are mostly book
+# ======================
+
+
+def extract_positions(args):
+    """quiet positions (not in check, no capture played) of PGN games with their result"""
+    import chess.pgn  # only needed to read the PGN files
+
+    count = 0
+    with open(args.positions, "w") as output:
+        for file_name in sorted(os.listdir(args.pgn_dir)):
+            with open(os.path.join(args.pgn_dir, file_name)) as pgn:
+                while True:
+                    game = chess.pgn.read_game(pgn)
+                    if game is None:
+                        break
+
+                    result = game.headers.get("Result")
+                    if result not in RESULTS:
+                        continue
+
+                    board = game.board()
+                    for ply, move in enumerate(game.mainline_moves()):
+                        is_capture = board.is_capture(move)
+                        board.push(move)
+                        if (
+                            ply >= OPENING_PLIES
+                            and not is_capture
+                            and not board.is_check()
+                        ):
+                            output.write(f"{board.fen()} {result}\n")
+                            count += 1
+    print(f"{count} positions -> {args.positions}")
+
+
+def load_positions(path):
+    """ "<fen> <result>" lines -> (boards as (N, 64) piece strings, pawn structure
+    scores (N,), results (N,))
+    """
+    boards, pawn_scores, results = [], [], []
+    game_state = chess_engine.GameState()
+    with open(path) as positions:
+        for line in positions:
+            fields = line.split()
+            if not fields:
+                continue
+
+            game_state.load_fen(" ".join(fields[:-1]))
+            boards.append([square for row in game_state.board for square in row])
+            pawn_scores.append(ai.score_pawns(game_state.board))
+            results.append(RESULTS[fields[-1].strip('";')])
+    return np.array(boards), np.array(pawn_scores), np.array(results)
+
+
+def get_table_slots(piece):
+    """square -> parameter of table (symmetric tables share rows r and 7 - r)"""
+    if piece == "p":
+        return np.arange(64)
+    return np.array(
+        [min(square // 8, 7 - square // 8) * 8 + square % 8 for square in range(64)]
+    )
+
+
+def get_slot_matrix(piece):
+    """(64 squares, 64 parameters) 0/1 matrix -> sums square features per parameter"""
+    slot_matrix = np.zeros((64, 64), np.float32)
+    slot_matrix[np.arange(64), get_table_slots(piece)] = 1
+    return slot_matrix
+
+
+def build_features(boards):
+    """linear features of score_board -> score = features @ parameters + pawn scores"""
+    columns = []
+    for piece in MATERIAL_PIECES:
+        white, black = boards == f"w{piece}", boards == f"b{piece}"
+        columns.append((white.sum(axis=1) - black.sum(axis=1))[:, None])
+
+    for piece in TABLE_NAMES:
+        white = (boards == f"w{piece}").astype(np.float32)
+        black = (boards == f"b{piece}").astype(np.float32)
+        # black piece on square uses white table value of the mirrored square
+        square_features = (white - black[:, MIRROR]) * PIECE_POSITION_WEIGHT
+        columns.append(square_features @ get_slot_matrix(piece))
+
+    return np.hstack(columns).astype(np.float32)
+
+
+def get_initial_parameters():
+    """current PIECE_SCORES and tables as parameter vector"""
+    parameters = [ai.PIECE_SCORES[piece] for piece in MATERIAL_PIECES]
+    for piece, name in TABLE_NAMES.items():
+        table = np.array(getattr(ai, name), np.float64).ravel()
+        if piece != "p":  # mean of the two squares sharing a parameter
+            table = table @ get_slot_matrix(piece) / 2
+        parameters.extend(table)
+    return np.array(parameters, np.float64)
+
+
+def sigmoid(scores, k):
+    """expected result for white from score in pawns"""
+    return 1 / (1 + 10 ** (-k * scores / 4))
+
+
+def mean_squared_error(features, offsets, results, parameters, k):
+    scores = features @ parameters + offsets
+    return float(np.mean((results - sigmoid(scores, k)) ** 2))
+
+
+def find_scaling_constant(features, offsets, results, parameters):
+    """k minimizing error of current parameters -> fixed while tuning"""
+    candidates = np.linspace(0.05, 3, 60)
+    errors = [
+        mean_squared_error(features, offsets, results, parameters, k) for k in candidates
+    ]
+    return float(candidates[int(np.argmin(errors))])
+
+
+def tune(features, offsets, results, parameters, k, iterations, learning_rate):
+    """Adam on full-dataset gradients -> yields (iteration, error, parameters)
+
+    offsets are untuned score terms (pawn structure) added to every position's score
+    """
+    first_moment, second_moment = np.zeros_like(parameters), np.zeros_like(parameters)
+    beta1, beta2, epsilon = 0.9, 0.999, 1e-8
+    for iteration in range(1, iterations + 1):
+        expected = sigmoid(features @ parameters + offsets, k)
+        # d error / d score for every position at once
+        score_gradient = (
+            -2 * (results - expected) * expected * (1 - expected) * k * np.log(10) / 4
+        )
+        gradient = features.T @ score_gradient / len(results)
+        first_moment = beta1 * first_moment + (1 - beta1) * gradient
+        second_moment = beta2 * second_moment + (1 - beta2) * gradient**2
+        m_hat = first_moment / (1 - beta1**iteration)
+        v_hat = second_moment / (1 - beta2**iteration)
+        parameters = parameters - learning_rate * m_hat / (np.sqrt(v_hat) + epsilon)
+        yield iteration, float(np.mean((results - expected) ** 2)), parameters
+
+
+def format_tables(parameters):
+    """chess_ai source of tuned PIECE_SCORES and tables"""
+    piece_scores = {"K": 0}
+    piece_scores.update(
+        {
+            piece: round(float(score), 1)
+            for piece, score in zip(MATERIAL_PIECES, parameters)
+        }
+    )
+    piece_scores["--"] = None
+    lines = [f"PIECE_SCORES = {piece_scores!r}".replace("'", '"'), ""]
+
+    offset = len(MATERIAL_PIECES)
+    for piece, name in TABLE_NAMES.items():
+        table = np.rint(parameters[offset + get_table_slots(piece)]).astype(int)
+        offset += 64
+        tables = [(name, table)]
+        if piece == "p":
+            tables.append(("BLACK_PAWN_SCORES", table[MIRROR]))
+        for table_name, values in tables:
+            lines.append(f"{table_name} = [  # tuned with tune.py")
+            for row in values.reshape(8, 8):
+                lines.append(f"    [{', '.join(str(value) for value in row)}],")
+            lines.extend(["]", ""])
+
+    return "\n".join(lines)
+
+
+def run_tuning(args):
+    boards, pawn_scores, results = load_positions(args.positions)
+    features = build_features(boards)
+    parameters = get_initial_parameters()
+    k = args.k or find_scaling_constant(features, pawn_scores, results, parameters)
+    print(f"{len(results)} positions, k {k:.2f}")
+    error = mean_squared_error(features, pawn_scores, results, parameters, k)
+    print(f"initial error {error:.5f}")
+
+    for iteration, error, parameters in tune(
+        features, pawn_scores, results, parameters, k, args.iterations, args.learning_rate
+    ):
+        if iteration % 100 == 0:
+            print(f"iteration {iteration:>5} error {error:.5f}")
+
+    error = mean_squared_error(features, pawn_scores, results, parameters, k)
+    print(f"final error {error:.5f}\n")
+    print(format_tables(parameters))
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    extract_parser = commands.add_parser("extract", help="quiet positions of PGN games")
+    extract_parser.add_argument("pgn_dir")
+    extract_parser.add_argument("positions", help="output file of <fen> <result> lines")
+    extract_parser.set_defaults(run=extract_positions)
+
+    tune_parser = commands.add_parser("tune", help="tune tables on labelled positions")
+    tune_parser.add_argument("positions", help="file of <fen> <result> lines")
+    tune_parser.add_argument("--iterations", type=int, default=1000)
+    tune_parser.add_argument("--learning-rate", type=float, default=0.05)
+    tune_parser.add_argument("--k", type=float, help="sigmoid scaling (default: fitted)")
+    tune_parser.set_defaults(run=run_tuning)
+
+    args = parser.parse_args()
+    args.run(args)
+
+
+if __name__ == "__main__":
+
+    main()
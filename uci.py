@@ -0,0 +1,276 @@
+"""UCI front end. Reads commands from stdin and runs chess_ai searches in a background thread,
+so "stop" and "isready" are answered while the engine is thinking."""
+import os
+import sys
+import threading
+
+import chess_ai as ai
+import chess_engine
+import mcts
+
+# ======================
+# GLOBAL VARIABLES
+# ======================
+ENGINE_NAME = "Toy Chess Engine"
+ENGINE_AUTHOR = "josergavila"
+MAX_MULTI_PV = 64
+GO_FLAGS = ("infinite", "ponder")
+GO_PARAMETERS = (  # followed by an integer
+    "wtime",
+    "btime",
+    "winc",
+    "binc",
+    "movestogo",
+    "depth",
+    "nodes",
+    "mate",
+    "movetime",
+)
+# ======================
+
+
+class UciEngine:
+    def __init__(self, output=None):
+        self.output = output or sys.stdout
+        self.output_lock = threading.Lock()
+        self.game_state = chess_engine.GameState()
+        self.stop_event = threading.Event()
+        self.ponder_event = None
+        self.search_thread = None
+        self.multi_pv = 1  # lines reported by alpha-beta searches
+
+    def send(self, line):
+        with self.output_lock:
+            self.output.write(line + "\n")
+            self.output.flush()
+
+    def handle(self, line):
+        """handles one command line -> returns False on quit"""
+        tokens = line.split()
+        if not tokens:
+            return True
+
+        command, args = tokens[0], tokens[1:]
+        if command == "uci":
+            self.send(f"id name {ENGINE_NAME}")
+            self.send(f"id author {ENGINE_AUTHOR}")
+            self.send("option name Ponder type check default true")
+            self.send("option name EvalFile type string default <empty>")
+            self.send(
+                "option name EngineMode type combo default alpha_beta "
+                "var alpha_beta var mcts"
+            )
+            self.send(
+                f"option name Threads type spin default 1 min 1 max {os.cpu_count()}"
+            )
+            self.send(f"option name MultiPV type spin default 1 min 1 max {MAX_MULTI_PV}")
+            self.send("uciok")
+        elif command == "isready":
+            self.send("readyok")
+        elif command == "setoption":
+            self.stop()
+            self._set_option(args)
+        elif command == "ucinewgame":
+            self.stop()
+            self.game_state = chess_engine.GameState()
+            ai.transposition_table.clear()
+        elif command == "position":
+            self.stop()
+            self._set_position(args)
+        elif command == "go":
+            self.stop()
+            self._go(args)
+        elif command == "ponderhit":
+            if self.ponder_event is not None:
+                self.ponder_event.set()  # search keeps running, now with time limits
+        elif command == "stop":
+            self.stop()
+        elif command == "quit":
+            self.stop()
+            return False
+
+        return True
+
+    def stop(self):
+        """interrupts running search and waits for its bestmove"""
+        if self.search_thread is not None:
+            self.stop_event.set()
+            self.search_thread.join()
+            self.search_thread = None
+
+    def _set_option(self, args):
+        """setoption name <name> value <value>"""
+        if "name" not in args:
+            return
+        value_index = args.index("value") if "value" in args else len(args)
+        name = " ".join(args[args.index("name") + 1 : value_index])
+        value = " ".join(args[value_index + 1 :])
+        if name == "EvalFile":  # value net weights file -> empty uses score_board
+            if value and value != "<empty>":
+                ai.use_value_net(value)
+            else:
+                ai.use_score_board()
+        elif name == "EngineMode" and value in ("alpha_beta", "mcts"):
+            ai.ENGINE_MODE = value
+        elif name == "Threads" and value.isdigit():  # mcts worker processes
+            mcts.WORKERS = max(int(value), 1)
+        elif name == "MultiPV" and value.isdigit():
+            self.multi_pv = min(max(int(value), 1), MAX_MULTI_PV)
+
+    def _set_position(self, args):
+        game_state = chess_engine.GameState()
+        if args and args[0] == "fen":
+            fen_end = args.index("moves") if "moves" in args else len(args)
+            game_state.load_fen(" ".join(args[1:fen_end]))
+
+        if "moves" in args:
+            for uci_move in args[args.index("moves") + 1 :]:
+                move = find_uci_move(game_state, uci_move)
+                if move is None:
+                    break  # illegal move -> keep position reached so far
+                game_state.make_move(move)
+
+        self.game_state = game_state
+
+    def _go(self, args):
+        limits = parse_go(
+            args, self.game_state.white_to_move, len(self.game_state.move_log) // 2
+        )
+        self.stop_event.clear()
+        limits.stop_event = self.stop_event
+        self.ponder_event = threading.Event() if "ponder" in args else None
+        limits.ponder_event = self.ponder_event
+        valid_moves = get_search_moves(
+            args, self.game_state, self.game_state.get_valid_moves()
+        )
+        self.search_thread = threading.Thread(
+            target=self._search, args=(valid_moves, limits), daemon=True
+        )
+        self.search_thread.start()
+
+    def _search(self, valid_moves, limits):
+        if self.multi_pv > 1 and ai.ENGINE_MODE == "alpha_beta":
+            lines = ai.search_multi_pv(
+                self.game_state, valid_moves, limits, self.multi_pv, self._send_lines
+            )
+            best_move, _, pv = lines[0] if lines else (None, 0, [])
+        else:
+            search_function = ai.get_search_function()
+            best_move, _, pv = search_function(
+                self.game_state, valid_moves, limits, info_callback=self._send_info
+            )
+        if best_move is None and valid_moves:
+            best_move = valid_moves[0]  # stopped before first iteration finished
+        # bestmove must not be sent while pondering, even if search finished early
+        while limits.is_pondering() and not self.stop_event.wait(0.001):
+            pass
+
+        if ai.ENGINE_MODE == "alpha_beta":  # counted per search by chess_ai.search
+            eval_hit_rate, pawn_hit_rate = ai.get_cache_hit_rates()
+            self.send(
+                f"info string eval cache hits {eval_hit_rate:.0%} "
+                f"pawn hash hits {pawn_hit_rate:.0%}"
+            )
+        bestmove = f"bestmove {best_move.get_uci_notation() if best_move else '0000'}"
+        if len(pv) > 1:
+            bestmove += f" ponder {pv[1].get_uci_notation()}"
+        self.send(bestmove)
+
+    def _send_info(self, depth, score, nodes, elapsed, pv, line=None):
+        nps = int(nodes / elapsed) if elapsed > 0 else 0
+        pv_string = " ".join(move.get_uci_notation() for move in pv)
+        multi_pv = f" multipv {line}" if line is not None else ""
+        self.send(
+            f"info depth {depth}{multi_pv} score {format_score(score, len(pv))} "
+            f"nodes {nodes} nps {nps} time {int(elapsed * 1000)} pv {pv_string}"
+        )
+
+    def _send_lines(self, depth, lines, nodes, elapsed):
+        """search_multi_pv() info_callback"""
+        for line, (_, score, pv) in enumerate(lines, 1):
+            self._send_info(depth, score, nodes, elapsed, pv, line)
+
+
+def find_uci_move(game_state, uci_move):
+    """returns valid Move matching long algebraic notation (e.g. "e2e4", "e7e8q")"""
+    if len(uci_move) not in (4, 5):
+        return None
+
+    squares = []
+    for file, rank in (uci_move[0:2], uci_move[2:4]):
+        if (
+            file not in chess_engine.Move.files_to_cols
+            or rank not in chess_engine.Move.ranks_to_rows
+        ):
+            return None
+        squares.append(
+            (chess_engine.Move.ranks_to_rows[rank], chess_engine.Move.files_to_cols[file])
+        )
+    move = game_state.get_valid_moves(indexed=True).find(*squares)
+    if len(uci_move) == 5 and (
+        uci_move[4] != "q" or move is None or not move.is_pawn_promotion
+    ):
+        return None  # engine only promotes to a queen -> underpromotions are illegal
+    return move
+
+
+def format_score(score, pv_length):
+    if abs(score) >= ai.CHECKMATE:
+        mate_in = (pv_length + 1) // 2
+        return f"mate {mate_in if score > 0 else -mate_in}"
+    return f"cp {int(score * 100)}"  # scores are in pawns
+
+
+def parse_go(args, white_to_move, moves_played=0):
+    """maps "go" arguments onto chess_ai.SearchLimits (clock -> chess_ai.TimeManager)"""
+    params, i = {}, 0
+    while i < len(args):
+        value = args[i + 1] if i + 1 < len(args) else ""
+        if args[i] in GO_FLAGS:
+            params[args[i]] = True
+        elif args[i] in GO_PARAMETERS and value.lstrip("-").isdigit():
+            params[args[i]] = int(value)  # clock times can be negative
+            i += 1
+        i += 1  # searchmoves (see get_search_moves) and unknown tokens are skipped
+
+    limits = ai.SearchLimits(depth=params.get("depth", ai.MAX_DEPTH))
+    if "movetime" in params:
+        limits.movetime = max(params["movetime"] / 1000 - ai.MOVE_OVERHEAD, 0.001)
+    elif not params.get("infinite"):
+        time_left = params.get("wtime" if white_to_move else "btime")
+        increment = params.get("winc" if white_to_move else "binc", 0)
+        if time_left is not None:
+            limits.time_manager = ai.TimeManager(
+                time_left / 1000, increment / 1000, moves_played, params.get("movestogo")
+            )
+            limits.movetime = limits.time_manager.hard_limit
+
+    return limits
+
+
+def get_search_moves(args, game_state, valid_moves):
+    """root moves of "go searchmoves <moves>" -> valid_moves if none are given/legal"""
+    if "searchmoves" not in args:
+        return valid_moves
+
+    search_moves = []
+    for uci_move in args[args.index("searchmoves") + 1 :]:
+        if uci_move in GO_FLAGS or uci_move in GO_PARAMETERS:
+            break
+        move = find_uci_move(game_state, uci_move)
+        if move is not None and move not in search_moves:
+            search_moves.append(move)
+    return search_moves or valid_moves
+
+
+def main():
+    engine = UciEngine()
+    for line in sys.stdin:
+        if not engine.handle(line):
+            break
+    engine.stop()
+
+
+if __name__ == "__main__":
+
+    main()
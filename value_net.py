@@ -0,0 +1,165 @@
+"""Small value network in pure NumPy. Scores serialized positions (5x8x8 planes, see
+old/state.py) with the expected game result from white's perspective."""
+import numpy as np
+
+# ======================
+# GLOBAL VARIABLES
+# ======================
+# black pieces 1-6, white pieces 9-14 (bit 3 -> color)
+PIECE_CODES = {
+    "bp": 1,
+    "bN": 2,
+    "bB": 3,
+    "bR": 4,
+    "bQ": 5,
+    "bK": 6,
+    "wp": 9,
+    "wN": 10,
+    "wB": 11,
+    "wR": 12,
+    "wQ": 13,
+    "wK": 14,
+    "--": 0,
+}
+CASTLING_ROOK_CODE = 7  # rook that can still castle (+8 for white)
+EN_PASSANT_CODE = 8
+INPUT_SIZE = 5 * 8 * 8
+LAYER_SIZES = (INPUT_SIZE, 128, 32, 1)
+WEIGHTS_FORMAT_VERSION = 1
+# ======================
+
+
+def serialize(game_state):
+    """5x8x8 uint8 planes: 4 bit planes of piece codes + side to move
+
+    squares are ordered a1..h8 like python-chess, so planes match old/state.py
+    """
+    board_state = np.array(
+        [PIECE_CODES[square] for row in reversed(game_state.board) for square in row],
+        np.uint8,
+    )
+
+    castle_rights = game_state.current_castling_rights
+    for has_right, square, color_code in (
+        (castle_rights.white_queen_side, 0, 8),
+        (castle_rights.white_king_side, 7, 8),
+        (castle_rights.black_queen_side, 56, 0),
+        (castle_rights.black_king_side, 63, 0),
+    ):
+        if has_right and board_state[square] == PIECE_CODES["bR"] + color_code:
+            board_state[square] = CASTLING_ROOK_CODE + color_code
+
+    if game_state.en_passant_possible_move:
+        row, col = game_state.en_passant_possible_move
+        board_state[(7 - row) * 8 + col] = EN_PASSANT_CODE
+
+    return planes_from_board_state(board_state, game_state.white_to_move)
+
+
+def planes_from_board_state(board_state, white_to_move):
+    board_state = board_state.reshape(8, 8)
+    state = np.zeros((5, 8, 8), np.uint8)
+    state[0] = (board_state >> 3) & 1
+    state[1] = (board_state >> 2) & 1
+    state[2] = (board_state >> 1) & 1
+    state[3] = (board_state >> 0) & 1
+    state[4] = white_to_move  # who's turn it is
+    return state
+
+
+class ValueNet:
+    """MLP with ReLU hidden layers and tanh output in [-1, 1] (white wins -> 1)"""
+
+    def __init__(self, layer_sizes=LAYER_SIZES, seed=0):
+        rng = np.random.default_rng(seed)
+        self.weights, self.biases = [], []
+        for fan_in, fan_out in zip(layer_sizes[:-1], layer_sizes[1:]):
+            scale = np.sqrt(2 / fan_in)  # He initialization
+            self.weights.append(
+                (rng.standard_normal((fan_in, fan_out)) * scale).astype(np.float32)
+            )
+            self.biases.append(np.zeros(fan_out, np.float32))
+
+    # ==============================================================
+    # inference
+    # ==============================================================
+
+    def predict(self, planes):
+        """batched inference -> planes (N, 5, 8, 8) uint8, returns (N,) float32"""
+        x = np.asarray(planes, np.float32).reshape(len(planes), -1)
+        for weights, bias in zip(self.weights[:-1], self.biases[:-1]):
+            x = np.maximum(x @ weights + bias, 0)
+        return np.tanh(x @ self.weights[-1] + self.biases[-1])[:, 0]
+
+    # ==============================================================
+    # training
+    # ==============================================================
+
+    def fit(self, planes, values, epochs=10, batch_size=256, learning_rate=1e-3, seed=0):
+        """Adam on mean squared error -> yields (epoch, mean loss) after every epoch"""
+        rng = np.random.default_rng(seed)
+        x_all = np.asarray(planes, np.float32).reshape(len(planes), -1)
+        y_all = np.asarray(values, np.float32)
+        parameters = [*self.weights, *self.biases]
+        first_moments = [np.zeros_like(p) for p in parameters]
+        second_moments = [np.zeros_like(p) for p in parameters]
+        beta1, beta2, epsilon, step = 0.9, 0.999, 1e-8, 0
+        for epoch in range(epochs):
+            order, losses = rng.permutation(len(x_all)), []
+            for start in range(0, len(order), batch_size):
+                batch = order[start : start + batch_size]
+                loss, gradients = self._backward(x_all[batch], y_all[batch])
+                losses.append(loss)
+                step += 1
+                for i, (parameter, gradient) in enumerate(zip(parameters, gradients)):
+                    first_moments[i] = beta1 * first_moments[i] + (1 - beta1) * gradient
+                    second_moments[i] = (
+                        beta2 * second_moments[i] + (1 - beta2) * gradient**2
+                    )
+                    m_hat = first_moments[i] / (1 - beta1**step)
+                    v_hat = second_moments[i] / (1 - beta2**step)
+                    parameter -= learning_rate * m_hat / (np.sqrt(v_hat) + epsilon)
+            yield epoch, float(np.mean(losses))
+
+    def _backward(self, x, y):
+        """loss and gradients (weights first, then biases) of one batch"""
+        activations = [x]
+        for weights, bias in zip(self.weights[:-1], self.biases[:-1]):
+            activations.append(np.maximum(activations[-1] @ weights + bias, 0))
+        output = np.tanh(activations[-1] @ self.weights[-1] + self.biases[-1])[:, 0]
+
+        error = output - y
+        delta = (2 * error / len(y) * (1 - output**2))[:, None]
+        weight_gradients, bias_gradients = [], []
+        for layer in reversed(range(len(self.weights))):
+            weight_gradients.insert(0, activations[layer].T @ delta)
+            bias_gradients.insert(0, delta.sum(axis=0))
+            if layer:
+                delta = (delta @ self.weights[layer].T) * (activations[layer] > 0)
+
+        return float(np.mean(error**2)), [*weight_gradients, *bias_gradients]
+
+    # ==============================================================
+    # weights file -> float16 arrays in a compressed npz
+    # ==============================================================
+
+    def save(self, path):
+        arrays = {"version": np.array(WEIGHTS_FORMAT_VERSION)}
+        for i, (weights, bias) in enumerate(zip(self.weights, self.biases)):
+            arrays[f"w{i}"] = weights.astype(np.float16)
+            arrays[f"b{i}"] = bias.astype(np.float16)
+        np.savez_compressed(path, **arrays)
+
+    @staticmethod
+    def load(path):
+        with np.load(path) as arrays:
+            if int(arrays["version"]) != WEIGHTS_FORMAT_VERSION:
+                raise ValueError(
+                    f"unsupported weights file version: {int(arrays['version'])}"
+                )
+
+            layer_count = sum(1 for name in arrays.files if name.startswith("w"))
+            net = ValueNet.__new__(ValueNet)
+            net.weights = [arrays[f"w{i}"].astype(np.float32) for i in range(layer_count)]
+            net.biases = [arrays[f"b{i}"].astype(np.float32) for i in range(layer_count)]
+        return net